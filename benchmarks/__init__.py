@@ -0,0 +1,5 @@
+"""Micro-benchmarks for performance critical paths.
+
+Each module can be run from the repository root, e.g.
+``python -m benchmarks.packing``.
+"""
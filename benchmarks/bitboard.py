@@ -0,0 +1,89 @@
+"""Compare searches on bitboards against corso's object model.
+
+The same MinMax searches, with fresh transposition tables, are run on
+random midgame positions with both representations, and nodes per
+second are reported. Scores must match.
+
+Run with ``python -m benchmarks.bitboard``.
+"""
+import argparse
+import logging
+import random
+import time
+
+import corso.model as corso
+
+from corsoab import bitboard
+from corsoab import search
+from corsoab.log import logger
+
+
+def random_positions(count: int, seed=0) -> list[corso.Corso]:
+    """Build non terminal positions, by playing random moves."""
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        state = corso.Corso()
+        for _ in range(rng.randrange(4, 14)):
+            state = state.step(rng.choice(state.actions))
+        if not state.terminal[0]:
+            positions.append(state)
+
+    return positions
+
+
+def run_searches(positions, depth: int, bitboards: bool):
+    """Search all positions, return scores, nodes and elapsed time."""
+    scores = []
+    nodes = 0
+    start = time.perf_counter()
+    for state in positions:
+        player = search.CachedMinMaxPlayer(depth, bitboards=bitboards)
+        scores.append(player.score_actions(state))
+        nodes += player.nodes
+        search.drop_table(player.table_name)
+
+    return scores, nodes, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser('python -m benchmarks.bitboard',
+                                     description=__doc__)
+    parser.add_argument('-n', '--number', type=int, default=20,
+                        help='Number of searched positions.')
+    parser.add_argument('-d', '--depth', type=int, default=3,
+                        help='Search depth.')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help='Seed of the random positions.')
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    positions = random_positions(args.number, args.seed)
+
+    # Raw primitives: move generation and step over the same positions
+    boards = list(map(bitboard.Bitboard.from_corso, positions))
+    for name, states in (('corso', positions), ('bitboard', boards)):
+        start = time.perf_counter()
+        steps = 0
+        for state in states:
+            for action in state.actions:
+                state.step(action).terminal
+                steps += 1
+        seconds = time.perf_counter() - start
+        print(f'{name:>10}: {steps / seconds:12.0f} steps/s')
+
+    reference = None
+    for name, bitboards in (('corso', False), ('bitboard', True)):
+        scores, nodes, seconds = run_searches(positions, args.depth,
+                                              bitboards)
+
+        if reference is None:
+            reference = scores
+        status = 'ok' if scores == reference else 'MISMATCH'
+
+        print(f'{name:>10}: {nodes / seconds:12.0f} nodes/s '
+              f'({nodes} nodes, {seconds:.2f}s) [{status}]')
+
+
+if __name__ == '__main__':
+    main()
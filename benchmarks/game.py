@@ -0,0 +1,233 @@
+"""Play scripted games headlessly, measure rendering costs.
+
+Random games are played through the actual game world (see
+:class:`corsoab.game.GameHandler`), rendered to an emulated display
+(see :mod:`corsoab.headless`) with no frame cap. Compositing, packing
+and flushing times, frames per second and bytes sent per rendered
+frame are reported for each available packing implementation, and for
+native sprites (see :mod:`corsoab.sprites`, nothing to pack).
+
+The emulated display content is compared with the game screen at the
+end of each game, and across implementations. The process exits with
+an error on mismatch.
+
+Run with ``python -m benchmarks.game``.
+"""
+import argparse
+import logging
+import pathlib
+import random
+import statistics
+import sys
+import time
+from functools import partial
+
+import corso.model as corso
+import desper
+import sdl2
+
+import corsoab
+from corsoab import graphics
+from corsoab import headless
+from corsoab import sprites
+from corsoab import ssd1306
+from corsoab.log import logger
+
+RESOURCES_PATH = pathlib.Path(corsoab.__file__).absolute().parents[1] \
+    / 'resources'
+
+
+def random_game(seed: int) -> list[corso.Action]:
+    """Play a random game, return its actions."""
+    player = corso.RandomPlayer(random.Random(seed))
+    state = corso.Corso()
+    actions = []
+
+    while not state.terminal[0]:
+        action = player.select_action(state)
+        actions.append(action)
+        state = state.step(action)
+
+    return actions
+
+
+class TimedRenderLoopProcessor(graphics.DirtyRenderLoopProcessor):
+    """Measure compositing time of each rendered frame."""
+
+    def __init__(self, update_event: str = 'update_screen_surface'):
+        super().__init__(update_event)
+        self.composition_times = []
+
+    def process(self, dt):
+        if not self._dirty:
+            return
+
+        start = time.perf_counter()
+        self.world.dispatch(self.update_event)
+        self.composition_times.append(time.perf_counter() - start)
+
+        self.world.dispatch('render')
+        self._dirty = False
+
+
+class TimedRenderHandler(ssd1306.RenderHandler):
+    """Measure packing and flushing times, force an implementation.
+
+    If ``use_numpy`` is ``None``, the display buffer is supposed to be
+    composed in place (see :class:`sprites.DisplayCompositor`).
+    """
+
+    def __init__(self, display, use_numpy: bool | None):
+        super().__init__(display)
+        self.use_numpy = use_numpy
+        self.pack_times = []
+        self.flush_times = []
+        self.flush_bytes = []
+
+    def pack(self, surface, rect):
+        if self.use_numpy is None:
+            return
+
+        start = time.perf_counter()
+        _, y, _, height = rect
+        ssd1306.fill_display(
+            self.display, surface, first_page=y // ssd1306.PAGE_HEIGHT,
+            last_page=(y + height - 1) // ssd1306.PAGE_HEIGHT,
+            use_numpy=self.use_numpy)
+        self.pack_times.append(time.perf_counter() - start)
+
+    def flush(self):
+        start = time.perf_counter()
+        bytes_sent = super().flush()
+        self.flush_times.append(time.perf_counter() - start)
+        self.flush_bytes.append(bytes_sent)
+        return bytes_sent
+
+
+def benchmark_world_transformer(handle: desper.WorldHandle,
+                                world: desper.World,
+                                render_handler: TimedRenderHandler):
+    """Headless world, timed and uncapped."""
+    world.get_processor(graphics.TimeProcessor).interval = 0
+    if render_handler.use_numpy is None:
+        world.add_processor(TimedRenderLoopProcessor('update_framebuffer'))
+        world.create_entity(sprites.DisplayCompositor(render_handler.display))
+    else:
+        world.add_processor(TimedRenderLoopProcessor())
+    world.create_entity(render_handler)
+    world.create_entity(headless.QuitOnGameOver())
+
+    world.dispatch('on_dirty_render')
+
+
+def run_game(actions: list[corso.Action], use_numpy: bool | None) -> dict:
+    """Play a scripted game, return measurements."""
+    display = headless.FakeSSD1306()
+    render_handler = TimedRenderHandler(display, use_numpy)
+    players = (headless.ScriptedPlayer(actions[::2]),
+               headless.ScriptedPlayer(actions[1::2]))
+
+    handle = desper.WorldHandle()
+    handle.transform_functions.append(
+        partial(corsoab.base_game_world_transformer, players=players))
+    handle.transform_functions.append(
+        partial(benchmark_world_transformer, render_handler=render_handler))
+
+    desper.default_loop.switch(handle)
+    world = handle()
+    world.dispatch_enabled = True
+
+    frames = 0
+    start = time.perf_counter()
+    try:
+        while True:
+            world.process(0)
+            frames += 1
+    except desper.Quit:
+        pass
+    elapsed = time.perf_counter() - start
+
+    synced = display.synced
+    if use_numpy is not None:
+        screen_entity, _ = world.get(graphics.ScreenSurface)[0]
+        reference = headless.FakeSSD1306()
+        ssd1306.fill_display(reference, world.get_component(
+            screen_entity, graphics.LP_SDL_Surface))
+        synced &= display.gram == reference.buffer[1:]
+    handle.clear()
+
+    return {
+        'frames': frames,
+        'elapsed': elapsed,
+        'composition': world.get_processor(
+            TimedRenderLoopProcessor).composition_times,
+        'pack': render_handler.pack_times,
+        'flush': render_handler.flush_times,
+        'bytes': render_handler.flush_bytes,
+        'synced': synced,
+        'frame': bytes(display.gram),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser('python -m benchmarks.game',
+                                     description=__doc__)
+    parser.add_argument('-g', '--games', type=int, default=10,
+                        help='Number of games per implementation.')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help='Seed of the first random game.')
+    args = parser.parse_args()
+
+    # Per frame and per game logging would dominate timings and output
+    logger.setLevel(logging.WARNING)
+
+    sdl2.SDL_Init(0)
+    populator = desper.DirectoryResourcePopulator(RESOURCES_PATH,
+                                                  trim_extensions=True)
+    populator.add_rule('sprites', graphics.SurfaceHandle)
+    populator(desper.resource_map)
+
+    games = [random_game(args.seed + index) for index in range(args.games)]
+
+    implementations = {'bytes': False}
+    if ssd1306.numpy_available():
+        implementations['numpy'] = True
+    implementations['native'] = None
+
+    failed = False
+    reference_frames = None
+    for name, use_numpy in implementations.items():
+        results = [run_game(actions, use_numpy) for actions in games]
+
+        frames = [result['frame'] for result in results]
+        if reference_frames is None:
+            reference_frames = frames
+        for result, reference_frame in zip(results, reference_frames):
+            result['synced'] &= result['frame'] == reference_frame
+
+        frames = sum(result['frames'] for result in results)
+        elapsed = sum(result['elapsed'] for result in results)
+        measures = {key: [value for result in results
+                          for value in result[key]]
+                    for key in ('composition', 'pack', 'flush', 'bytes')}
+        synced = all(result['synced'] for result in results)
+        failed |= not synced
+
+        print(f'{name}: {frames} frames, {len(measures["flush"])} rendered, '
+              f'{frames / elapsed:.0f} fps '
+              f'[{"ok" if synced else "MISMATCH"}]')
+        for key in ('composition', 'pack', 'flush'):
+            if not measures[key]:
+                continue
+            print(f'  {key:>12}: '
+                  f'{statistics.mean(measures[key]) * 1e3:7.3f} ms/frame '
+                  f'(max {max(measures[key]) * 1e3:.3f} ms)')
+        print(f'  {"bytes":>12}: {statistics.mean(measures["bytes"]):7.1f} '
+              f'bytes/frame ({sum(measures["bytes"])} total)')
+
+    sdl2.SDL_Quit()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
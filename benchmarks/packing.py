@@ -0,0 +1,93 @@
+"""Compare SSD1306 page packing against the original pixel loop.
+
+Run with ``python -m benchmarks.packing``.
+"""
+import argparse
+import ctypes
+import random
+import timeit
+
+import sdl2
+
+from corsoab import graphics
+from corsoab import ssd1306
+
+
+class FakeDisplay:
+    """Minimal in-memory stand-in for adafruit's I2C SSD1306 driver.
+
+    Mimics the buffer layout (one leading control byte) and the
+    ``pixel`` method of the framebuffer (MVLSB format).
+    """
+
+    def __init__(self, width=graphics.BONNET_WIDTH,
+                 height=graphics.BONNET_HEIGHT):
+        self.width = width
+        self.height = height
+        self.buffer = bytearray(width * height // 8 + 1)
+        self.buffer[0] = 0x40
+        self._framebuffer = memoryview(self.buffer)[1:]
+
+    def pixel(self, x, y, color):
+        index = (y >> 3) * self.width + x
+        offset = y & 0x07
+        self._framebuffer[index] = (
+            (self._framebuffer[index] & ~(0x01 << offset) & 0xFF)
+            | ((color != 0) << offset))
+
+
+def pixel_loop_fill_display(display, surface):
+    """Original ``bonnet.fill_display`` implementation, for reference."""
+    pixels = ctypes.cast(surface.contents.pixels,
+                         ctypes.POINTER(ctypes.c_uint8))
+    for y in range(graphics.BONNET_HEIGHT):
+        for x in range(graphics.BONNET_WIDTH):
+            display.pixel(x, y, pixels[128 * y + x] & 1)
+
+
+def random_screen_surface(seed=0) -> graphics.LP_SDL_Surface:
+    """Build a screen sized surface filled with random pixels."""
+    surface = sdl2.SDL_CreateRGBSurfaceWithFormat(
+        0, graphics.BONNET_WIDTH, graphics.BONNET_HEIGHT, 1,
+        sdl2.SDL_PIXELFORMAT_RGB332)
+    rng = random.Random(seed)
+    view = ssd1306.surface_view(surface)
+    view[:] = bytes(rng.choice((0x00, 0xFF)) for _ in range(len(view)))
+
+    return surface
+
+
+def main():
+    parser = argparse.ArgumentParser('python -m benchmarks.packing',
+                                     description=__doc__)
+    parser.add_argument('-n', '--number', type=int, default=100,
+                        help='Number of packed frames per implementation.')
+    args = parser.parse_args()
+
+    surface = random_screen_surface()
+
+    candidates = {'pixel loop': pixel_loop_fill_display,
+                  'bytes': lambda d, s: ssd1306.fill_display(
+                      d, s, use_numpy=False)}
+    if ssd1306.numpy_available():
+        candidates['numpy'] = lambda d, s: ssd1306.fill_display(
+            d, s, use_numpy=True)
+
+    reference = None
+    for name, fill in candidates.items():
+        display = FakeDisplay()
+        seconds = timeit.timeit(lambda: fill(display, surface),
+                                number=args.number)
+
+        if reference is None:
+            reference = display.buffer
+        status = 'ok' if display.buffer == reference else 'MISMATCH'
+
+        print(f'{name:>12}: {seconds / args.number * 1e3:9.3f} ms/frame '
+              f'[{status}]')
+
+    sdl2.SDL_FreeSurface(surface)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,6 @@
+# Imported first, to measure startup from here (see --startup-profile)
+from . import startup
+
 import pathlib
 from typing import Collection
 from functools import partial
@@ -7,13 +10,12 @@ import corso.model as corso
 import sdl2
 
 from . import graphics
+from . import bonnet
 from . import desktop
 from . import game
-
-try:
-    from . import bonnet
-except Exception:
-    pass
+from . import record
+from . import transport
+from . import workers
 
 window = None
 
@@ -23,18 +25,36 @@ LAYOUT_START_Y = 0
 LAYOUT_X_CELL_OFFSET = 1
 LAYOUT_Y_CELL_OFFSET = 1
 
+# Draw layers (see graphics.Sprite)
+BOARD_LAYER = 0
+CURSOR_LAYER = 1
+
 
 def base_game_world_transformer(handle: desper.WorldHandle,
                                 world: desper.World,
-                                players: Collection[game.GUIPlayer]):
-    """Instantiate game world basics (common to all platforms)."""
+                                players: Collection[game.GUIPlayer],
+                                adaptive_scheduler: bool = False,
+                                idle_interval: float | None = None):
+    """Instantiate game world basics (common to all platforms).
+
+    If ``adaptive_scheduler`` is set, frames are scheduled by a
+    :class:`graphics.AdaptiveTimeProcessor` with the given
+    ``idle_interval``.
+    """
     world.add_processor(desper.CoroutineProcessor())
-    world.add_processor(graphics.TimeProcessor())
+    world.add_processor(game.CompletionProcessor())
+    if adaptive_scheduler:
+        world.add_processor(graphics.AdaptiveTimeProcessor(
+            idle_interval=idle_interval))
+    else:
+        world.add_processor(graphics.TimeProcessor())
 
     # Setup screen rendering
     world.create_entity(graphics.ScreenSurfaceHandler())
     world.create_entity(
         graphics.ScreenSurface(),
+        graphics.DirtyRegion(),
+        graphics.RenderList(),
         sdl2.SDL_CreateRGBSurfaceWithFormat(0, graphics.BONNET_WIDTH,
                                             graphics.BONNET_HEIGHT, 1,
                                             sdl2.SDL_PIXELFORMAT_RGB332))
@@ -52,19 +72,20 @@ def base_game_world_transformer(handle: desper.WorldHandle,
                 desper.Transform2D((LAYOUT_START_X + row
                                     * (marble_width + LAYOUT_X_CELL_OFFSET),
                                     LAYOUT_START_Y + column
-                                    * (marble_height + LAYOUT_Y_CELL_OFFSET))))
+                                    * (marble_height + LAYOUT_Y_CELL_OFFSET))),
+                graphics.Sprite(layer=BOARD_LAYER))
 
     # Add visual cursors
     hor_cursor_surface = desper.resource_map['sprites/hor_cursor']
     hor_cursor_x_offset = (marble_width - hor_cursor_surface.contents.w) // 2
     # Top
-    world.create_entity(hor_cursor_surface,
-                        desper.Transform2D(),
+    world.create_entity(desper.Transform2D(),
+                        graphics.Sprite(hor_cursor_surface, CURSOR_LAYER),
                         game.CursorHandler(grid, (hor_cursor_x_offset,
                                                   -LAYOUT_Y_CELL_OFFSET)))
     # Bottom
-    world.create_entity(hor_cursor_surface,
-                        desper.Transform2D(),
+    world.create_entity(desper.Transform2D(),
+                        graphics.Sprite(hor_cursor_surface, CURSOR_LAYER),
                         game.CursorHandler(grid, (hor_cursor_x_offset,
                                                   LAYOUT_Y_CELL_OFFSET
                                                   + marble_height - 1)))
@@ -73,11 +94,11 @@ def base_game_world_transformer(handle: desper.WorldHandle,
     grid_border_surface = graphics.build_surface(1, graphics.BONNET_HEIGHT,
                                                  0xFFFFFFFF)
 
-    world.create_entity(grid_border_surface,
-                        desper.Transform2D((LAYOUT_START_X - 1, 0)))
-    world.create_entity(grid_border_surface,
-                        desper.Transform2D((graphics.BONNET_WIDTH
-                                            - LAYOUT_START_X, 0)))
+    world.create_entity(desper.Transform2D((LAYOUT_START_X - 1, 0)),
+                        graphics.Sprite(grid_border_surface, BOARD_LAYER))
+    world.create_entity(desper.Transform2D((graphics.BONNET_WIDTH
+                                            - LAYOUT_START_X, 0)),
+                        graphics.Sprite(grid_border_surface, BOARD_LAYER))
 
     # Init game loop
     # Players must be added as entities in order to dispatch events
@@ -90,20 +111,37 @@ def base_game_world_transformer(handle: desper.WorldHandle,
 def start_game(player1: game.GUIPlayer = game.UserPlayer(),
                player2: game.GUIPlayer = game.UserPlayer(),
                *other_players: game.GUIPlayer,
-               on_bonnet: bool = False, window_scale: int = 1):
+               on_bonnet: bool = False, window_scale: int = 1,
+               key_repeat: tuple[float, float] | None = None,
+               adaptive_scheduler: bool = False,
+               headless_mode: bool = False, profile: str | None = None,
+               startup_profile: bool = False,
+               record_path: str | None = None,
+               replayer: record.Replayer | None = None,
+               display_spec: str | None = None):
     if len(other_players):
         raise ValueError('Multiplayer (>2) games are not supported (yet?).')
 
+    # Start AI workers in advance, so that first moves are not slowed
+    # down
+    for backend in {player.backend for player in (player1, player2,
+                                                  *other_players)
+                    if isinstance(player, game.LegacyPlayer)}:
+        workers.warm_up(backend)
+    startup.mark('AI workers warm-up')
+
     sdl2.SDL_Init(0)
 
-    if not on_bonnet:       # Only create a window on desktop
+    on_desktop = not on_bonnet and not headless_mode
+    if on_desktop:          # Only create a window on desktop
         global window
         window = sdl2.SDL_CreateWindow(b'Corso on adafruit bonnet',
                                        sdl2.SDL_WINDOWPOS_UNDEFINED,
                                        sdl2.SDL_WINDOWPOS_UNDEFINED,
                                        graphics.BONNET_WIDTH * window_scale,
                                        graphics.BONNET_HEIGHT * window_scale,
-                                       0)
+                                       sdl2.SDL_WINDOW_RESIZABLE)
+    startup.mark('SDL init')
 
     directory_populator = desper.DirectoryResourcePopulator(
         pathlib.Path(__file__).absolute().parents[1] / 'resources',
@@ -111,27 +149,75 @@ def start_game(player1: game.GUIPlayer = game.UserPlayer(),
 
     directory_populator.add_rule('sprites', graphics.SurfaceHandle)
     directory_populator(desper.resource_map)
+    startup.mark('resources')
 
     desper.resource_map['worlds/game'] = desper.WorldHandle()
+    # On bonnet (and headless), all input sources wake up the
+    # scheduler. On desktop, SDL events are polled
+    idle_interval = None if not on_desktop else desktop.IDLE_INTERVAL
     desper.resource_map.get('worlds/game').transform_functions.append(
-        partial(base_game_world_transformer, players=(player1, player2,
-                                                      *other_players)))
+        partial(base_game_world_transformer,
+                players=(player1, player2, *other_players),
+                adaptive_scheduler=adaptive_scheduler,
+                idle_interval=idle_interval))
 
     # Platform specific world transformer
+    # Displays other than the emulated one are closed on exit
+    display = None
     platform_specific_transformer = desktop.game_world_transformer
-    if on_bonnet:
-        platform_specific_transformer = bonnet.game_world_transformer
+    if headless_mode:
+        # Optional modes import their modules on demand
+        from . import headless
+        if display_spec is not None:
+            display = transport.open_display(display_spec)
+        platform_specific_transformer = partial(
+            headless.game_world_transformer, display=display)
+    elif on_bonnet:
+        platform_specific_transformer = partial(
+            bonnet.game_world_transformer, key_repeat=key_repeat,
+            display_spec=display_spec)
+        display = bonnet.get_display(display_spec)
 
     desper.resource_map.get('worlds/game').transform_functions.append(
             platform_specific_transformer)
 
+    # Record or replay moves
+    if record_path is not None or replayer is not None:
+        desper.resource_map.get('worlds/game').transform_functions.append(
+            partial(record.world_transformer, path=record_path,
+                    specs=[record.player_spec(player) for player in
+                           (player1, player2, *other_players)],
+                    replayer=replayer))
+
+    if startup_profile:
+        desper.resource_map.get('worlds/game').transform_functions.append(
+            startup.world_transformer)
+
+    # Instrument the whole world, if requested (last, see
+    # profiling.world_transformer)
+    profiler = None
+    if profile is not None:
+        from . import profiling
+        profiler = profiling.Profiler()
+        desper.resource_map.get('worlds/game').transform_functions.append(
+            partial(profiling.world_transformer, profiler=profiler))
+
     desper.default_loop.switch(desper.resource_map.get('worlds/game'))
     try:
         desper.default_loop.loop()
     except desper.Quit:
         pass
 
-    if not on_bonnet:       # Window exists on desktop only
+    # Cancel any computation left
+    workers.shutdown()
+
+    if profiler is not None:
+        profiler.dump(profile)
+
+    if isinstance(display, transport.SSD1306):
+        display.close()
+
+    if on_desktop:          # Window exists on desktop only
         sdl2.SDL_DestroyWindow(window)
 
     sdl2.SDL_Quit()
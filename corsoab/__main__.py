@@ -2,23 +2,28 @@
 
 Designed to be played on a Raspberry Pi equipped with an Adafruit 128x64
 OLED Bonnet, it can be played on any regular desktop computer.
+
+AI players can be compared headlessly with the "tournament" subcommand
+(see "python -m corsoab tournament -h"), and served to remote players
+with the "serve" subcommand (see "python -m corsoab serve -h").
 """
 import argparse
+import sys
 from dataclasses import dataclass, field
 
-from corso.cli import parse_player as corso_parse_player, CLIPlayer
-
-from .game import GUIPlayer, LegacyPlayer, UserPlayer
+from .buttons import DEFAULT_REPEAT_INTERVAL
+from .game import GUIPlayer, LegacyPlayer, MAX_PONDER_WIDTH, UserPlayer
 from .log import logger
+from .players import parse_legacy_player, PARALLEL_MINMAX_PLAYER_RE
+from .profiling import DEFAULT_PROFILE_PATH
+from .workers import Backend
+from . import bonnet
+from . import record
 from . import start_game
+from . import startup
+from . import transport
 
-# Detect whether we are on bonnet
-BONNET_DETECTED = True
-try:
-    from . import bonnet            # NOQA
-except Exception:
-    BONNET_DETECTED = False
-    pass
+startup.mark('imports')
 
 DESKTOP_HELP = """
 Desktop mode. Use this if you are on a desktop machine. Never use it on
@@ -31,13 +36,87 @@ This is most likely too tiny. Defaults to 3.
 """
 PLAYER_HELP = """
 Specify one or more player types for the game. Accepted player types
-are: "user", "random", "mmX". "user" is desigend for human input.
-"random" plays completely randomly. "mmX" is a MinMax player, where
-X specifies the depth of the search. X must be an integer greater than
-1. If omitted, defaults to 3. A suitable range goes from 1 to 6.
-Generally, a deeper search leads to a stronger player. This option
-can be specified multiple times to define the player order. If omitted,
-"user" type players are automatically added.
+are: "user", "random", "mmX", "ttX", "idT", "pmmX", "remote:...". "user"
+is desigend for human input. "random" plays completely randomly. "mmX"
+is a MinMax player, where X specifies the depth of the search. X must be
+an integer greater than 1. If omitted, defaults to 3. A suitable range
+goes from 1 to 6. Generally, a deeper search leads to a stronger player.
+"ttX" is a faster MinMax player of depth X, which remembers the
+positions it searched across moves (transposition table). "idT" searches
+as deep as it can within T milliseconds per move (defaults to 1000), for
+a bounded think time whatever the hardware. "pmmX[:W]" is a MinMax
+player of depth X searching on W worker processes (defaults to the
+number of CPUs), to search deeper in the same time on multi-core
+machines. "remote:HOST:PORT[:TYPE]" offloads an AI player of the given
+type (defaults to "mm3") to a server (see "python -m corsoab serve -h"),
+and searches locally, shallowly, if the server does not respond in time.
+This option can be specified multiple times to define the player order.
+If omitted, "user" type players are automatically added.
+"""
+EXECUTOR_HELP = """
+Executor backend for AI players. "thread" runs AI searches on a
+separate thread, which can make the game stutter while the AI is
+thinking. "process" runs them on a pool of worker processes, reused
+across moves. Defaults to "thread". Remote and "pmmX" players always
+use threads.
+"""
+PONDER_HELP = """
+Let AI players think during their opponent's turn, speculatively
+searching the most likely replies. Requires the "process" executor and
+a multi-core machine: one worker is always left for actual searches.
+"""
+KEY_REPEAT_HELP = """
+Repeat directional buttons while held down, on bonnet. DELAY is the
+time before the first repetition and INTERVAL the time between
+repetitions, in milliseconds. INTERVAL defaults to 100. Disabled by
+default.
+"""
+ADAPTIVE_SCHEDULER_HELP = """
+Skip frames while nothing happens on screen, instead of running at a
+fixed 60 frames per second. On bonnet, the game sleeps until a button
+is pressed or an AI completes its move, saving power. Measured wakeups
+per second and CPU time are logged on exit.
+"""
+HEADLESS_HELP = """
+Headless mode. The game is rendered in memory only, with no window or
+bonnet. Only AI players are allowed. Useful for automated tests.
+"""
+PROFILE_HELP = f"""
+Measure the time spent by each processor and event of the game, and
+per frame. A summary is periodically logged, and latency histograms
+are written to PATH on exit. If PATH is omitted, defaults to
+"{DEFAULT_PROFILE_PATH}".
+"""
+STARTUP_PROFILE_HELP = """
+Log how long each startup stage takes, from imports to the first
+rendered frame.
+"""
+RECORD_HELP = """
+Record the game's moves to PATH, in a compact binary format. The file
+is written as the game goes, see --replay.
+"""
+REPLAY_HELP = """
+Replay a recorded game (see --record), instead of playing. Players
+cannot be specified.
+"""
+FAST_FORWARD_HELP = """
+When replaying, play MOVES moves per frame instead of one move every
+half second. If MOVES is omitted, the whole game is played in a single
+frame: only the final position is rendered.
+"""
+DISPLAY_HELP = f"""
+Display wiring, on bonnet and in headless mode: "i2c[:FREQUENCY]",
+"spi[:BAUDRATE]" (in Hz, default to {transport.DEFAULT_I2C_FREQUENCY}
+and {transport.DEFAULT_SPI_BAUDRATE}) or "memory[:PATH]", which
+records the command stream sent to the display (in PATH, if given).
+By default, adafruit's I2C driver is used on bonnet, and an emulated
+display in headless mode.
+"""
+BOOK_HELP = """
+Let AI players pick their opening moves from a precomputed opening
+book, instantly. Positions outside of the book are searched as usual.
+If PATH is omitted, the book shipped with the game is used (default
+5x5 board).
 """
 
 
@@ -47,46 +126,202 @@ class Args:
     desktop: bool = False
     scale: int = 3
     players: list[GUIPlayer] = field(default_factory=lambda: [])
+    executor: str = Backend.THREAD.value
+    ponder: bool = False
+    book: str | None = None
+    key_repeat: tuple[float, float] | None = None
+    adaptive_scheduler: bool = False
+    headless: bool = False
+    profile: str | None = None
+    startup_profile: bool = False
+    record: str | None = None
+    replay: str | None = None
+    fast_forward: int | None | bool = False
+    display: str | None = None
+
+
+def parse_key_repeat(value: str) -> tuple[float, float]:
+    """Parse a ``DELAY[:INTERVAL]`` key repeat spec, in milliseconds.
+
+    Return ``(delay, interval)`` in seconds.
+    """
+    delay, _, interval = value.partition(':')
+    try:
+        delay = int(delay) / 1000
+        interval = (int(interval) / 1000 if interval
+                    else DEFAULT_REPEAT_INTERVAL)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f'invalid key repeat "{value}", expected DELAY[:INTERVAL]')
+
+    if delay < 0 or interval <= 0:
+        raise argparse.ArgumentTypeError('key repeat delay must be positive '
+                                         'and interval greater than zero')
+
+    return delay, interval
+
+
+def parse_display(value: str) -> str:
+    """Validate a display spec, see :func:`transport.open_display`."""
+    try:
+        transport.parse_display_spec(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+    return value
 
 
 def parse_player(player_name: str) -> GUIPlayer:
     """Obtain a player instance from its CLI name.
 
-    Under the hood, this uses corso's CLI name parser.
+    Under the hood, this uses corso's CLI name parser, extended by
+    :func:`players.parse_legacy_player`.
     """
-    legacy_player = corso_parse_player(player_name)
+    # Imported on demand, like the modules of optional features
+    from corso.cli import CLIPlayer
+
+    if player_name.lower().startswith('remote:'):
+        from . import remote
+        legacy_player = remote.parse_remote_player(player_name)
+    else:
+        legacy_player = parse_legacy_player(player_name)
 
     # Adapt CLI user player to our specialized user player
     if type(legacy_player) is CLIPlayer:
         return UserPlayer()
 
     # Any other legacy player is wrapped in a LegacyPlayer and returned
-    return LegacyPlayer(legacy_player)
+    player = LegacyPlayer(legacy_player)
+    player.spec = player_name.lower()
+    return player
 
 
 if __name__ == '__main__':
+    # Subcommands, with their own arguments
+    if sys.argv[1:2] == ['tournament']:
+        from . import tournament
+        tournament.main(sys.argv[2:])
+        sys.exit()
+    if sys.argv[1:2] == ['serve']:
+        from . import remote
+        remote.main(sys.argv[2:])
+        sys.exit()
+
     # Arguments
     parser = argparse.ArgumentParser('python -m corsoab', description=__doc__)
 
     parser.add_argument('-d', action='store_true', dest='desktop',
                         help=DESKTOP_HELP)
+    parser.add_argument('--headless', action='store_true', dest='headless',
+                        help=HEADLESS_HELP)
     parser.add_argument('-s', action='store', dest='scale', type=int,
                         help=SCALE_HELP)
     parser.add_argument('-p', '--player', type=parse_player,
                         nargs='+', action='extend', metavar='PLAYER_TYPE',
                         dest='players', help=PLAYER_HELP)
+    parser.add_argument('-e', '--executor', dest='executor',
+                        choices=[backend.value for backend in Backend],
+                        help=EXECUTOR_HELP)
+    parser.add_argument('--ponder', action='store_true', dest='ponder',
+                        help=PONDER_HELP)
+    # An empty path stands for the default book
+    parser.add_argument('--book', nargs='?', const='',
+                        metavar='PATH', dest='book', help=BOOK_HELP)
+    parser.add_argument('--key-repeat', type=parse_key_repeat,
+                        metavar='DELAY[:INTERVAL]', dest='key_repeat',
+                        help=KEY_REPEAT_HELP)
+    parser.add_argument('--adaptive-scheduler', action='store_true',
+                        dest='adaptive_scheduler',
+                        help=ADAPTIVE_SCHEDULER_HELP)
+    parser.add_argument('--profile', nargs='?', const=DEFAULT_PROFILE_PATH,
+                        metavar='PATH', dest='profile', help=PROFILE_HELP)
+    parser.add_argument('--startup-profile', action='store_true',
+                        dest='startup_profile', help=STARTUP_PROFILE_HELP)
+
+    parser.add_argument('--record', metavar='PATH', dest='record',
+                        help=RECORD_HELP)
+    parser.add_argument('--replay', metavar='PATH', dest='replay',
+                        help=REPLAY_HELP)
+    parser.add_argument('--fast-forward', nargs='?', type=int, const=None,
+                        metavar='MOVES', dest='fast_forward',
+                        help=FAST_FORWARD_HELP)
+
+    parser.add_argument('--display', type=parse_display, metavar='SPEC',
+                        dest='display', help=DISPLAY_HELP)
 
     args = parser.parse_args(namespace=Args())
+    startup.mark('argument parsing')
+
+    replayer = None
+    if args.replay is not None:
+        if args.players:
+            parser.error('players cannot be specified when replaying')
+
+        try:
+            game_record = record.read_record(args.replay)
+            actions = list(game_record.actions())
+        except (OSError, ValueError) as error:
+            parser.error(f'cannot replay {args.replay}: {error}')
+
+        args.players = list(record.players(game_record))
+        if args.fast_forward is False:
+            replayer = record.Replayer(actions)
+        else:
+            replayer = record.Replayer(actions, 0, args.fast_forward)
+
+    if args.headless and (len(args.players) < 2 or any(
+            isinstance(player, UserPlayer) for player in args.players)):
+        parser.error('headless mode requires two AI players')
+
+    # Thread searches would compete with the game loop for the GIL
+    if args.ponder and Backend(args.executor) is Backend.THREAD:
+        parser.error('--ponder requires "-e process"')
+    if args.ponder and MAX_PONDER_WIDTH < 1:
+        logger.warning('Pondering disabled: it needs more than one CPU')
+        args.ponder = False
+
+    if args.book is not None:
+        from .book import BookPlayer, DEFAULT_BOOK_PATH
+
+    for player in args.players:
+        if isinstance(player, LegacyPlayer):
+            # Remote players hold a connection, and mostly wait on it.
+            # Parallel players wait on their own worker processes
+            if not (player.spec.startswith('remote:')
+                    or PARALLEL_MINMAX_PLAYER_RE.fullmatch(player.spec)):
+                player.backend = Backend(args.executor)
+            player.ponder = args.ponder
+            if args.book is not None:
+                player.legacy_player = BookPlayer(
+                    player.legacy_player, args.book or DEFAULT_BOOK_PATH)
+
+    # Detect whether we are on bonnet. Hardware is only initialized if
+    # it is going to be used
+    bonnet_detected = bonnet.probe(args.display)
+    startup.mark('bonnet probe')
+    if bonnet_detected and not args.desktop and not args.headless:
+        try:
+            bonnet.get_display(args.display)
+        except Exception as exception:
+            logger.warning('Bonnet display initialization failed: %s',
+                           exception)
+            bonnet_detected = False
+        startup.mark('bonnet init')
 
     # In the end, we are on bonnet only if it is actually detected
-    on_bonnet = BONNET_DETECTED and not args.desktop
+    on_bonnet = bonnet_detected and not args.desktop and not args.headless
     # Warn the user of unexpected situations
-    if not args.desktop and not BONNET_DETECTED:
+    if not args.desktop and not args.headless and not bonnet_detected:
         logger.warning('No bonnet detected, falling back to desktop mode. Use '
                        'option "-d" to hide this warning.')
-    if args.desktop and BONNET_DETECTED:
+    if args.desktop and bonnet_detected:
         logger.warning('Desktop mode was forced, but a bonnet is detected. '
                        'Is this what you wanted? If you intend to run '
                        'on bonnet, remove option "-d".')
 
-    start_game(*args.players, on_bonnet=on_bonnet, window_scale=args.scale)
+    start_game(*args.players, on_bonnet=on_bonnet, window_scale=args.scale,
+               key_repeat=args.key_repeat,
+               adaptive_scheduler=args.adaptive_scheduler,
+               headless_mode=args.headless, profile=args.profile,
+               startup_profile=args.startup_profile,
+               record_path=args.record, replayer=replayer,
+               display_spec=args.display)
@@ -0,0 +1,235 @@
+"""Bitboard representation of Corso positions, for fast searches.
+
+A :class:`Bitboard` holds, for each of the two players, an integer
+mask of its dyes and one of its marbles: bit ``row * width + column``
+stands for a cell. Moves are cell indices, so that generating them,
+stepping and detecting terminal states are a few integer operations,
+where :class:`corso.model.Corso` rebuilds tuples of cells.
+
+Bitboards duck type :class:`corso.model.Corso` as far as searches are
+concerned (``actions``, ``step``, ``terminal``, ``player_index``), see
+:func:`heuristic` and :func:`key`. Convert them with
+:meth:`Bitboard.from_corso`, :meth:`Bitboard.to_corso` and
+:meth:`Bitboard.to_action`.
+"""
+import functools
+
+import corso.model as corso
+from corso.minmax import TERMINAL_SCORE
+
+
+class Geometry:
+    """Precomputed masks for a board size.
+
+    :attr:`neighbours` holds the neighbourhood mask of each cell (up to
+    four orthogonal cells). Edge masks are used to shift whole masks
+    by a column without wrapping across rows (see :meth:`dilate`).
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.cells = width * height
+        self.full = (1 << self.cells) - 1
+
+        first_column = sum(1 << row * width for row in range(height))
+        self.not_first_column = self.full & ~first_column
+        self.not_last_column = self.full & ~(first_column << width - 1)
+
+        self.neighbours = tuple(self.dilate(1 << index) & ~(1 << index)
+                                for index in range(self.cells))
+
+    def dilate(self, mask: int) -> int:
+        """Extend a mask to the orthogonal neighbours of its cells."""
+        return (mask
+                | (mask & self.not_last_column) << 1
+                | (mask & self.not_first_column) >> 1
+                | (mask << self.width) & self.full
+                | mask >> self.width)
+
+
+@functools.cache
+def get_geometry(width: int, height: int) -> Geometry:
+    """Retrieve the shared geometry of a board size."""
+    return Geometry(width, height)
+
+
+class Bitboard:
+    """Immutable two-player Corso position, as bit masks.
+
+    ``dyes`` and ``marbles`` hold the masks of player 1 and 2, in this
+    order. Moves (see :attr:`actions`) are cell indices.
+    """
+    __slots__ = ('geometry', 'dyes', 'marbles', 'player_index')
+
+    def __init__(self, geometry: Geometry, dyes: tuple[int, int],
+                 marbles: tuple[int, int], player_index: int = 1):
+        self.geometry = geometry
+        self.dyes = dyes
+        self.marbles = marbles
+        self.player_index = player_index
+
+    @classmethod
+    def from_corso(cls, state: corso.Corso) -> 'Bitboard':
+        """Convert a two-player game state."""
+        if state.player_num != 2:
+            raise ValueError('bitboards only support two-player games')
+
+        dyes = [0, 0, 0]
+        marbles = [0, 0, 0]
+        bit = 1
+        for row in state.board:
+            for cell in row:
+                if cell.marble:
+                    marbles[cell.player_index] |= bit
+                else:
+                    dyes[cell.player_index] |= bit
+                bit <<= 1
+
+        return cls(get_geometry(state.width, state.height),
+                   (dyes[1], dyes[2]), (marbles[1], marbles[2]),
+                   state.player_index)
+
+    def to_corso(self) -> corso.Corso:
+        """Convert back to a game state."""
+        width = self.geometry.width
+        cells = []
+        for index in range(self.geometry.cells):
+            bit = 1 << index
+            cell = corso.EMPTY_CELL
+            for player_index in (1, 2):
+                if self.dyes[player_index - 1] & bit:
+                    cell = corso.CellState(player_index, False)
+                elif self.marbles[player_index - 1] & bit:
+                    cell = corso.CellState(player_index, True)
+            cells.append(cell)
+
+        board = tuple(tuple(cells[row * width:(row + 1) * width])
+                      for row in range(self.geometry.height))
+        return corso.Corso(board, 2, self.player_index)
+
+    def to_action(self, move: int) -> corso.Action:
+        """Convert a move (cell index) to an action of the current player."""
+        row, column = divmod(move, self.geometry.width)
+        return corso.Action(self.player_index, row, column)
+
+    def from_action(self, action: corso.Action) -> int:
+        """Convert an action to a move (cell index)."""
+        return action.row * self.geometry.width + action.column
+
+    @property
+    def empty(self) -> int:
+        """Mask of the empty cells."""
+        return self.geometry.full & ~(self.dyes[0] | self.dyes[1]
+                                      | self.marbles[0] | self.marbles[1])
+
+    @property
+    def action_mask(self) -> int:
+        """Mask of the legal moves: empty cells and own marbles."""
+        return self.empty | self.marbles[self.player_index - 1]
+
+    @property
+    def actions(self) -> list[int]:
+        """Legal moves, as cell indices, in row major order."""
+        mask = self.action_mask
+        moves = []
+        while mask:
+            low = mask & -mask
+            moves.append(low.bit_length() - 1)
+            mask ^= low
+        return moves
+
+    def step(self, move: int) -> 'Bitboard':
+        """Apply a move (no legality checks), see :meth:`corso.Corso.step`.
+
+        Playing on an empty cell places a marble. Playing on an own
+        marble expands it: the region of marbles (of any player)
+        connected to it, and their neighbours, become the player's
+        dyes.
+        """
+        geometry = self.geometry
+        bit = 1 << move
+        dye1, dye2 = self.dyes
+        marble1, marble2 = self.marbles
+        own_marbles = marble1 if self.player_index == 1 else marble2
+
+        if not own_marbles & bit:
+            if self.player_index == 1:
+                return Bitboard(geometry, self.dyes, (marble1 | bit, marble2),
+                                2)
+            return Bitboard(geometry, self.dyes, (marble1, marble2 | bit), 1)
+
+        all_marbles = marble1 | marble2
+        region = bit
+        frontier = geometry.neighbours[move] & all_marbles
+        while frontier & ~region:
+            region |= frontier
+            frontier = geometry.dilate(region) & all_marbles
+
+        captured = geometry.dilate(region)
+        kept = ~captured
+        if self.player_index == 1:
+            return Bitboard(geometry, (dye1 | captured, dye2 & kept),
+                            (marble1 & kept, marble2 & kept), 2)
+        return Bitboard(geometry, (dye1 & kept, dye2 | captured),
+                        (marble1 & kept, marble2 & kept), 1)
+
+    def scores(self) -> tuple[int, int]:
+        """Cells owned by each player."""
+        return ((self.dyes[0] | self.marbles[0]).bit_count(),
+                (self.dyes[1] | self.marbles[1]).bit_count())
+
+    @property
+    def terminal(self) -> tuple[corso.Terminal, int]:
+        """Same as :attr:`corso.Corso.terminal`."""
+        if self.empty:
+            return corso.Terminal.NOT_TERMINAL, 0
+
+        score1, score2 = self.scores()
+        if score1 == score2:
+            return corso.Terminal.DRAW, 0
+        return corso.Terminal.WON, 1 if score1 > score2 else 2
+
+    def __eq__(self, other) -> bool:
+        return (isinstance(other, Bitboard)
+                and self.dyes == other.dyes
+                and self.marbles == other.marbles
+                and self.player_index == other.player_index
+                and self.geometry is other.geometry)
+
+    def __hash__(self) -> int:
+        return key(self)
+
+    def __reduce__(self):
+        # Geometries are shared, not pickled
+        return _restore, (self.geometry.width, self.geometry.height,
+                          self.dyes, self.marbles, self.player_index)
+
+
+def _restore(width: int, height: int, dyes: tuple[int, int],
+             marbles: tuple[int, int], player_index: int) -> Bitboard:
+    """Unpickle a bitboard, see :meth:`Bitboard.__reduce__`."""
+    return Bitboard(get_geometry(width, height), dyes, marbles,
+                    player_index)
+
+
+def heuristic(board: Bitboard) -> float:
+    """Same as :func:`corso.minmax.heuristic`, on bitboards."""
+    if not board.empty:
+        terminal, winner = board.terminal
+        if terminal == corso.Terminal.WON and winner == 1:
+            return TERMINAL_SCORE
+        return -TERMINAL_SCORE
+
+    dyes = board.dyes
+    marbles = board.marbles
+    return (marbles[0].bit_count() + 0.7 * dyes[0].bit_count()
+            - marbles[1].bit_count() - 0.7 * dyes[1].bit_count())
+
+
+def key(board: Bitboard) -> int:
+    """Get a unique integer key for a position (for a board size)."""
+    cells = board.geometry.cells
+    return ((((board.dyes[0] << cells | board.marbles[0]) << cells
+              | board.dyes[1]) << cells | board.marbles[1]) << 2
+            | board.player_index)
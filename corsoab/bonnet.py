@@ -1,71 +1,27 @@
-import ctypes
-import enum
+"""Bonnet specific implementations.
+
+Importing this module does not touch the hardware: use :func:`probe`
+to cheaply detect a bonnet and :func:`get_display` to initialize it
+(once). The display is driven by adafruit's I2C driver by default, or
+through any transport (see :mod:`transport`).
+"""
+import functools
+import glob
+import importlib.util
 
 import desper
-import busio
-import board
-import adafruit_ssd1306
 import sdl2
-from digitalio import DigitalInOut, Direction, Pull
 
 from . import graphics
+from . import transport
+from .buttons import Button, InputSampler, default_backend
+from .sprites import PageCompositor, PageFramebuffer, WriterRenderHandler
+from .ssd1306 import DisplayWriter
 
-# Create the I2C interface.
-i2c = busio.I2C(board.SCL, board.SDA)
-# Create the SSD1306 OLED class.
-display = adafruit_ssd1306.SSD1306_I2C(graphics.BONNET_WIDTH,
-                                       graphics.BONNET_HEIGHT, i2c)
-
-_BUTTON_A_DIGITAL = DigitalInOut(board.D5)
-_BUTTON_A_DIGITAL.direction = Direction.INPUT
-_BUTTON_A_DIGITAL.pull = Pull.UP
-
-_BUTTON_B_DIGITAL = DigitalInOut(board.D6)
-_BUTTON_B_DIGITAL.direction = Direction.INPUT
-_BUTTON_B_DIGITAL.pull = Pull.UP
-
-_BUTTON_L_DIGITAL = DigitalInOut(board.D27)
-_BUTTON_L_DIGITAL.direction = Direction.INPUT
-_BUTTON_L_DIGITAL.pull = Pull.UP
-
-_BUTTON_R_DIGITAL = DigitalInOut(board.D23)
-_BUTTON_R_DIGITAL.direction = Direction.INPUT
-_BUTTON_R_DIGITAL.pull = Pull.UP
-
-_BUTTON_U_DIGITAL = DigitalInOut(board.D17)
-_BUTTON_U_DIGITAL.direction = Direction.INPUT
-_BUTTON_U_DIGITAL.pull = Pull.UP
-
-_BUTTON_D_DIGITAL = DigitalInOut(board.D22)
-_BUTTON_D_DIGITAL.direction = Direction.INPUT
-_BUTTON_D_DIGITAL.pull = Pull.UP
-
-_BUTTON_C_DIGITAL = DigitalInOut(board.D4)
-_BUTTON_C_DIGITAL.direction = Direction.INPUT
-_BUTTON_C_DIGITAL.pull = Pull.UP
-
-
-class Button(enum.Enum):
-    """Bonnet buttons enumeration."""
-    A = enum.auto()
-    B = enum.auto()
-    L = enum.auto()
-    R = enum.auto()
-    U = enum.auto()
-    D = enum.auto()
-    C = enum.auto()
-
-
-_BUTTONS = {
-    Button.A: _BUTTON_A_DIGITAL,
-    Button.B: _BUTTON_B_DIGITAL,
-    Button.L: _BUTTON_L_DIGITAL,
-    Button.R: _BUTTON_R_DIGITAL,
-    Button.U: _BUTTON_U_DIGITAL,
-    Button.D: _BUTTON_D_DIGITAL,
-    Button.C: _BUTTON_C_DIGITAL,
-}
-
+# Modules needed to drive the display, and bus device files
+HARDWARE_MODULES = ('board', 'busio', 'adafruit_ssd1306')
+I2C_DEVICES_PATTERN = '/dev/i2c-*'
+SPI_DEVICES_PATTERN = '/dev/spidev*'
 
 _BONNET_TO_SDL_MAP = {
     Button.A: sdl2.SDL_SCANCODE_RETURN,
@@ -78,66 +34,70 @@ _BONNET_TO_SDL_MAP = {
 }
 
 
-def fill_display(display, surface):
-    pixels = ctypes.cast(surface.contents.pixels,
-                         ctypes.POINTER(ctypes.c_uint8))
-    for y in range(graphics.BONNET_HEIGHT):
-        for x in range(graphics.BONNET_WIDTH):
-            display.pixel(x, y, pixels[128 * y + x] & 1)
-
-
-@desper.event_handler('render')
-class RenderHandler(desper.Controller):
-    """Actually render screen to bonnet, on ``render`` event."""
+def probe(display_spec: str | None = None) -> bool:
+    """Tell whether a bonnet may be available, without initializing it.
 
-    def render(self):
-        screen_surface_entity, _ = self.world.get(graphics.ScreenSurface)[0]
-        screen_surface = self.world.get_component(screen_surface_entity,
-                                                  graphics.LP_SDL_Surface)
-
-        fill_display(display, screen_surface)
-        display.show()
+    Display driver modules must be installed (they are looked up, not
+    imported) and the display's bus must be exposed (SPI if
+    ``display_spec`` says so, I2C otherwise). Whether the display
+    actually answers is only known by :func:`get_display`.
+    """
+    devices_pattern = I2C_DEVICES_PATTERN
+    if display_spec is not None and display_spec.lower().startswith('spi'):
+        devices_pattern = SPI_DEVICES_PATTERN
 
+    return (all(importlib.util.find_spec(name) is not None
+                for name in HARDWARE_MODULES)
+            and bool(glob.glob(devices_pattern)))
 
-@desper.event_handler('on_dirty_render')
-class DirtyRenderLoopProcessor(desper.Processor):
-    """Dispatch ``update_screen_surface``, ``render`` events, if needed.
 
-    This implementation only updates and flips the screen if during the
-    frame a change is notified through the ``on_dirty_render`` event.
-    Since the game is extremely static, with nothing changes for entire
-    seconds, this is a lot of computation saved on the bonnet.
-    Not flipping the screen at all may be problematic on desktop
-    systems, let's keep it on the bonnet for the moment.
+@functools.cache
+def get_display(spec: str | None = None):
+    """Initialize the display, once per spec.
 
-    Could be potentially improved with more fine-grained dirty
-    rectangles.
+    By default, adafruit's driver is used on the I2C bus. Otherwise,
+    see :func:`transport.open_display` for the accepted specs. Raise
+    if the display cannot be reached.
     """
-    _dirty = False
+    if spec is not None:
+        return transport.open_display(spec)
 
-    def on_dirty_render(self):
-        """Store a dirty "bit" for this frame."""
-        self._dirty = True
-
-    def process(self, dt):
-        if not self._dirty:
-            return
+    import adafruit_ssd1306
+    import board
+    import busio
 
-        self.world.dispatch('update_screen_surface')
-        self.world.dispatch('render')
+    i2c = busio.I2C(board.SCL, board.SDA)
+    return adafruit_ssd1306.SSD1306_I2C(graphics.BONNET_WIDTH,
+                                        graphics.BONNET_HEIGHT, i2c)
 
-        self._dirty = False
 
+def game_world_transformer(handle: desper.WorldHandle, world: desper.World,
+                           key_repeat: tuple[float, float] | None = None,
+                           display_spec: str | None = None):
+    """Instantiate game world (bonnet specific).
 
-def game_world_transformer(handle: desper.WorldHandle, world: desper.World):
-    """Instantiate game world (bonnet specific)."""
-    world.add_processor(InputProcessor())
-    world.add_processor(DirtyRenderLoopProcessor())
+    If given, ``key_repeat`` is in the form ``(delay, interval)``, in
+    seconds, see :class:`InputSampler`. The display is selected by
+    ``display_spec``, see :func:`get_display`.
+    """
+    display = get_display(display_spec)
+    sampler = InputSampler(default_backend(), on_event=graphics.wake)
+    if key_repeat is not None:
+        sampler.repeat_delay, sampler.repeat_interval = key_repeat
+    world.add_processor(InputProcessor(sampler))
+    # Compose in page layout, with no SDL compositing nor format
+    # conversion. Frames are sent by a writer thread, so that the game
+    # loop never waits on the I2C bus
+    world.add_processor(graphics.DirtyRenderLoopProcessor(
+        'update_framebuffer'))
     world.create_entity(BonnetToSDLKeys())
 
-    world.create_entity(RenderHandler())
+    framebuffer = PageFramebuffer(display.width, display.height)
+    writer = DisplayWriter(display)
+    world.create_entity(PageCompositor(framebuffer))
+    world.create_entity(WriterRenderHandler(framebuffer, writer))
 
-    world.create_entity(QuitButtonHandler(Button.C))
+    world.create_entity(QuitButtonHandler(Button.C, display, writer))
 
     # Notify a change to render during the game's first frame
     world.dispatch('on_dirty_render')
@@ -145,30 +105,53 @@ def game_world_transformer(handle: desper.WorldHandle, world: desper.World):
 
 @desper.event_handler('on_bonnet_button_press')
 class QuitButtonHandler:
-    """Quit if the given button is pressed."""
+    """Quit and power the display off, if the given button is pressed.
+
+    The display writer, if given, is closed before powering off.
+    """
 
-    def __init__(self, button):
+    def __init__(self, button, display,
+                 writer: DisplayWriter | None = None):
         self.button = button
+        self.display = display
+        self.writer = writer
 
     def on_bonnet_button_press(self, button):
         """Handle event: quit if the designated button is pressed."""
         if button == self.button:
-            display.poweroff()
+            if self.writer is not None:
+                self.writer.close()
+            self.display.poweroff()
             desper.quit_loop()
 
 
+@desper.event_handler('on_quit')
 class InputProcessor(desper.Processor):
-    """Handle input events."""
-    _button_states = {}
+    """Handle input events, sampled in background.
 
-    def process(self, dt):
-        for button, digital in _BUTTONS.items():
-            # Detect down-up edge
-            button_value = not digital.value
-            if not self._button_states.get(button) and button_value:
-                self.world.dispatch('on_bonnet_button_press', button)
+    Buttons are sampled and debounced by an :class:`InputSampler`,
+    whose events are drained here each frame and dispatched as
+    ``on_bonnet_button_press`` and ``on_bonnet_button_release``.
+    Sampling starts when the processor is created.
+    """
+
+    def __init__(self, sampler: InputSampler | None = None):
+        if sampler is None:
+            sampler = InputSampler(default_backend())
+        self.sampler = sampler
+        self.sampler.start()
 
-            self._button_states[button] = button_value
+    def on_quit(self):
+        """Stop sampling."""
+        self.sampler.stop()
+
+    def process(self, dt):
+        for event in self.sampler.drain():
+            if event.pressed:
+                self.world.dispatch('on_bonnet_button_press', event.button)
+            else:
+                self.world.dispatch('on_bonnet_button_release',
+                                    event.button)
 
 
 @desper.event_handler('on_bonnet_button_press')
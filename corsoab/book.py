@@ -0,0 +1,293 @@
+"""Precomputed opening book for Corso.
+
+Positions are normalized over the symmetries of the board (rotations
+and reflections), so that only one representative per class is
+stored. A book file is laid out as::
+
+    header   magic, version, width, height, ply, depth, key size, count
+    records  sorted by key: key (big endian), action row, action column
+
+Books are memory-mapped and searched in place (binary search), hence
+loading is instantaneous regardless of their size.
+
+A book can be generated with ``python -m corsoab.book``.
+"""
+import argparse
+import bisect
+import mmap
+import pathlib
+import struct
+
+import corso.model as corso
+
+from . import search
+from .log import logger
+
+MAGIC = b'CRSOBOOK'
+VERSION = 1
+HEADER_STRUCT = struct.Struct('<8sBBBBBBI')
+ACTION_SIZE = 2
+
+DEFAULT_BOOK_PATH = (pathlib.Path(__file__).absolute().parents[1]
+                     / 'resources' / 'books' / 'corso5x5.book')
+DEFAULT_PLY = 3
+DEFAULT_DEPTH = 4
+
+
+def _symmetries(width: int, height: int) -> tuple:
+    """Get the coordinate transformations preserving the board.
+
+    Each transformation maps ``(row, column)`` to a new pair. Square
+    boards have eight symmetries, rectangular ones four.
+    """
+    last_row = height - 1
+    last_col = width - 1
+
+    symmetries = [
+        lambda row, col: (row, col),
+        lambda row, col: (last_row - row, last_col - col),
+        lambda row, col: (last_row - row, col),
+        lambda row, col: (row, last_col - col)]
+
+    if width == height:
+        symmetries += [
+            lambda row, col: (col, last_row - row),
+            lambda row, col: (last_col - col, row),
+            lambda row, col: (col, row),
+            lambda row, col: (last_col - col, last_row - row)]
+
+    return tuple(symmetries)
+
+
+# Index of the inverse of each symmetry (rotations by 90 degrees are
+# the only ones that are not self-inverse)
+_INVERSE_SYMMETRY = (0, 1, 2, 3, 5, 4, 6, 7)
+
+
+def _transform_board(board: corso.Board, symmetry) -> corso.Board:
+    """Apply a symmetry (see :func:`_symmetries`) to a board."""
+    # Only square boards have symmetries that swap rows and columns
+    new_board = [[None] * len(row) for row in board]
+
+    for row_index, row in enumerate(board):
+        for col_index, cell in enumerate(row):
+            new_row, new_col = symmetry(row_index, col_index)
+            new_board[new_row][new_col] = cell
+
+    return tuple(map(tuple, new_board))
+
+
+def canonical_state(state: corso.Corso) -> tuple[int, corso.Board, int]:
+    """Normalize a state over the board symmetries.
+
+    Return ``(key, board, symmetry_index)``: the smallest key (see
+    :func:`search.board_hash`) among the symmetric boards, the
+    corresponding board and the index of the symmetry that produces it.
+    """
+    candidates = []
+    for index, symmetry in enumerate(_symmetries(state.width,
+                                                 state.height)):
+        board = _transform_board(state.board, symmetry)
+        candidates.append((search.board_hash(board, state.player_index),
+                           board, index))
+
+    return min(candidates, key=lambda candidate: candidate[0])
+
+
+def key_size(width: int, height: int) -> int:
+    """Get the size in bytes of keys, for the given board size."""
+    return (3 * width * height + 2 + 7) // 8
+
+
+class OpeningBook:
+    """Memory-mapped, read only opening book."""
+
+    def __init__(self, path: str | pathlib.Path = DEFAULT_BOOK_PATH):
+        self.path = pathlib.Path(path)
+
+        with open(self.path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.width, self.height, self.ply, self.depth,
+         self.key_size, self._count) = HEADER_STRUCT.unpack_from(self._map)
+
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f'{self.path} is not a valid opening book '
+                             f'(version {VERSION})')
+
+        self._record_size = self.key_size + ACTION_SIZE
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _key_at(self, index: int) -> bytes:
+        """Get the key of a record, by index."""
+        start = HEADER_STRUCT.size + index * self._record_size
+        return self._map[start:start + self.key_size]
+
+    def lookup(self, state: corso.Corso) -> corso.Action | None:
+        """Get the book action for the given state, if any."""
+        if (state.width, state.height) != (self.width, self.height):
+            return None
+
+        key, _, symmetry_index = canonical_state(state)
+        key_bytes = key.to_bytes(self.key_size, 'big')
+
+        index = bisect.bisect_left(range(self._count), key_bytes,
+                                   key=self._key_at)
+        if index >= self._count or self._key_at(index) != key_bytes:
+            return None
+
+        action_start = (HEADER_STRUCT.size + index * self._record_size
+                        + self.key_size)
+        row, col = self._map[action_start:action_start + ACTION_SIZE]
+
+        # Bring the action back from the canonical board
+        inverse = _symmetries(self.width, self.height)[
+            _INVERSE_SYMMETRY[symmetry_index]]
+        return corso.Action(state.player_index, *inverse(row, col))
+
+    def close(self):
+        self._map.close()
+
+
+def write_book(path: str | pathlib.Path,
+               entries: dict[int, tuple[int, int]], width: int, height: int,
+               ply: int, depth: int):
+    """Write a book file from canonical keys and ``(row, col)`` actions."""
+    size = key_size(width, height)
+
+    with open(path, 'wb') as file:
+        file.write(HEADER_STRUCT.pack(MAGIC, VERSION, width, height, ply,
+                                      depth, size, len(entries)))
+        for key in sorted(entries):
+            file.write(key.to_bytes(size, 'big'))
+            file.write(bytes(entries[key]))
+
+
+def generate_entries(starting_state: corso.Corso = corso.Corso(),
+                     ply: int = DEFAULT_PLY, depth: int = DEFAULT_DEPTH
+                     ) -> dict[int, tuple[int, int]]:
+    """Compute book moves for all positions up to the given ply.
+
+    All the non-terminal positions reachable in less than ``ply``
+    moves are searched at the given depth (see
+    :class:`search.CachedMinMaxPlayer`). The best action is stored,
+    relative to the canonical board.
+    """
+    player = search.CachedMinMaxPlayer(depth)
+    entries = {}
+
+    key, board, _ = canonical_state(starting_state)
+    frontier = {key: corso.Corso(board, starting_state.player_num,
+                                 starting_state.player_index)}
+    for current_ply in range(ply):
+        logger.info('Ply %d: %d positions', current_ply, len(frontier))
+        next_frontier = {}
+
+        for key, state in frontier.items():
+            scores = player.score_actions(state)
+            best_action = state.actions[scores.index(max(scores))]
+            entries[key] = best_action.row, best_action.column
+
+            if current_ply == ply - 1:
+                continue
+
+            for action in state.actions:
+                next_state = state.step(action)
+                if next_state.terminal[0]:
+                    continue
+
+                next_key, next_board, _ = canonical_state(next_state)
+                if next_key not in entries:
+                    next_frontier[next_key] = corso.Corso(
+                        next_board, next_state.player_num,
+                        next_state.player_index)
+
+        frontier = next_frontier
+
+    return entries
+
+
+class BookPlayer(corso.Player):
+    """Play from an opening book, fall back to another player.
+
+    The book is opened lazily. If it cannot be opened, the fallback
+    player is always used.
+    """
+    _book: OpeningBook | None = None
+    _book_loaded = False
+
+    def __init__(self, fallback: corso.Player,
+                 path: str | pathlib.Path = DEFAULT_BOOK_PATH):
+        self.fallback = fallback
+        self.path = path
+
+    def __getstate__(self):
+        """Do not pickle the memory map, it is reopened when needed."""
+        state = self.__dict__.copy()
+        state.pop('_book', None)
+        state.pop('_book_loaded', None)
+        return state
+
+    @property
+    def book(self) -> OpeningBook | None:
+        """Opening book, ``None`` if it could not be opened."""
+        if not self._book_loaded:
+            self._book_loaded = True
+            try:
+                self._book = OpeningBook(self.path)
+            except (OSError, ValueError) as exception:
+                logger.warning('Could not load opening book: %s', exception)
+
+        return self._book
+
+    @property
+    def nodes(self) -> int:
+        """Nodes searched by the fallback player, if it counts them."""
+        return getattr(self.fallback, 'nodes', 0)
+
+    def close(self):
+        """Close the fallback player, if it holds resources."""
+        close = getattr(self.fallback, 'close', None)
+        if close is not None:
+            close()
+
+    def select_action(self, state: corso.Corso) -> corso.Action:
+        """Select from the book if possible, otherwise from fallback."""
+        if self.book is not None:
+            action = self.book.lookup(state)
+            if action is not None and action in state.actions:
+                logger.debug('Opening book move: %s', action)
+                return action
+
+        return self.fallback.select_action(state)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        'python -m corsoab.book',
+        description='Generate an opening book for the default 5x5 game.')
+    parser.add_argument('-p', '--ply', type=int, default=DEFAULT_PLY,
+                        help='Number of plies covered by the book. '
+                             f'Defaults to {DEFAULT_PLY}.')
+    parser.add_argument('-d', '--depth', type=int, default=DEFAULT_DEPTH,
+                        help='Depth of the MinMax search used to select '
+                             f'book moves. Defaults to {DEFAULT_DEPTH}.')
+    parser.add_argument('-o', '--output', default=DEFAULT_BOOK_PATH,
+                        type=pathlib.Path,
+                        help='Output file. Defaults to the shipped book.')
+    args = parser.parse_args()
+
+    starting_state = corso.Corso()
+    entries = generate_entries(starting_state, args.ply, args.depth)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    write_book(args.output, entries, starting_state.width,
+               starting_state.height, args.ply, args.depth)
+    logger.info('Written %d positions to %s', len(entries), args.output)
+
+
+if __name__ == '__main__':
+    main()
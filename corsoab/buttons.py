@@ -0,0 +1,341 @@
+"""Debounced, asynchronous input sampling for the bonnet's buttons.
+
+Buttons are sampled on a background thread (:class:`InputSampler`)
+rather than once per frame, so that short presses are never lost and
+their timestamps are accurate. Debounced press and release events are
+pushed to a :class:`collections.deque`, which can be drained from the
+main thread without locking (appends and pops are atomic).
+
+Pins are accessed through a backend. :class:`GPIOBackend` relies on
+``RPi.GPIO`` edge detection callbacks, :class:`DigitalIOBackend` on
+plain sampling through Blinka's ``digitalio`` and
+:class:`FakePinBackend` on nothing at all (for tests and desktop
+experiments). Hardware libraries are only imported by the respective
+backends, so that this module can be imported anywhere.
+"""
+import abc
+import collections
+import enum
+import threading
+import time
+from collections.abc import Callable, Iterator
+from typing import NamedTuple
+
+from .log import logger
+
+DEFAULT_DEBOUNCE = 0.02
+DEFAULT_SAMPLE_INTERVAL = 0.002
+DEFAULT_REPEAT_INTERVAL = 0.1
+
+
+class Button(enum.Enum):
+    """Bonnet buttons enumeration."""
+    A = enum.auto()
+    B = enum.auto()
+    L = enum.auto()
+    R = enum.auto()
+    U = enum.auto()
+    D = enum.auto()
+    C = enum.auto()
+
+
+DIRECTIONAL_BUTTONS = frozenset((Button.L, Button.R, Button.U, Button.D))
+
+# Broadcom (BCM) pin numbers of the bonnet's buttons
+BONNET_PINS = {
+    Button.A: 5,
+    Button.B: 6,
+    Button.L: 27,
+    Button.R: 23,
+    Button.U: 17,
+    Button.D: 22,
+    Button.C: 4,
+}
+
+
+class ButtonEvent(NamedTuple):
+    """Debounced button event.
+
+    ``timestamp`` is given by the sampler's clock (by default
+    :func:`time.monotonic`). Repeated presses of held buttons have
+    ``repeat`` set.
+    """
+    button: Button
+    pressed: bool
+    timestamp: float
+    repeat: bool = False
+
+
+class PinBackend(abc.ABC):
+    """Base class for pin backends.
+
+    Backends report raw (not debounced) button states through
+    :meth:`read`. Backends able to detect edges also implement
+    :meth:`watch`.
+    """
+    buttons: tuple[Button, ...] = tuple(Button)
+
+    @abc.abstractmethod
+    def read(self, button: Button) -> bool:
+        """Get whether a button is currently held down."""
+
+    def watch(self, callback: Callable[[Button], None]) -> bool:
+        """Invoke ``callback`` on each edge of each button.
+
+        Return whether edge detection is supported. If not, buttons
+        must be sampled periodically.
+        """
+        return False
+
+    def close(self):
+        """Release pins."""
+
+
+class DigitalIOBackend(PinBackend):
+    """Sample pins through Blinka's ``digitalio`` (no edge detection)."""
+
+    def __init__(self, pins: dict[Button, int] = BONNET_PINS):
+        import board
+        from digitalio import DigitalInOut, Direction, Pull
+
+        self.buttons = tuple(pins)
+        self._digitals = {}
+        for button, pin in pins.items():
+            digital = DigitalInOut(getattr(board, f'D{pin}'))
+            digital.direction = Direction.INPUT
+            digital.pull = Pull.UP
+            self._digitals[button] = digital
+
+    def read(self, button: Button) -> bool:
+        # Pulled up: pressed buttons read low
+        return not self._digitals[button].value
+
+    def close(self):
+        for digital in self._digitals.values():
+            digital.deinit()
+
+
+class GPIOBackend(PinBackend):
+    """Access pins through ``RPi.GPIO``, using its edge detection."""
+
+    def __init__(self, pins: dict[Button, int] = BONNET_PINS):
+        from RPi import GPIO
+
+        self._gpio = GPIO
+        self._pins = dict(pins)
+        self.buttons = tuple(pins)
+
+        GPIO.setmode(GPIO.BCM)
+        for pin in pins.values():
+            GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+
+    def read(self, button: Button) -> bool:
+        return not self._gpio.input(self._pins[button])
+
+    def watch(self, callback: Callable[[Button], None]) -> bool:
+        for button, pin in self._pins.items():
+            self._gpio.add_event_detect(
+                pin, self._gpio.BOTH,
+                callback=lambda _, button=button: callback(button))
+        return True
+
+    def close(self):
+        for pin in self._pins.values():
+            self._gpio.remove_event_detect(pin)
+        self._gpio.cleanup(tuple(self._pins.values()))
+
+
+class FakePinBackend(PinBackend):
+    """In-memory pins, driven through :meth:`set`.
+
+    If ``edges`` is set, the backend behaves as an edge detecting one,
+    invoking the watch callback on each change.
+    """
+
+    def __init__(self, edges: bool = False):
+        self.edges = edges
+        self._states = {button: False for button in self.buttons}
+        self._callback = None
+
+    def set(self, button: Button, pressed: bool):
+        """Set the raw state of a button."""
+        changed = self._states[button] != pressed
+        self._states[button] = pressed
+
+        if changed and self._callback is not None:
+            self._callback(button)
+
+    def read(self, button: Button) -> bool:
+        return self._states[button]
+
+    def watch(self, callback: Callable[[Button], None]) -> bool:
+        if self.edges:
+            self._callback = callback
+        return self.edges
+
+
+def default_backend() -> PinBackend:
+    """Get the best available hardware backend for the bonnet."""
+    try:
+        return GPIOBackend()
+    except (ImportError, RuntimeError) as exception:
+        logger.debug('RPi.GPIO not available (%s), sampling pins through '
+                     'digitalio', exception)
+        return DigitalIOBackend()
+
+
+class InputSampler:
+    """Debounce buttons from a pin backend, on a background thread.
+
+    Debouncing is leading edge: a change of state is reported as soon
+    as it is seen, then the button is ignored for ``debounce``
+    seconds, after which its state is checked again. Hence, latency is
+    minimal and presses shorter than a frame are still reported.
+
+    If ``repeat_delay`` is given, held buttons among ``repeat_buttons``
+    generate repeated press events after ``repeat_delay`` seconds,
+    every ``repeat_interval`` seconds.
+
+    Events are appended to :attr:`events`, see also :meth:`drain`. If
+    given, ``on_event`` is called (from the sampling thread) after each
+    new event, e.g. to wake up the main loop. The sampler can also be
+    stepped manually, without starting its thread, through
+    :meth:`update` (e.g. with a fake clock).
+    """
+
+    def __init__(self, backend: PinBackend,
+                 debounce: float = DEFAULT_DEBOUNCE,
+                 sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+                 repeat_delay: float | None = None,
+                 repeat_interval: float = DEFAULT_REPEAT_INTERVAL,
+                 repeat_buttons: frozenset[Button] = DIRECTIONAL_BUTTONS,
+                 clock: Callable[[], float] = time.monotonic,
+                 on_event: Callable[[], None] | None = None):
+        self.backend = backend
+        self.debounce = debounce
+        self.sample_interval = sample_interval
+        self.repeat_delay = repeat_delay
+        self.repeat_interval = repeat_interval
+        self.repeat_buttons = repeat_buttons
+        self.clock = clock
+        self.on_event = on_event
+
+        self.events: collections.deque[ButtonEvent] = collections.deque()
+
+        self._states = {button: False for button in backend.buttons}
+        self._locked_until: dict[Button, float] = {}
+        self._next_repeat: dict[Button, float] = {}
+        # Edge callbacks come from a different thread
+        self._lock = threading.Lock()
+
+        self._edges = False
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def pressed(self, button: Button) -> bool:
+        """Get the debounced state of a button."""
+        return self._states[button]
+
+    def drain(self) -> Iterator[ButtonEvent]:
+        """Pop all pending events, oldest first."""
+        while True:
+            try:
+                yield self.events.popleft()
+            except IndexError:
+                return
+
+    def _push(self, event: ButtonEvent):
+        """Queue an event, notify it."""
+        self.events.append(event)
+        if self.on_event is not None:
+            self.on_event()
+
+    def _change(self, button: Button, pressed: bool, now: float):
+        """Handle a raw state read from the backend."""
+        if self._states[button] == pressed:
+            return
+        if self._locked_until.get(button, now) > now:
+            # Bouncing, state is checked again when the lock expires
+            return
+
+        self._states[button] = pressed
+        self._locked_until[button] = now + self.debounce
+        self._push(ButtonEvent(button, pressed, now))
+
+        if (pressed and self.repeat_delay is not None
+                and button in self.repeat_buttons):
+            self._next_repeat[button] = now + self.repeat_delay
+        else:
+            self._next_repeat.pop(button, None)
+
+    def _on_edge(self, button: Button):
+        """Handle an edge detected by the backend."""
+        with self._lock:
+            self._change(button, self.backend.read(button), self.clock())
+        self._wake.set()
+
+    def update(self, now: float | None = None) -> float:
+        """Sample buttons and generate pending events.
+
+        Without edge detection all buttons are sampled, otherwise only
+        the ones whose debounce lock expired. Return the time at
+        which the next update is needed.
+        """
+        if now is None:
+            now = self.clock()
+
+        with self._lock:
+            for button in self.backend.buttons:
+                locked_until = self._locked_until.get(button)
+                if locked_until is not None and locked_until <= now:
+                    del self._locked_until[button]
+                elif self._edges:
+                    continue
+
+                self._change(button, self.backend.read(button), now)
+
+            for button, next_repeat in self._next_repeat.items():
+                if next_repeat <= now:
+                    self._push(ButtonEvent(button, True, now, True))
+                    self._next_repeat[button] = max(
+                        next_repeat + self.repeat_interval, now)
+
+            deadlines = [*self._locked_until.values(),
+                         *self._next_repeat.values()]
+
+        if not self._edges:
+            deadlines.append(now + self.sample_interval)
+        return min(deadlines, default=float('inf'))
+
+    def _run(self):
+        """Sampling thread main loop."""
+        while not self._stop.is_set():
+            deadline = self.update()
+            timeout = None
+            if deadline != float('inf'):
+                timeout = max(deadline - self.clock(), 0)
+
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def start(self):
+        """Start sampling on a background (daemon) thread."""
+        self._edges = self.backend.watch(self._on_edge)
+        logger.debug('Input sampling started (%s)',
+                     'edge detection' if self._edges else 'polling')
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='corsoab-input')
+        self._thread.start()
+
+    def stop(self):
+        """Stop the sampling thread and release the backend."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        self.backend.close()
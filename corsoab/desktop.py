@@ -1,4 +1,10 @@
-"""Desktop specific implementations."""
+"""Desktop specific implementations.
+
+As on the bonnet, the screen is only composed and presented when
+something changes (see :class:`graphics.DirtyRenderLoopProcessor`).
+Since the window system may discard the window's content, exposure and
+resize events trigger a full redraw.
+"""
 import ctypes
 
 import desper
@@ -9,9 +15,23 @@ from . import graphics
 from . import desktop
 from . import game
 
+# Frame interval when idle (see graphics.AdaptiveTimeProcessor). SDL
+# events do not wake up the scheduler, they are just polled less often
+IDLE_INTERVAL = 1 / 20
+
+
+# Window events after which the window's content must be redrawn
+_REDRAW_WINDOW_EVENTS = frozenset((sdl2.SDL_WINDOWEVENT_EXPOSED,
+                                   sdl2.SDL_WINDOWEVENT_SIZE_CHANGED,
+                                   sdl2.SDL_WINDOWEVENT_RESTORED))
+
 
 class InputProcessor(desper.Processor):
-    """Handle input events."""
+    """Handle input events.
+
+    Window exposure and resizing are notified through the
+    ``on_window_redraw`` event.
+    """
     _button_states = {}
 
     def process(self, dt):
@@ -20,6 +40,9 @@ class InputProcessor(desper.Processor):
         while sdl2.SDL_PollEvent(ctypes.byref(event)) != 0:
             if event.type == sdl2.SDL_KEYDOWN and not event.key.repeat:
                 self.world.dispatch('on_key_down', event.key.keysym.scancode)
+            elif (event.type == sdl2.SDL_WINDOWEVENT
+                    and event.window.event in _REDRAW_WINDOW_EVENTS):
+                self.world.dispatch('on_window_redraw')
             elif event.type == sdl2.SDL_QUIT:
                 desper.quit_loop()
 
@@ -33,26 +56,95 @@ class KeyLogger:
         print('key down:', key)
 
 
-@desper.event_handler('render')
-class RenderHandler(desper.Controller):
-    """Actually render screen on ``render`` event."""
+def window_scale(window_width: int, window_height: int) -> int:
+    """Get the largest integer scale of the screen fitting a window."""
+    return max(min(window_width // graphics.BONNET_WIDTH,
+                   window_height // graphics.BONNET_HEIGHT), 1)
+
+
+@desper.event_handler('render', 'on_window_redraw')
+class RenderHandler(graphics.ScreenController):
+    """Actually render screen on ``render`` event.
+
+    Only the region updated during the last screen composition is
+    scaled and updated on the window, by an integer factor (nearest
+    neighbour) and centered. The screen is first converted to the
+    window's pixel format in a cached surface, so that scaling is a
+    plain same format stretch.
+
+    On ``on_window_redraw`` (e.g. exposure or resize), the whole window
+    is redrawn on the next render.
+    """
+    _redraw = True
+
+    def __init__(self):
+        self._converted = None
+
+    def on_window_redraw(self):
+        """Redraw the whole window, during this frame."""
+        self._redraw = True
+        self.world.dispatch('on_dirty_render')
+
+    def _converted_surface(self, screen_surface, window_surface):
+        """Get the cached copy of the screen, in the window's format.
+
+        It is (re)created if the window's format changed, in which case
+        the whole window must be redrawn.
+        """
+        window_format = window_surface.contents.format.contents.format
+        if (self._converted is None
+                or self._converted.contents.format.contents.format
+                != window_format):
+            if self._converted is not None:
+                sdl2.SDL_FreeSurface(self._converted)
+            self._converted = sdl2.SDL_ConvertSurfaceFormat(
+                screen_surface, window_format, 0)
+            self._redraw = True
+
+        return self._converted
 
     def render(self):
         # Retrieve necessary surfaces (window, game screen)
-        screen_surface_entity, _ = self.world.get(graphics.ScreenSurface)[0]
-        screen_surface = self.world.get_component(screen_surface_entity,
-                                                  graphics.LP_SDL_Surface)
+        screen_surface = self.screen.surface
+        updated_rect = self.screen.dirty_region.updated_rect
         window_surface = sdl2.SDL_GetWindowSurface(corsoab.window)
+        converted_surface = self._converted_surface(screen_surface,
+                                                    window_surface)
+
+        if updated_rect is None and not self._redraw:
+            return
+
+        if updated_rect is not None:
+            rect = sdl2.SDL_Rect(*updated_rect)
+            sdl2.SDL_BlitSurface(screen_surface, rect, converted_surface,
+                                 sdl2.SDL_Rect(*updated_rect))
+        if self._redraw:
+            updated_rect = graphics.SCREEN_RECT
+            sdl2.SDL_FillRect(window_surface, None, 0)
 
         # Update window surface
-        sdl2.SDL_BlitScaled(screen_surface, None, window_surface, None)
-        sdl2.SDL_UpdateWindowSurface(corsoab.window)
+        window = window_surface.contents
+        scale = window_scale(window.w, window.h)
+        offset_x = (window.w - graphics.BONNET_WIDTH * scale) // 2
+        offset_y = (window.h - graphics.BONNET_HEIGHT * scale) // 2
+        x, y, width, height = updated_rect
+        window_rect = sdl2.SDL_Rect(offset_x + x * scale,
+                                    offset_y + y * scale, width * scale,
+                                    height * scale)
+        sdl2.SDL_BlitScaled(converted_surface, sdl2.SDL_Rect(*updated_rect),
+                            window_surface, window_rect)
+
+        if self._redraw:
+            sdl2.SDL_UpdateWindowSurface(corsoab.window)
+            self._redraw = False
+        else:
+            sdl2.SDL_UpdateWindowSurfaceRects(corsoab.window, window_rect, 1)
 
 
 def game_world_transformer(handle: desper.WorldHandle,
                            world: desper.World):
     """Instantiate game world (desktop specific)."""
-    world.add_processor(graphics.RenderLoopProcessor())
+    world.add_processor(graphics.DirtyRenderLoopProcessor())
     world.add_processor(desktop.InputProcessor())
 
     world.create_entity(RenderHandler())
@@ -60,3 +152,6 @@ def game_world_transformer(handle: desper.WorldHandle,
     world.create_entity(game.WaitKeyOnGameOver())
 
     # world.create_entity(desktop.KeyLogger())
+
+    # Notify a change to render during the game's first frame
+    world.dispatch('on_dirty_render')
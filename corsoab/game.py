@@ -1,17 +1,22 @@
 import abc
 from collections.abc import Collection
+from concurrent.futures import Future
 from itertools import cycle
-from threading import Thread
 
 import desper
 import corso.model as corso
+from corso.minmax import heuristic
 import sdl2
 
+from . import graphics
+from . import workers
 from .log import logger
 
 
 class GUIPlayer(abc.ABC):
     """Abstract class for players suitable for :class:`GameHandler`."""
+    spec: str | None = None
+    """Description of the player (e.g. ``"mm3"``), if known."""
 
     def start_selection(self, state: corso.Corso):
         pass
@@ -20,6 +25,7 @@ class GUIPlayer(abc.ABC):
 @desper.event_handler('on_key_down')
 class UserPlayer(desper.Controller, GUIPlayer):
     """Corso GUI player for human users."""
+    spec = 'user'
     cursor_x = 0
     cursor_y = 0
     _current_state = None
@@ -36,7 +42,7 @@ class UserPlayer(desper.Controller, GUIPlayer):
         # between multiple UserPlayers.
         self.block_next_frame()
 
-    @desper.coroutine
+    @graphics.coroutine
     def _unblock_next_frame(self):
         """Coroutine: wait one frame and unblock user input."""
         yield
@@ -78,41 +84,173 @@ class UserPlayer(desper.Controller, GUIPlayer):
             self._current_state = None
 
 
+MAX_PONDER_WIDTH = workers.MAX_WORKERS - 1
+"""Speculative searches at once, one worker is kept for actual ones."""
+
+
+def state_key(state: corso.Corso) -> tuple:
+    """Get a hashable key identifying a game state."""
+    return state.board, state.player_index
+
+
+def rank_actions(state: corso.Corso) -> list[corso.Action]:
+    """Sort legal actions, most promising first for the current player.
+
+    Actions are ranked using the heuristic of corso's MinMax player on
+    the resulting states.
+    """
+    sign = 1 if state.player_index == 1 else -1
+    return sorted(state.actions,
+                  key=lambda action: -sign * heuristic(state.step(action)))
+
+
+@desper.event_handler('on_quit', 'on_turn_start', 'on_game_over')
 class LegacyPlayer(desper.Controller, GUIPlayer):
     """Adapt legacy blocking corso.Players to GUI behaviour.
 
-    Player logic is executed on a separate thread and awaited by a
-    polling desper coroutine.
+    Player logic is submitted to a shared executor (see
+    :mod:`workers`), either on a separate thread or process depending
+    on ``backend``. Its completion is notified on the main thread by
+    :class:`CompletionProcessor`, which dispatches the move on the
+    next frame (the frame scheduler is woken up right away). When the
+    game is quit, the current selection is cancelled.
+
+    If ``ponder`` is set, during the opponent's turn the most likely
+    replies (at most ``ponder_width``, see :func:`rank_actions`) are
+    speculatively searched in background. When the actual move is
+    played, the matching result is reused, the others are cancelled
+    (see :func:`workers.cancel`): running searches stop at their next
+    check, if they support it (see :class:`search.Search`). Pondering
+    never takes more than all workers but one, so that the actual
+    search can always start right away.
     """
+    _future: Future | None = None
+    _state: corso.Corso | None = None
 
-    def __init__(self, legacy_player: corso.Player):
+    def __init__(self, legacy_player: corso.Player,
+                 backend: workers.Backend = workers.Backend.THREAD,
+                 ponder: bool = False,
+                 ponder_width: int = MAX_PONDER_WIDTH):
         self.legacy_player = legacy_player
+        self.backend = workers.Backend(backend)
+        self.ponder = ponder
+        self.ponder_width = min(ponder_width, MAX_PONDER_WIDTH)
+
+        self._ponder_futures: dict[tuple, Future] = {}
 
-    def _wrapped_select_action(self, state: corso.Corso,
-                               output: list[corso.Action]):
-        """Run given player's action logic and push result in a list.
+    def _submit(self, state: corso.Corso) -> Future:
+        """Submit an action selection to the executor.
 
-        This method is designed to be run on the separate thread for the
-        legacy player. For convenience, the selected action is pushed
-        into a list, so that the parent thread can access it. To keep
-        it thread safe, the list and the player must keep untouched
-        by the main thread until the selection is over.
+        The frame scheduler is woken up as soon as the selection
+        completes (see :func:`graphics.wake`).
         """
-        output.append(self.legacy_player.select_action(state))
+        future = workers.submit(self.backend,
+                                self.legacy_player.select_action, state,
+                                callback=self._complete_selection)
+        future.add_done_callback(lambda _: graphics.wake())
+        return future
+
+    def _complete_selection(self, future: Future):
+        """Dispatch the selected move, if ``future`` is the current one.
+
+        Speculative and cancelled selections are ignored. Safe to call
+        more than once per future. If the selection failed (e.g. a
+        worker process died), the most promising action according to
+        :func:`rank_actions` is played instead.
+        """
+        if future is not self._future:
+            return
+
+        self._future = None
+        if future.cancelled():
+            return
+
+        try:
+            action = future.result()
+        except Exception:
+            logger.exception('Action selection failed, playing the most '
+                             'promising action instead')
+            action = rank_actions(self._state)[0]
+
+        self.world.dispatch('on_player_move', action)
+
+    @graphics.coroutine
+    def _complete_next_frame(self, future: Future):
+        """Coroutine: complete an already done selection, next frame.
+
+        Its callback may have run already (see :func:`workers.submit`),
+        while it was speculative.
+        """
+        yield
+        self._complete_selection(future)
+
+    def _cancel_pondering(self):
+        """Cancel all speculative searches, stop running ones."""
+        for future in self._ponder_futures.values():
+            workers.cancel(future)
+        self._ponder_futures.clear()
 
-    @desper.coroutine
     def start_selection(self, state: corso.Corso):
-        """Start legacy player on a separate thread, wait for it."""
-        output_action_list = []
-        player_thread = Thread(target=self._wrapped_select_action,
-                               args=(state, output_action_list))
-        player_thread.start()
+        """Submit legacy player's selection to the executor.
+
+        If the state was pondered, reuse its search instead.
+        """
+        self._state = state
+        self._future = self._ponder_futures.pop(state_key(state), None)
+        self._cancel_pondering()
+
+        if self._future is None or self._future.cancelled():
+            self._future = self._submit(state)
+            return
+
+        logger.debug('Pondering hit, reusing speculative search')
+        if self._future.done():
+            self._complete_next_frame(self._future)
+
+    def on_turn_start(self, player: GUIPlayer, state: corso.Corso):
+        """Start pondering if it is an opponent's turn."""
+        if not self.ponder or player is self:
+            return
+
+        self._cancel_pondering()
+
+        for action in rank_actions(state)[:self.ponder_width]:
+            next_state = state.step(action)
+            if next_state.terminal[0]:
+                continue
+
+            self._ponder_futures[state_key(next_state)] = self._submit(
+                next_state)
+
+    def on_game_over(self, *args):
+        """Cancel speculative searches."""
+        self._cancel_pondering()
+
+    def on_quit(self):
+        """Cancel ongoing selection and pondering, if possible.
+
+        Legacy players holding resources can release them in a
+        ``close`` method (e.g. :class:`remote.RemotePlayer`).
+        """
+        if self._future is not None:
+            workers.cancel(self._future)
+
+        self._cancel_pondering()
 
-        while player_thread.is_alive():
-            yield
+        close = getattr(self.legacy_player, 'close', None)
+        if close is not None:
+            close()
 
-        # Retrieve output and notify it
-        self.world.dispatch('on_player_move', output_action_list[0])
+
+class CompletionProcessor(desper.Processor):
+    """Run callbacks of completed worker tasks, on the main thread.
+
+    See :func:`workers.run_callbacks`. Callbacks are queued by worker
+    threads as soon as their task completes, hence nothing is polled.
+    """
+
+    def process(self, dt):
+        workers.run_callbacks()
 
 
 @desper.event_handler('on_player_move')
@@ -137,8 +275,14 @@ class GameHandler(desper.Controller):
         self._current_player_entity = None
 
     def next_player(self):
-        """Start action selection of the next player.."""
-        next(self.players).start_selection(self.state)
+        """Start action selection of the next player.
+
+        Event ``on_turn_start`` is dispatched beforehand, with the
+        player and the current state as parameters.
+        """
+        player = next(self.players)
+        self.world.dispatch('on_turn_start', player, self.state)
+        player.start_selection(self.state)
 
     def on_add(self, *args):
         """Init game loop."""
@@ -148,23 +292,26 @@ class GameHandler(desper.Controller):
 
     def on_player_move(self, action: corso.Action):
         """Apply player move to the game state."""
-        # Notify a change to render during this frame
-        self.world.dispatch('on_dirty_render')
-
         # Step on current state
+        previous_board = self.state.board
         self.state = self.state.step(action)
 
-        # Replace images on grid based on new state
-        for y, row in enumerate(self.state.board):
-            for x, cell in enumerate(row):
-                if cell.player_index == 0:
+        # Replace images on grid, only for the cells that changed.
+        # Cells never go back to empty.
+        for y, (row, previous_row) in enumerate(zip(self.state.board,
+                                                    previous_board)):
+            if row is previous_row:     # Rows are reallocated on change
+                continue
+
+            for x, (cell, previous_cell) in enumerate(zip(row,
+                                                          previous_row)):
+                if cell == previous_cell:
                     continue
 
-                transform = self.world.get_component(self.grid[y][x],
-                                                     desper.Transform2D)
-                self.world.delete_entity(self.grid[y][x])
-                self.grid[y][x] = self.world.create_entity(
-                    transform, self._resource_map[cell])
+                # The sprite notifies the change of this cell
+                sprite = self.world.get_component(self.grid[y][x],
+                                                  graphics.Sprite)
+                sprite.surface = self._resource_map[cell]
 
         # Check for game termination
         terminal_status, winner = self.state.terminal
@@ -195,10 +342,18 @@ class CursorHandler(desper.Controller):
         selected_position = self.world.get_component(
             self.grid[cursor_x][cursor_y], desper.Transform2D).position
 
+        # The sprite notifies the change, at both old and new positions
         self.transform.position = selected_position + self.pixel_offset
 
-        # Notify a change to render during this frame
-        self.world.dispatch('on_dirty_render')
+
+def log_game_over(terminal_status: corso.Terminal, winner: int):
+    """Log the outcome of a game."""
+    # Draws not possible in usual 5x5 2-player games
+    if terminal_status == terminal_status.DRAW:
+        logger.info('It was a draw!')
+
+    if terminal_status == terminal_status.WON:
+        logger.info('Player %d wins', winner)
 
 
 @desper.event_handler('on_key_down', 'on_game_over')
@@ -212,15 +367,10 @@ class WaitKeyOnGameOver:
     def __init__(self, key: int | None = None):
         self.key = key
 
-    @desper.coroutine
+    @graphics.coroutine
     def on_game_over(self, terminal_status: corso.Terminal, winner: int):
         """Log and prepare to quit."""
-        # Draws not possible in usual 5x5 2-player games
-        if terminal_status == terminal_status.DRAW:
-            logger.info('It was a draw!')
-
-        if terminal_status == terminal_status.WON:
-            logger.info('Player %d wins', winner)
+        log_game_over(terminal_status, winner)
 
         yield
 
@@ -1,16 +1,55 @@
 """Graphics rendering powered by SDL."""
+import bisect
 import ctypes
+import functools
+import itertools
+import threading
 import time
+from collections.abc import Hashable
+from typing import NamedTuple
 
 import desper
 import sdl2
 
+from .log import logger
+
 # Basic bonnet size, also used for window/surface dimenions
 BONNET_WIDTH = 128
 BONNET_HEIGHT = 64
 
 LP_SDL_Surface = ctypes.POINTER(sdl2.SDL_Surface)
 
+Rect = tuple[int, int, int, int]
+"""Screen rectangle in the form ``(x, y, width, height)``."""
+
+SCREEN_RECT: Rect = (0, 0, BONNET_WIDTH, BONNET_HEIGHT)
+
+
+def surface_rect(surface: LP_SDL_Surface, position: tuple[int, int]) -> Rect:
+    """Get the rectangle covered by a surface at the given position."""
+    return (*position, surface.contents.w, surface.contents.h)
+
+
+def rect_union(rect1: Rect, rect2: Rect) -> Rect:
+    """Get the smallest rectangle containing both given ones."""
+    x = min(rect1[0], rect2[0])
+    y = min(rect1[1], rect2[1])
+    return (x, y,
+            max(rect1[0] + rect1[2], rect2[0] + rect2[2]) - x,
+            max(rect1[1] + rect1[3], rect2[1] + rect2[3]) - y)
+
+
+def rect_intersection(rect1: Rect, rect2: Rect) -> Rect | None:
+    """Get the intersection of two rectangles, ``None`` if empty."""
+    x = max(rect1[0], rect2[0])
+    y = max(rect1[1], rect2[1])
+    width = min(rect1[0] + rect1[2], rect2[0] + rect2[2]) - x
+    height = min(rect1[1] + rect1[3], rect2[1] + rect2[3]) - y
+
+    if width <= 0 or height <= 0:
+        return None
+    return x, y, width, height
+
 
 class SurfaceHandle(desper.Handle):
     """Handle for SDL surfaces."""
@@ -31,34 +70,233 @@ class ScreenSurface:
     """ID component: identify the screen surface."""
 
 
+@desper.event_handler('on_dirty_render')
+class DirtyRegion:
+    """Component: collect the screen areas invalidated during a frame.
+
+    Meant to be placed on the screen surface entity. Entities notify
+    changes through the ``on_dirty_render`` event, optionally passing
+    the invalidated :attr:`Rect`. Without a rectangle, the whole screen
+    is invalidated. The region starts fully invalidated.
+
+    After each composition, the merged region that was redrawn is
+    available as :attr:`updated_rect`, so that platform specific
+    ``render`` handlers can update only that portion of the screen.
+    """
+
+    def __init__(self):
+        self.rects: list[Rect] = []
+        self.full = True
+        self.updated_rect: Rect | None = None
+
+    def on_dirty_render(self, rect: Rect | None = None):
+        """Handle event: store invalidated rectangle."""
+        if rect is None:
+            self.full = True
+            self.rects.clear()
+        elif not self.full:
+            self.rects.append(rect)
+
+    @property
+    def dirty(self) -> bool:
+        """Whether any area was invalidated since last composition."""
+        return self.full or bool(self.rects)
+
+    @property
+    def dirty_rects(self) -> list[Rect]:
+        """Get invalidated rectangles, clipped to the screen."""
+        if self.full:
+            return [SCREEN_RECT]
+
+        return [clipped for rect in self.rects
+                if (clipped := rect_intersection(rect, SCREEN_RECT))
+                is not None]
+
+    def commit(self, rects: list[Rect]):
+        """Set the given rectangles as updated, clear invalidations."""
+        self.updated_rect = None
+        for rect in rects:
+            if self.updated_rect is None:
+                self.updated_rect = rect
+            else:
+                self.updated_rect = rect_union(self.updated_rect, rect)
+
+        self.rects.clear()
+        self.full = False
+
+
+class RenderList:
+    """Component: draw ordered index of the world's sprites.
+
+    Meant to be placed on the screen surface entity. :class:`Sprite`
+    components register and unregister themselves as they are added to
+    and removed from the world, so that compositing is a single loop
+    over :attr:`sprites`, with no world queries. Sprites are sorted by
+    layer, then by registration order: the draw order does not depend
+    on the world's iteration order.
+    """
+
+    def __init__(self):
+        self.sprites: list[Sprite] = []
+        self._registrations = itertools.count()
+
+    def add(self, sprite: 'Sprite'):
+        """Insert a sprite, after all sprites of lower or equal layer."""
+        sprite.order = next(self._registrations)
+        bisect.insort(self.sprites, sprite, key=Sprite.draw_key)
+
+    def remove(self, sprite: 'Sprite'):
+        self.sprites.remove(sprite)
+
+
+@desper.event_handler('on_remove', 'on_position_change')
+class Sprite(desper.Controller):
+    """Component: a surface drawn at its entity's position, on a layer.
+
+    Lower layers are drawn first. The entity's
+    :class:`desper.Transform2D` must be added before the sprite.
+
+    The covered rectangle is kept in :attr:`rect`, updated as the
+    surface (see :attr:`surface`) or the transform's position change.
+    Such changes are notified through the ``on_dirty_render`` event, at
+    both the old and new rectangles. Sprites with no surface
+    (``None``) are not drawn.
+
+    Sprites are only unlisted from the :class:`RenderList` once the
+    deletion of their entity is finalized (i.e. in the next frame).
+    """
+
+    def __init__(self, surface: LP_SDL_Surface | None = None,
+                 layer: int = 0):
+        self._surface = surface
+        self.layer = layer
+        self.order = 0
+        self.rect: Rect = (0, 0, 0, 0)
+        self._transform: desper.Transform2D | None = None
+        self._render_list: RenderList | None = None
+
+    def draw_key(self) -> tuple[int, int]:
+        """Sorting key, in draw order."""
+        return self.layer, self.order
+
+    def on_add(self, entity, world: desper.World):
+        super().on_add(entity, world)
+        self._transform = world.get_component(entity, desper.Transform2D)
+        self._transform.add_handler(self)
+        _, self._render_list = world.get(RenderList)[0]
+
+        self._update_rect()
+        self._render_list.add(self)
+        self._invalidate()
+
+    def on_remove(self, entity, world: desper.World):
+        self._invalidate()
+        self._render_list.remove(self)
+        self._transform.remove_handler(self)
+
+    def on_position_change(self, position):
+        """Handle transform event: move the covered rectangle."""
+        self._invalidate()
+        self._update_rect()
+        self._invalidate()
+
+    @property
+    def surface(self) -> LP_SDL_Surface | None:
+        return self._surface
+
+    @surface.setter
+    def surface(self, value: LP_SDL_Surface | None):
+        self._invalidate()
+        self._surface = value
+        if self.world is not None:
+            self._update_rect()
+            self._invalidate()
+
+    def _update_rect(self):
+        x, y = self._transform.position
+        if self._surface is None:
+            self.rect = (x, y, 0, 0)
+        else:
+            self.rect = surface_rect(self._surface, (x, y))
+
+    def _invalidate(self):
+        """Notify the currently covered rectangle, if drawn."""
+        if self.world is not None and self._surface is not None:
+            self.world.dispatch('on_dirty_render', self.rect)
+
+
+class Screen(NamedTuple):
+    """Components of the screen surface entity."""
+    entity: Hashable
+    surface: LP_SDL_Surface
+    dirty_region: DirtyRegion
+    render_list: RenderList
+
+
+def find_screen(world: desper.World) -> Screen:
+    """Look up the screen surface entity and its components."""
+    entity, _ = world.get(ScreenSurface)[0]
+    return Screen(entity, world.get_component(entity, LP_SDL_Surface),
+                  world.get_component(entity, DirtyRegion),
+                  world.get_component(entity, RenderList))
+
+
+class ScreenController(desper.Controller):
+    """Controller with cached access to the screen components.
+
+    The screen entity is looked up on first access to :attr:`screen`,
+    as it may be created after the controller. Its components are
+    never replaced.
+    """
+    _screen: Screen | None = None
+
+    @property
+    def screen(self) -> Screen:
+        if self._screen is None:
+            self._screen = find_screen(self.world)
+        return self._screen
+
+
 @desper.event_handler('update_screen_surface')
-class ScreenSurfaceHandler(desper.Controller):
+class ScreenSurfaceHandler(ScreenController):
     """Render world on the screen surface on ``update_screen_surface`` event.
 
     This renders all everything through CPU/RAM on a surface
     identified by the :class:`ScreenSurface` component. The surface is
     not directly rendered to the screen. This is done to provide
     compatibility with the adafruit bonnet rendering implementation.
+
+    Only the areas invalidated in the screen's :class:`DirtyRegion`
+    are cleared and redrawn, blitting only the sprites that intersect
+    them, in :class:`RenderList` order.
     """
 
     def update_screen_surface(self):
-        screen_surface_entity, _ = self.world.get(ScreenSurface)[0]
-        screen_surface = self.world.get_component(screen_surface_entity,
-                                                  LP_SDL_Surface)
-        sdl2.SDL_FillRect(screen_surface, None, 0)
+        screen = self.screen
+        screen_surface = screen.surface
+        sprites = screen.render_list.sprites
 
-        for entity, surface in self.world.get(LP_SDL_Surface):
-            if entity == screen_surface_entity:
-                continue
+        dirty_rects = screen.dirty_region.dirty_rects
+        for dirty_rect in dirty_rects:
+            clip_rect = sdl2.SDL_Rect(*dirty_rect)
+            sdl2.SDL_SetClipRect(screen_surface, clip_rect)
+            sdl2.SDL_FillRect(screen_surface, clip_rect, 0)
 
-            transform: desper.Transform2D = self.world.get_component(
-                entity, desper.Transform2D)
+            clip_x, clip_y, clip_width, clip_height = dirty_rect
+            for sprite in sprites:
+                surface = sprite.surface
+                x, y, width, height = sprite.rect
+                if (surface is None
+                        or x >= clip_x + clip_width or clip_x >= x + width
+                        or y >= clip_y + clip_height
+                        or clip_y >= y + height):
+                    continue
 
-            sdl2.SDL_BlitSurface(
-                surface, None,
-                screen_surface,
-                sdl2.SDL_Rect(*transform.position, surface.contents.w,
-                              surface.contents.h))
+                sdl2.SDL_BlitSurface(surface, None, screen_surface,
+                                     sdl2.SDL_Rect(x, y, width, height))
+
+        sdl2.SDL_SetClipRect(screen_surface, None)
+        screen.dirty_region.commit(dirty_rects)
 
 
 class RenderLoopProcessor(desper.Processor):
@@ -69,18 +307,175 @@ class RenderLoopProcessor(desper.Processor):
         self.world.dispatch('render')
 
 
+@desper.event_handler('on_dirty_render')
+class DirtyRenderLoopProcessor(desper.Processor):
+    """Dispatch ``update_screen_surface``, ``render`` events, if needed.
+
+    This implementation only updates and flips the screen if during the
+    frame a change is notified through the ``on_dirty_render`` event.
+    Since the game is extremely static, with nothing changes for entire
+    seconds, this is a lot of computation saved. On desktop, the window
+    is redrawn on exposure and resize as well (see :mod:`desktop`).
+
+    Finer dirty rectangles, if notified, are handled by
+    :class:`DirtyRegion`.
+
+    The event dispatched to compose the screen can be customized
+    through ``update_event`` (e.g. see :mod:`sprites`).
+    """
+    _dirty = False
+
+    def __init__(self, update_event: str = 'update_screen_surface'):
+        self.update_event = update_event
+
+    def on_dirty_render(self, rect=None):
+        """Store a dirty "bit" for this frame."""
+        self._dirty = True
+
+    def process(self, dt):
+        if not self._dirty:
+            return
+
+        self.world.dispatch(self.update_event)
+        self.world.dispatch('render')
+
+        self._dirty = False
+
+
+_wake_event = threading.Event()
+
+
+_running_coroutines = 0
+
+
+def coroutine(function):
+    """Decorator: same as :func:`desper.coroutine`, tracking coroutines.
+
+    Running coroutines started this way keep
+    :class:`AdaptiveTimeProcessor` awake.
+    """
+    @functools.wraps(function)
+    def start(*args, **kwargs):
+        global _running_coroutines
+        _running_coroutines += 1
+        return _track(function(*args, **kwargs))
+
+    return desper.coroutine(start)
+
+
+def _track(generator):
+    """Run a coroutine, count it as running until it stops."""
+    global _running_coroutines
+    try:
+        return (yield from generator)
+    finally:
+        _running_coroutines -= 1
+
+
+def wake():
+    """Wake up an idle :class:`AdaptiveTimeProcessor` immediately.
+
+    Can be safely called from any thread (e.g. input sampling threads,
+    executor callbacks).
+    """
+    _wake_event.set()
+
+
+@desper.event_handler('on_quit')
 class TimeProcessor(desper.Processor):
-    """Wait based on the given framerate cap."""
+    """Wait based on the given framerate cap.
+
+    Wakeups (i.e. frames) and CPU time of the process are measured
+    from the processor's creation, and logged on quit.
+    """
 
     def __init__(self, interval=1 / 60):
         self.interval = interval
         self._start_time = time.perf_counter_ns()
 
+        self.wakeups = 0
+        self._creation_time = time.perf_counter()
+        self._creation_cpu_time = time.process_time()
+
+    @property
+    def elapsed_time(self) -> float:
+        """Wall time elapsed since creation, in seconds."""
+        return time.perf_counter() - self._creation_time
+
+    @property
+    def cpu_time(self) -> float:
+        """CPU time spent by the process since creation, in seconds."""
+        return time.process_time() - self._creation_cpu_time
+
+    @property
+    def wakeups_per_second(self) -> float:
+        """Average wakeups per second since creation."""
+        return self.wakeups / max(self.elapsed_time, 1e-9)
+
+    def on_quit(self):
+        """Log measured statistics."""
+        logger.info('%s: %.1f wakeups/s, %.2fs CPU time over %.1fs (%.1f%%)',
+                    type(self).__name__, self.wakeups_per_second,
+                    self.cpu_time, self.elapsed_time,
+                    100 * self.cpu_time / max(self.elapsed_time, 1e-9))
+
     def process(self, _):
         processing_time = (time.perf_counter_ns() - self._start_time) * 1e-9
         time.sleep(max(self.interval - processing_time, 0.))
 
         self._start_time = time.perf_counter_ns()
+        self.wakeups += 1
+
+
+@desper.event_handler('on_quit', 'on_dirty_render')
+class AdaptiveTimeProcessor(TimeProcessor):
+    """Framerate cap that sleeps longer when the game is idle.
+
+    The game is idle when no ``on_dirty_render`` was dispatched since
+    the last frame and no coroutine started by :func:`coroutine` is
+    running. Background work (e.g. AI searches) does not keep it
+    awake: it calls :func:`wake` when done.
+
+    When idle, the next frame waits for ``idle_interval`` seconds, or
+    indefinitely if ``None``. In both cases it is started as soon as
+    :func:`wake` is called (e.g. on input or AI completion). Blocking
+    indefinitely is only safe if every input source calls
+    :func:`wake`.
+    """
+    _active = True
+
+    def __init__(self, interval=1 / 60, idle_interval: float | None = None):
+        super().__init__(interval)
+        self.idle_interval = idle_interval
+        self.idle_frames = 0
+
+    def on_dirty_render(self, rect=None):
+        """Handle event: the game is not idle."""
+        self._active = True
+
+    @property
+    def idle(self) -> bool:
+        """Whether the game is idle, see class documentation."""
+        return not self._active and not _running_coroutines
+
+    def process(self, _):
+        if not self.idle:
+            _wake_event.clear()
+            super().process(_)
+            self._active = False
+            return
+
+        processing_time = (time.perf_counter_ns() - self._start_time) * 1e-9
+        timeout = None
+        if self.idle_interval is not None:
+            timeout = max(self.idle_interval - processing_time, 0.)
+
+        _wake_event.wait(timeout)
+        _wake_event.clear()
+
+        self._start_time = time.perf_counter_ns()
+        self.wakeups += 1
+        self.idle_frames += 1
 
 
 def build_surface(width: int, height: int, color: int) -> LP_SDL_Surface:
@@ -0,0 +1,212 @@
+"""Headless implementations: render into memory, no window or bonnet.
+
+The screen is rendered to a :class:`FakeSSD1306`, which emulates the
+display's graphics RAM and counts the traffic it receives, as if it
+was connected over I2C. Meant for benchmarks and automated checks on
+machines with no display (see ``benchmarks.game``).
+"""
+from collections.abc import Iterable
+
+import desper
+import corso.model as corso
+
+from . import game
+from . import graphics
+from . import sprites
+from .ssd1306 import (PAGE_HEIGHT, SET_COL_ADDR, SET_PAGE_ADDR,
+                      DisplayWriter, RenderHandler)
+
+SET_DISP = 0xAE
+
+# Bytes following each command that takes arguments (among the ones
+# that are emulated)
+_COMMAND_ARGUMENTS = {SET_COL_ADDR: 2, SET_PAGE_ADDR: 2}
+
+
+class _FakeI2CDevice:
+    """Minimal stand-in for ``adafruit_bus_device.i2c_device``."""
+
+    def __init__(self, display: 'FakeSSD1306'):
+        self.display = display
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def write(self, data):
+        self.display.receive(bytes(data))
+
+
+class FakeSSD1306:
+    """In-memory SSD1306, mimicking adafruit's I2C driver.
+
+    The buffer layout and the ``show``/``write_cmd`` API are the same
+    as ``adafruit_ssd1306.SSD1306_I2C``. Received data is written to
+    :attr:`gram` honouring column and page address commands
+    (horizontal addressing mode), so that the emulated display content
+    can be compared with the buffer.
+
+    Traffic is tracked in :attr:`bytes_sent` (bytes on the bus, I2C
+    control bytes included), :attr:`transactions` and :attr:`shows`.
+    """
+    page_addressing = False
+
+    def __init__(self, width: int = graphics.BONNET_WIDTH,
+                 height: int = graphics.BONNET_HEIGHT):
+        self.width = width
+        self.height = height
+        self.pages = height // PAGE_HEIGHT
+        self.column_offset = (128 - width) // 2
+
+        self.buffer = bytearray(self.pages * width + 1)
+        self.buffer[0] = 0x40
+        self.i2c_device = _FakeI2CDevice(self)
+
+        self.gram = bytearray(self.pages * width)
+        self.power = True
+        self._columns = (self.column_offset, self.column_offset + width - 1)
+        self._page_range = (0, self.pages - 1)
+        self._column = self._columns[0]
+        self._page = 0
+        self._command: list[int] = []
+
+        self.bytes_sent = 0
+        self.transactions = 0
+        self.shows = 0
+
+    def reset_stats(self):
+        """Reset traffic statistics."""
+        self.bytes_sent = self.transactions = self.shows = 0
+
+    def write_cmd(self, cmd: int):
+        """Send a command byte (with its control byte)."""
+        self.receive(bytes((0x80, cmd)))
+
+    def show(self):
+        """Send the whole buffer, as adafruit's driver does."""
+        self.shows += 1
+        self.write_cmd(SET_COL_ADDR)
+        self.write_cmd(self.column_offset)
+        self.write_cmd(self.column_offset + self.width - 1)
+        self.write_cmd(SET_PAGE_ADDR)
+        self.write_cmd(0)
+        self.write_cmd(self.pages - 1)
+        with self.i2c_device:
+            self.i2c_device.write(self.buffer)
+
+    def poweroff(self):
+        self.write_cmd(SET_DISP)
+        self.power = False
+
+    def receive(self, data: bytes):
+        """Handle an I2C transaction: a control byte, then payload."""
+        self.bytes_sent += len(data)
+        self.transactions += 1
+
+        if data[0] == 0x40:
+            for value in data[1:]:
+                self._write_gram(value)
+        else:
+            self._handle_command(data[1])
+
+    def _handle_command(self, byte: int):
+        """Interpret address commands, ignore anything else."""
+        self._command.append(byte)
+        command = self._command[0]
+        if len(self._command) <= _COMMAND_ARGUMENTS.get(command, 0):
+            return
+
+        if command == SET_COL_ADDR:
+            self._columns = tuple(self._command[1:])
+            self._column = self._columns[0]
+        elif command == SET_PAGE_ADDR:
+            self._page_range = tuple(self._command[1:])
+            self._page = self._page_range[0]
+        self._command.clear()
+
+    def _write_gram(self, value: int):
+        """Write a data byte, advance the address (horizontal mode)."""
+        self.gram[self._page * self.width
+                  + self._column - self.column_offset] = value
+
+        self._column += 1
+        if self._column > self._columns[1]:
+            self._column = self._columns[0]
+            self._page += 1
+            if self._page > self._page_range[1]:
+                self._page = self._page_range[0]
+
+    @property
+    def synced(self) -> bool:
+        """Whether the emulated display shows the current buffer."""
+        return self.gram == self.buffer[1:]
+
+
+class ScriptedPlayer(desper.Controller, game.GUIPlayer):
+    """Play predetermined actions, one per turn.
+
+    Each move is notified one frame after the selection starts, as a
+    real player would do.
+    """
+
+    def __init__(self, actions: Iterable[corso.Action]):
+        self.actions = iter(actions)
+
+    @graphics.coroutine
+    def start_selection(self, state: corso.Corso):
+        """Wait a frame, then play the next scripted action."""
+        yield
+        self.world.dispatch('on_player_move', next(self.actions))
+
+
+@desper.event_handler('on_game_over')
+class QuitOnGameOver:
+    """Log the winner and quit once the game is over (no input)."""
+
+    @graphics.coroutine
+    def on_game_over(self, terminal_status: corso.Terminal, winner: int):
+        """Wait a frame, so that the last move is rendered, and quit."""
+        game.log_game_over(terminal_status, winner)
+
+        yield
+        desper.quit_loop()
+
+
+def game_world_transformer(handle: desper.WorldHandle, world: desper.World,
+                           display: FakeSSD1306 | None = None,
+                           native_sprites: bool = False,
+                           display_writer: bool = False):
+    """Instantiate game world (headless).
+
+    If not given, a new :class:`FakeSSD1306` is used as display. If
+    ``native_sprites`` is set, the screen is composed in page layout
+    (see :mod:`sprites`), otherwise through SDL as on desktop. If
+    ``display_writer`` is set as well, frames are sent from a
+    dedicated thread as on bonnet (see :class:`DisplayWriter`),
+    otherwise they are composed straight into the display's buffer.
+    """
+    if display is None:
+        display = FakeSSD1306()
+
+    if native_sprites:
+        world.add_processor(graphics.DirtyRenderLoopProcessor(
+            'update_framebuffer'))
+        if display_writer:
+            framebuffer = sprites.PageFramebuffer(display.width,
+                                                  display.height)
+            world.create_entity(sprites.PageCompositor(framebuffer))
+            world.create_entity(sprites.WriterRenderHandler(
+                framebuffer, DisplayWriter(display)))
+        else:
+            world.create_entity(sprites.DisplayCompositor(display))
+            world.create_entity(sprites.FramebufferRenderHandler(display))
+    else:
+        world.add_processor(graphics.DirtyRenderLoopProcessor())
+        world.create_entity(RenderHandler(display))
+
+    world.create_entity(QuitOnGameOver())
+
+    # Notify a change to render during the game's first frame
+    world.dispatch('on_dirty_render')
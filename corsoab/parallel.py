@@ -0,0 +1,203 @@
+"""Root-parallel MinMax search, on a process pool.
+
+:class:`ParallelMinMaxPlayer` plays as a MinMax player of the same
+depth (same scores, same policy), but root actions are searched by a
+pool of worker processes, each with its own transposition table.
+
+Workers share the best root score found so far, through shared
+memory. Root actions are searched with an alpha-beta window just wide
+enough for their score to be exact if it can matter: actions scoring
+much lower than the best one have no weight in the softmax policy, so
+an upper bound is enough. Searches only reuse table entries of the
+exact requested depth, so that scores do not depend on which worker
+searched what.
+
+With a single worker (e.g. on single-core hardware), root actions are
+searched in the calling thread instead.
+"""
+import concurrent.futures
+import math
+import multiprocessing
+import queue
+import threading
+
+import corso.model as corso
+from corso.minmax import TERMINAL_SCORE
+
+from . import bitboard
+from . import search
+from . import workers
+from .log import logger
+from .workers import MAX_WORKERS
+
+SOFTMAX_CUTOFF = 800.
+"""Scores this many temperatures below the best one have no weight.
+
+The corresponding softmax numerator, ``exp(-SOFTMAX_CUTOFF)``,
+underflows to zero.
+"""
+BOUND_SLOTS = 16
+"""Searches of a player that can share bounds at the same time.
+
+Concurrent searches (e.g. when pondering) beyond this number are run
+with no shared bounds.
+"""
+
+_bounds = None
+"""Shared bounds of the pool, in worker processes."""
+
+
+def _init_worker(bounds):
+    """Keep a reference to the shared bounds, in worker processes."""
+    global _bounds
+    _bounds = bounds
+
+
+def score_root_action(table_name: str, table_capacity: int,
+                      bitboards: bool, root: corso.Corso, action,
+                      depth: int, margin: float,
+                      best: float = -math.inf) -> tuple[float, int]:
+    """Score a root action, from the point of view of the root player.
+
+    ``best`` is the best score found so far among the root actions. If
+    the action scores ``margin`` lower than that, only an upper bound
+    of its score is returned. Return the score and the number of nodes
+    searched.
+    """
+    table = search.get_table(table_name, table_capacity)
+    table.new_search()
+    root_search = search.new_search(table, bitboards, exact_depth=True)
+
+    state = root.step(action)
+    if root.player_index == 1:
+        score = root_search.score(state, depth - 1,
+                                  alpha=max(-TERMINAL_SCORE, best - margin))
+    else:
+        score = -root_search.score(state, depth - 1,
+                                   beta=min(TERMINAL_SCORE, margin - best))
+
+    return score, root_search.nodes
+
+
+def _score_shared(*arguments, slot: int | None) -> tuple[float, int]:
+    """Run :func:`score_root_action` in a worker, sharing its bound.
+
+    ``_bounds[slot]`` holds the best score of the search, and is
+    updated. No bound is shared if ``slot`` is ``None``.
+    """
+    if slot is None:
+        return score_root_action(*arguments)
+
+    score, nodes = score_root_action(*arguments, _bounds[slot])
+    with _bounds.get_lock():
+        _bounds[slot] = max(_bounds[slot], score)
+    return score, nodes
+
+
+class ParallelMinMaxPlayer(search.CachedMinMaxPlayer):
+    """MinMax player searching root actions on a process pool.
+
+    Same as :class:`search.CachedMinMaxPlayer`, with exact depth
+    scores. ``workers`` defaults to, and is capped by, the number of
+    CPUs. With a single worker, no pool (nor shared memory) is
+    created.
+
+    Root actions are submitted best first according to the heuristic,
+    so that a good bound is shared early. The pool is created on the
+    first move and lives until :meth:`close`.
+    """
+
+    def __init__(self, depth: int = 3, workers: int | None = None,
+                 table_capacity: int = search.DEFAULT_TABLE_CAPACITY,
+                 temperature: float = search.DEFAULT_TEMPERATURE,
+                 **kwargs):
+        super().__init__(depth, table_capacity, temperature=temperature,
+                         **kwargs)
+        self.workers = min(workers or MAX_WORKERS, MAX_WORKERS)
+
+        self._bounds = None
+        self._free_slots = queue.SimpleQueue()
+        for slot in range(BOUND_SLOTS):
+            self._free_slots.put(slot)
+        self._executor = None
+        # Concurrent searches (e.g. pondering) may start the pool
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> concurrent.futures.ProcessPoolExecutor:
+        """Retrieve the pool, create it if needed."""
+        with self._executor_lock:
+            if self._executor is None:
+                if self._bounds is None:
+                    self._bounds = multiprocessing.Array('d', BOUND_SLOTS)
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    self.workers, initializer=_init_worker,
+                    initargs=(self._bounds,))
+                logger.debug('Started %d search workers', self.workers)
+
+            return self._executor
+
+    def score_actions(self, state: corso.Corso) -> list[float]:
+        """Compute the MinMax scores of all legal actions, in parallel.
+
+        Scores are from the point of view of the current player
+        (higher is better). Scores of actions that have no weight in
+        the policy are upper bounds.
+        """
+        root = self._root(state)
+        actions = root.actions
+        heuristic = (bitboard.heuristic if self.bitboards
+                     else search.heuristic)
+        sign = 1 if root.player_index == 1 else -1
+        order = sorted(range(len(actions)),
+                       key=lambda index: -sign * heuristic(
+                           root.step(actions[index])))
+
+        margin = SOFTMAX_CUTOFF * self.temperature
+        arguments = (self.table_name, self.table_capacity, self.bitboards,
+                     root)
+
+        scores = [0.] * len(actions)
+        nodes = 0
+        if self.workers <= 1:
+            best = -math.inf
+            for index in order:
+                scores[index], action_nodes = score_root_action(
+                    *arguments, actions[index], self.depth, margin, best)
+                best = max(best, scores[index])
+                nodes += action_nodes
+        else:
+            executor = self._get_executor()
+            try:
+                slot = self._free_slots.get_nowait()
+                self._bounds[slot] = -math.inf
+            except queue.Empty:
+                slot = None
+
+            try:
+                futures = {executor.submit(_score_shared, *arguments,
+                                           actions[index], self.depth,
+                                           margin, slot=slot): index
+                           for index in order}
+                for future, index in futures.items():
+                    # Pool tasks cannot see this task's cancellation
+                    if workers.cancellation_requested():
+                        for pending in futures:
+                            pending.cancel()
+                        raise search.SearchCancelled
+                    scores[index], action_nodes = future.result()
+                    nodes += action_nodes
+            finally:
+                if slot is not None:
+                    self._free_slots.put(slot)
+
+        self.nodes += nodes
+        logger.debug('Parallel MinMax: %d nodes searched by %d workers',
+                     nodes, self.workers)
+        return scores
+
+    def close(self):
+        """Shut down the pool, if any."""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,67 @@
+"""Parsing of AI player specifications.
+
+Extends the player types understood by corso's CLI
+(:func:`corso.cli.parse_player`) with the ones implemented by this
+package.
+"""
+import re
+
+import corso.model as corso
+
+from . import search
+
+CACHED_MINMAX_PLAYER_RE = re.compile(r'tt((?:[1-9]\d*)|)')
+CACHED_MINMAX_DEFAULT_DEPTH = 3
+ITERATIVE_DEEPENING_PLAYER_RE = re.compile(r'id((?:[1-9]\d*)|)')
+ITERATIVE_DEEPENING_DEFAULT_BUDGET = 1000
+PARALLEL_MINMAX_PLAYER_RE = re.compile(r'pmm((?:[1-9]\d*)|)(?::([1-9]\d*))?')
+PARALLEL_MINMAX_DEFAULT_DEPTH = 3
+
+
+def parse_legacy_player(player_type: str) -> corso.Player:
+    """Create a (blocking) player based on its string description.
+
+    Supported entries, in addition to corso's ones::
+    * ``ttX``, a MinMax player with depth X (defaults to 3), keeping a
+        transposition table across moves (see
+        :class:`search.CachedMinMaxPlayer`).
+    * ``idT``, a MinMax player searching as deep as possible within T
+        milliseconds per move (defaults to 1000, see
+        :class:`search.IterativeDeepeningPlayer`).
+    * ``pmmX[:W]``, a MinMax player with depth X (defaults to 3),
+        searching on W worker processes (defaults to the number of
+        CPUs, see :class:`parallel.ParallelMinMaxPlayer`).
+
+    The parsing process is case insensitive.
+    """
+    player_type = player_type.lower()
+
+    if (tt_match := CACHED_MINMAX_PLAYER_RE.fullmatch(player_type)):
+        depth = CACHED_MINMAX_DEFAULT_DEPTH
+        if tt_match.group(1):
+            depth = int(tt_match.group(1))
+
+        return search.CachedMinMaxPlayer(depth)
+
+    if (id_match := ITERATIVE_DEEPENING_PLAYER_RE.fullmatch(player_type)):
+        budget = ITERATIVE_DEEPENING_DEFAULT_BUDGET
+        if id_match.group(1):
+            budget = int(id_match.group(1))
+
+        return search.IterativeDeepeningPlayer(budget / 1000)
+
+    if (pmm_match := PARALLEL_MINMAX_PLAYER_RE.fullmatch(player_type)):
+        depth = PARALLEL_MINMAX_DEFAULT_DEPTH
+        if pmm_match.group(1):
+            depth = int(pmm_match.group(1))
+
+        workers = None
+        if pmm_match.group(2):
+            workers = int(pmm_match.group(2))
+
+        # Process pools are only needed by these players
+        from . import parallel
+        return parallel.ParallelMinMaxPlayer(depth, workers)
+
+    from corso.cli import parse_player as corso_parse_player
+    return corso_parse_player(player_type)
@@ -0,0 +1,182 @@
+"""Opt-in timing instrumentation for the game world.
+
+A :class:`Profiler` wraps the ``process`` method of each processor,
+the world's ``dispatch`` method (i.e. every event, such as
+``update_screen_surface``, ``render`` or ``on_player_move``) and the
+world's ``process`` method (whole frames). Latencies are collected in
+logarithmic histograms (see :class:`Histogram`), so that the overhead
+is a couple of clock reads and an integer increment per call.
+
+Timings are inclusive: an event dispatched while processing (e.g.
+``render``, dispatched by the render loop processor) is accounted for
+in both the event and the processor.
+
+A summary of the last period is logged every ``summary_interval``
+seconds, and all the histograms can be dumped to a JSON file (see
+:meth:`Profiler.dump`).
+"""
+import json
+import pathlib
+import time
+from functools import wraps
+
+import desper
+
+from .log import logger
+
+DEFAULT_SUMMARY_INTERVAL = 10.
+DEFAULT_PROFILE_PATH = 'corsoab-profile.json'
+SUMMARY_ENTRIES = 8
+
+
+class Histogram:
+    """Latency histogram, with power of two nanoseconds buckets.
+
+    Bucket ``i`` counts durations in the range ``[2**(i-1), 2**i)``
+    nanoseconds. Percentiles are hence approximated by excess, at
+    most by a factor of two.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * 64
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, duration_ns: int):
+        """Record a duration, in nanoseconds."""
+        self.buckets[min(duration_ns.bit_length(), 63)] += 1
+        self.count += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+
+    @property
+    def mean_ns(self) -> float:
+        """Average duration, in nanoseconds."""
+        if not self.count:
+            return 0.
+        return self.total_ns / self.count
+
+    def percentile_ns(self, percentile: float) -> int:
+        """Get the upper bound of the bucket containing a percentile."""
+        threshold = self.count * percentile / 100
+        cumulated = 0
+        for index, bucket in enumerate(self.buckets):
+            cumulated += bucket
+            if bucket and cumulated >= threshold:
+                return min(2 ** index, self.max_ns)
+        return 0
+
+    def to_dict(self) -> dict:
+        """Get a serializable representation."""
+        return {'count': self.count, 'total_ns': self.total_ns,
+                'max_ns': self.max_ns, 'mean_ns': self.mean_ns,
+                'p50_ns': self.percentile_ns(50),
+                'p95_ns': self.percentile_ns(95),
+                'p99_ns': self.percentile_ns(99),
+                'buckets': {f'<{2 ** index}ns': bucket
+                            for index, bucket in enumerate(self.buckets)
+                            if bucket}}
+
+
+class Profiler:
+    """Collect latency histograms of a world's processors and events.
+
+    Histograms are named ``process:<ProcessorClass>``,
+    ``event:<event_name>`` and ``frame``. Cumulative histograms are
+    kept in :attr:`histograms`, while the ones of the current summary
+    period are in :attr:`period_histograms`.
+    """
+
+    def __init__(self, summary_interval: float = DEFAULT_SUMMARY_INTERVAL):
+        self.summary_interval = summary_interval
+        self.histograms: dict[str, Histogram] = {}
+        self.period_histograms: dict[str, Histogram] = {}
+        self._period_start = time.perf_counter()
+
+    def record(self, name: str, duration_ns: int):
+        """Record a duration for the given name."""
+        for histograms in (self.histograms, self.period_histograms):
+            histogram = histograms.get(name)
+            if histogram is None:
+                histogram = histograms[name] = Histogram()
+            histogram.record(duration_ns)
+
+    def _timed(self, name: str, function):
+        """Wrap a function so that each call is recorded under a name."""
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter_ns() - start)
+
+        return wrapper
+
+    def install(self, world: desper.World):
+        """Instrument a world (its current processors and all events)."""
+        for processor in world.processors:
+            processor.process = self._timed(
+                f'process:{type(processor).__name__}', processor.process)
+
+        dispatch = world.dispatch
+
+        def timed_dispatch(event_name, *args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                dispatch(event_name, *args, **kwargs)
+            finally:
+                self.record(f'event:{event_name}',
+                            time.perf_counter_ns() - start)
+
+        world.dispatch = timed_dispatch
+
+        process = world.process
+
+        def timed_process(dt=1):
+            start = time.perf_counter_ns()
+            process(dt)
+            self.record('frame', time.perf_counter_ns() - start)
+
+            if time.perf_counter() - self._period_start \
+                    >= self.summary_interval:
+                self.log_summary()
+
+        world.process = timed_process
+
+    def log_summary(self):
+        """Log the costliest entries of the period, start a new one."""
+        elapsed = time.perf_counter() - self._period_start
+        entries = sorted(self.period_histograms.items(),
+                         key=lambda item: item[1].total_ns, reverse=True)
+
+        lines = [f'{name:<40} {histogram.count:>7} '
+                 f'{histogram.mean_ns / 1e3:>10.1f} '
+                 f'{histogram.percentile_ns(95) / 1e3:>10.1f} '
+                 f'{histogram.max_ns / 1e3:>10.1f}'
+                 for name, histogram in entries[:SUMMARY_ENTRIES]]
+        logger.info('Profile of the last %.1fs:\n%-40s %7s %10s %10s %10s\n%s',
+                    elapsed, 'name', 'calls', 'mean us', 'p95 us', 'max us',
+                    '\n'.join(lines))
+
+        self.period_histograms = {}
+        self._period_start = time.perf_counter()
+
+    def dump(self, path: str | pathlib.Path):
+        """Write all cumulative histograms to a JSON file."""
+        with open(path, 'w') as file:
+            json.dump({name: histogram.to_dict() for name, histogram
+                       in sorted(self.histograms.items())}, file, indent=2)
+        logger.info('Profile written to %s', path)
+
+
+def world_transformer(handle: desper.WorldHandle, world: desper.World,
+                      profiler: Profiler):
+    """Install a profiler on the world.
+
+    Meant to be the last transformer, so that all processors are
+    instrumented.
+    """
+    profiler.install(world)
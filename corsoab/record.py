@@ -0,0 +1,211 @@
+"""Compact game records, and their replay through the game world.
+
+A record starts with a header (see :data:`HEADER_STRUCT`) holding the
+board size and the number of players, followed by the players' specs
+(e.g. ``"mm3"``), each as a length prefixed UTF-8 string. Then, each
+move takes a single byte, ``row << 4 | column``: the player of each
+move is implied by the turn order. Moves are appended as the game
+goes (see :class:`GameRecorder`), on an unbuffered file, so that a
+record is always complete up to the last move.
+
+Records are replayed by a :class:`Replayer`, which feeds the
+moves to :class:`game.GameHandler` as if they were played by
+:class:`ReplayPlayer` instances. In fast-forward mode, many moves are
+applied per frame and only the resulting position is rendered.
+"""
+import pathlib
+import struct
+from collections.abc import Iterable, Iterator
+from typing import NamedTuple
+
+import desper
+import corso.model as corso
+
+from . import game
+from . import graphics
+from .log import logger
+
+MAGIC = b'CRSOGAME'
+VERSION = 1
+HEADER_STRUCT = '<8sBBBB'
+"""Magic, version, board width, board height, number of players."""
+
+DEFAULT_RECORD_SUFFIX = '.corso'
+DEFAULT_MOVE_INTERVAL = 0.5
+MAX_BOARD_SIZE = 16
+
+
+def encode_move(row: int, column: int) -> int:
+    """Pack a move in a byte."""
+    return row << 4 | column
+
+
+def decode_move(value: int) -> tuple[int, int]:
+    """Unpack a move byte, as ``(row, column)``."""
+    return value >> 4, value & 0xF
+
+
+def _encode_header(width: int, height: int, specs: Iterable[str]) -> bytes:
+    """Build a record header."""
+    if max(width, height) > MAX_BOARD_SIZE:
+        raise ValueError(f'boards larger than {MAX_BOARD_SIZE} cells per '
+                         'side cannot be recorded')
+
+    specs = [spec.encode() for spec in specs]
+    header = struct.pack(HEADER_STRUCT, MAGIC, VERSION, width, height,
+                         len(specs))
+    return header + b''.join(bytes((len(spec),)) + spec for spec in specs)
+
+
+class GameRecord(NamedTuple):
+    """Content of a record file."""
+    width: int
+    height: int
+    players: tuple[str, ...]
+    moves: tuple[tuple[int, int], ...]
+
+    def actions(self) -> Iterator[corso.Action]:
+        """Replay moves on the model, yield the corresponding actions.
+
+        Raise ``ValueError`` on illegal moves.
+        """
+        board = ((corso.EMPTY_CELL,) * self.width,) * self.height
+        state = corso.Corso(board, player_num=len(self.players))
+        for row, column in self.moves:
+            action = corso.Action(state.player_index, row, column)
+            if action not in state.actions:
+                raise ValueError(f'illegal move {row}:{column} in record')
+
+            yield action
+            state = state.step(action)
+
+
+def read_record(path: str | pathlib.Path) -> GameRecord:
+    """Read a whole record file."""
+    data = pathlib.Path(path).read_bytes()
+
+    header_size = struct.calcsize(HEADER_STRUCT)
+    magic, version, width, height, player_count = struct.unpack_from(
+        HEADER_STRUCT, data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'{path} is not a game record (version {VERSION})')
+
+    offset = header_size
+    players = []
+    for _ in range(player_count):
+        length = data[offset]
+        players.append(data[offset + 1:offset + 1 + length].decode())
+        offset += 1 + length
+
+    return GameRecord(width, height, tuple(players),
+                      tuple(map(decode_move, data[offset:])))
+
+
+def write_record(path: str | pathlib.Path, record: GameRecord):
+    """Write a whole record file at once."""
+    pathlib.Path(path).write_bytes(
+        _encode_header(record.width, record.height, record.players)
+        + bytes(encode_move(row, column) for row, column in record.moves))
+
+
+@desper.event_handler('on_player_move', 'on_quit')
+class GameRecorder:
+    """Append moves to a record file, as they are played.
+
+    The header is written on creation. The file is unbuffered: each
+    move is a single one byte write. It is closed on quit only, as the
+    last move may be handled after ``on_game_over``.
+    """
+
+    def __init__(self, path: str | pathlib.Path, width: int, height: int,
+                 specs: Iterable[str]):
+        self.path = pathlib.Path(path)
+        self.file = open(self.path, 'wb', buffering=0)
+        self.file.write(_encode_header(width, height, specs))
+
+    def on_player_move(self, action: corso.Action):
+        """Append the move."""
+        if not self.file.closed:
+            self.file.write(bytes((encode_move(action.row,
+                                               action.column),)))
+
+    def on_quit(self):
+        """Close the record, even if the game is not over."""
+        self.close()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+            logger.info('Game recorded to %s', self.path)
+
+
+class ReplayPlayer(game.GUIPlayer):
+    """Stand-in for a recorded player, see :class:`Replayer`."""
+
+    def __init__(self, spec: str):
+        self.spec = spec
+
+
+class Replayer(desper.Controller):
+    """Feed recorded moves to the game, as if they were played.
+
+    A move is played every ``move_interval`` seconds. If
+    ``move_interval`` is zero (fast-forward), ``moves_per_frame`` moves
+    are played each frame instead (``None`` for all of them, in the
+    first frame). Rendering happens once per frame, so that only the
+    last position of each frame is drawn.
+
+    Moves are played by a coroutine, which also keeps an adaptive
+    scheduler awake (see :class:`graphics.AdaptiveTimeProcessor`).
+    """
+
+    def __init__(self, actions: Iterable[corso.Action],
+                 move_interval: float = DEFAULT_MOVE_INTERVAL,
+                 moves_per_frame: int | None = 1):
+        self.actions = actions
+        self.move_interval = move_interval
+        self.moves_per_frame = moves_per_frame
+
+    def on_add(self, entity, world: desper.World):
+        super().on_add(entity, world)
+        self.replay()
+
+    @graphics.coroutine
+    def replay(self):
+        """Coroutine: play all moves, paced."""
+        for count, action in enumerate(self.actions, 1):
+            self.world.dispatch('on_player_move', action)
+
+            if self.move_interval:
+                yield self.move_interval
+            elif (self.moves_per_frame is not None
+                    and count % self.moves_per_frame == 0):
+                yield
+
+
+def players(record: GameRecord) -> tuple[ReplayPlayer, ...]:
+    """Get the stand-in players of a record."""
+    return tuple(map(ReplayPlayer, record.players))
+
+
+def player_spec(player: game.GUIPlayer) -> str:
+    """Get the spec of a player, for record headers."""
+    return player.spec or type(player).__name__
+
+
+def world_transformer(handle: desper.WorldHandle, world: desper.World,
+                      path: str | pathlib.Path | None = None,
+                      specs: Iterable[str] = (),
+                      replayer: Replayer | None = None):
+    """Record the game to ``path`` and/or add a replayer, if given.
+
+    When replaying, the game world must use the players given by
+    :func:`players`.
+    """
+    if path is not None:
+        _, handler = world.get(game.GameHandler)[0]
+        world.create_entity(GameRecorder(path, handler.state.width,
+                                         handler.state.height, specs))
+
+    if replayer is not None:
+        world.create_entity(replayer)
@@ -0,0 +1,418 @@
+"""Remote AI players: offload searches to a server over TCP.
+
+A server (``python -m corsoab serve``) runs the usual AI players (see
+:func:`players.parse_legacy_player`) on a pool of worker processes,
+possibly on a more powerful machine. Clients (:class:`RemotePlayer`,
+``remote:HOST:PORT[:PLAYER_TYPE]`` on the command line) keep a
+persistent connection to it and only render.
+
+The wire format is binary and compact. On connection, the client sends
+a hello (see :data:`HELLO_STRUCT`) followed by the player spec, the
+server replies with a status byte and a length prefixed message
+(empty on success). Then, each request (:data:`REQUEST_STRUCT`) holds
+a request id, the board size and the player index, followed by the
+board, four bits per cell (see :func:`encode_board`). Each response
+(:data:`RESPONSE_STRUCT`) holds the request id, the selected cell and
+the server side think time, in microseconds.
+
+If the server cannot be reached or does not respond in time, the move
+is selected by a local shallow search instead, and the connection is
+reset. Round trip and server think times are measured, and logged when
+the game is quit.
+"""
+import argparse
+import concurrent.futures
+import logging
+import re
+import socket
+import socketserver
+import statistics
+import struct
+import threading
+import time
+
+import corso.model as corso
+from corso.minmax import MinMaxPlayer
+
+from . import players
+from .log import logger
+
+MAGIC = b'CRSR'
+PROTOCOL_VERSION = 1
+HELLO_STRUCT = '<4sBB'
+"""Magic, protocol version, length of the player spec that follows."""
+STATUS_STRUCT = '<BB'
+"""Status, length of the error message that follows."""
+REQUEST_STRUCT = '<HBBB'
+"""Request id, board width, board height, player index."""
+RESPONSE_STRUCT = '<HBBI'
+"""Request id, row, column, server think time (microseconds)."""
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# The server is not authenticated: only local clients by default
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 7340
+DEFAULT_SPEC = 'mm3'
+DEFAULT_TIMEOUT = 10.
+FALLBACK_DEPTH = 1
+
+REMOTE_PLAYER_RE = re.compile(
+    r'remote:(\[[^\]]+\]|[^:\[\]]+):(\d+)(?::(.+))?')
+
+
+def _cell_code(cell: corso.CellState) -> int:
+    return cell.player_index << 1 | cell.marble
+
+
+def encode_board(board: corso.Board) -> bytes:
+    """Pack a board, four bits per cell (row major, low nibble first)."""
+    codes = [_cell_code(cell) for row in board for cell in row]
+    if len(codes) % 2:
+        codes.append(0)
+    return bytes(low | high << 4 for low, high in zip(codes[::2],
+                                                       codes[1::2]))
+
+
+def decode_board(data: bytes, width: int, height: int) -> corso.Board:
+    """Unpack a board, see :func:`encode_board`."""
+    codes = [nibble for byte in data for nibble in (byte & 0xF, byte >> 4)]
+    cells = [corso.CellState(code >> 1, bool(code & 1)) for code in codes]
+    return tuple(tuple(cells[row * width:(row + 1) * width])
+                 for row in range(height))
+
+
+def encode_request(request_id: int, state: corso.Corso) -> bytes:
+    return struct.pack(REQUEST_STRUCT, request_id, state.width,
+                       state.height, state.player_index) \
+        + encode_board(state.board)
+
+
+def _recv_exact(sock: socket.socket, size: int,
+                deadline: float | None = None) -> bytes:
+    """Receive exactly ``size`` bytes, before ``deadline`` if given.
+
+    Raise ``ConnectionError`` if the peer closes the connection, and
+    ``TimeoutError`` past the deadline.
+    """
+    data = bytearray()
+    while len(data) < size:
+        if deadline is not None:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError('remote player timed out')
+            sock.settimeout(remaining)
+
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('connection closed by peer')
+        data += chunk
+    return bytes(data)
+
+
+class RemotePlayer(corso.Player):
+    """Select actions through a remote AI server.
+
+    The connection is opened on first use and kept across moves. It is
+    guarded by a lock, so that concurrent selections (e.g. pondering)
+    are sent one at a time. If no response is received within
+    ``timeout`` seconds (connection included), the action is selected
+    by ``fallback`` (a shallow MinMax search by default) and the
+    connection is reset.
+    """
+
+    def __init__(self, host: str, port: int, spec: str = DEFAULT_SPEC,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 fallback: corso.Player | None = None):
+        self.host = host
+        self.port = port
+        self.spec = spec
+        self.timeout = timeout
+        if fallback is None:
+            fallback = MinMaxPlayer(FALLBACK_DEPTH)
+        self.fallback = fallback
+
+        self.round_trips: list[float] = []
+        self.server_times: list[float] = []
+        self.fallbacks = 0
+
+        self._socket: socket.socket | None = None
+        self._lock = threading.Lock()
+        self._request_id = 0
+        self._closed = False
+
+    def _connect(self, deadline: float) -> socket.socket:
+        """Open the connection and greet the server."""
+        sock = socket.create_connection(
+            (self.host, self.port),
+            timeout=max(deadline - time.perf_counter(), 0))
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            spec = self.spec.encode()
+            sock.sendall(struct.pack(HELLO_STRUCT, MAGIC, PROTOCOL_VERSION,
+                                     len(spec)) + spec)
+
+            status, length = struct.unpack(STATUS_STRUCT, _recv_exact(
+                sock, struct.calcsize(STATUS_STRUCT), deadline))
+            message = _recv_exact(sock, length, deadline).decode()
+            if status != STATUS_OK:
+                raise ConnectionError(f'server refused: {message}')
+        except BaseException:
+            sock.close()
+            raise
+
+        logger.info('Connected to AI server %s:%d (%s)', self.host,
+                    self.port, self.spec)
+        return sock
+
+    def _reset(self):
+        """Close the connection, a new one is opened on next request."""
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _request(self, state: corso.Corso) -> corso.Action:
+        """Send a request and wait for its response, within the timeout."""
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        if self._socket is None:
+            self._socket = self._connect(deadline)
+
+        self._request_id = (self._request_id + 1) % 2 ** 16
+        self._socket.settimeout(max(deadline - time.perf_counter(), 0))
+        self._socket.sendall(encode_request(self._request_id, state))
+
+        request_id, row, column, think_time = struct.unpack(
+            RESPONSE_STRUCT, _recv_exact(
+                self._socket, struct.calcsize(RESPONSE_STRUCT), deadline))
+        if request_id != self._request_id:
+            raise ConnectionError('unexpected response id')
+
+        self.round_trips.append(time.perf_counter() - start)
+        self.server_times.append(think_time / 1e6)
+        return corso.Action(state.player_index, row, column)
+
+    def select_action(self, state: corso.Corso) -> corso.Action:
+        """Select remotely, fall back to a local search on failure."""
+        with self._lock:
+            try:
+                action = self._request(state)
+            except (OSError, ValueError, struct.error) as error:
+                self._reset()
+                if self._closed:
+                    raise
+                logger.warning('Remote AI failed (%s), searching locally',
+                               error)
+                self.fallbacks += 1
+                return self.fallback.select_action(state)
+
+        if action not in state.actions:
+            logger.warning('Remote AI sent an illegal move, searching '
+                           'locally')
+            self.fallbacks += 1
+            return self.fallback.select_action(state)
+
+        logger.debug('Remote move: %.1fms round trip, %.1fms on server',
+                     self.round_trips[-1] * 1e3, self.server_times[-1] * 1e3)
+        return action
+
+    def log_metrics(self):
+        """Log round trip and server think times, and fallbacks."""
+        if not self.round_trips:
+            logger.info('Remote AI %s:%d: no remote moves, %d fallbacks',
+                        self.host, self.port, self.fallbacks)
+            return
+
+        overheads = [round_trip - server_time for round_trip, server_time
+                     in zip(self.round_trips, self.server_times)]
+        logger.info('Remote AI %s:%d: %d moves, round trip %.1fms mean '
+                    '(max %.1fms), network and protocol overhead %.2fms '
+                    'mean, %d fallbacks', self.host, self.port,
+                    len(self.round_trips),
+                    statistics.mean(self.round_trips) * 1e3,
+                    max(self.round_trips) * 1e3,
+                    statistics.mean(overheads) * 1e3, self.fallbacks)
+
+    def close(self):
+        """Close the connection, log metrics.
+
+        Ongoing selections are interrupted, with no fallback.
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        if self._socket is not None:
+            # Interrupt a pending receive, without waiting for the lock
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        with self._lock:
+            self._reset()
+        self.log_metrics()
+
+
+def parse_remote_player(player_type: str) -> RemotePlayer:
+    """Create a remote player from a ``remote:HOST:PORT[:SPEC]`` string.
+
+    IPv6 addresses must be enclosed in brackets. ``SPEC`` is the type
+    of AI player run by the server, defaults to :data:`DEFAULT_SPEC`.
+    Raise ``ValueError`` if the string is not valid.
+    """
+    match = REMOTE_PLAYER_RE.fullmatch(player_type.lower())
+    if match is None:
+        raise ValueError(f'invalid remote player "{player_type}", expected '
+                         'remote:HOST:PORT[:PLAYER_TYPE]')
+
+    host, port, spec = match.groups()
+    spec = spec or DEFAULT_SPEC
+    _validate_spec(spec)
+    return RemotePlayer(host.strip('[]'), int(port), spec)
+
+
+def _validate_spec(spec: str):
+    """Raise ``ValueError`` unless the spec is a local AI player."""
+    if spec in ('user', 'remote') or spec.startswith('remote:'):
+        raise ValueError(f'"{spec}" cannot be played remotely')
+    players.parse_legacy_player(spec)
+
+
+# Server side
+
+_worker_players: dict[str, corso.Player] = {}
+
+
+def _init_worker():
+    """Silence per move logging in worker processes."""
+    logger.setLevel(logging.WARNING)
+
+
+def _select_action(spec: str,
+                   state: corso.Corso) -> tuple[corso.Action, float]:
+    """Select an action in a worker process, measure think time.
+
+    Players are created once per spec and worker, so that their state
+    (e.g. transposition tables) is reused across requests.
+    """
+    player = _worker_players.get(spec)
+    if player is None:
+        player = _worker_players[spec] = players.parse_legacy_player(spec)
+
+    start = time.perf_counter()
+    action = player.select_action(state)
+    return action, time.perf_counter() - start
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    """Serve a client connection, until it is closed."""
+    server: 'Server'
+
+    def handle(self):
+        sock: socket.socket = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            spec = self._greet(sock)
+            if spec is None:
+                return
+            logger.info('Client %s:%d connected (%s)',
+                        *self.client_address[:2], spec)
+
+            while True:
+                self._serve_request(sock, spec)
+        except ConnectionError:
+            pass
+        except (OSError, ValueError, struct.error) as error:
+            logger.warning('Client %s:%d: %s', *self.client_address[:2],
+                           error)
+        except Exception:
+            # e.g. a well-formed request holding an impossible state
+            logger.exception('Client %s:%d: request failed',
+                             *self.client_address[:2])
+        logger.info('Client %s:%d disconnected', *self.client_address[:2])
+
+    def _greet(self, sock: socket.socket) -> str | None:
+        """Check the hello, reply with a status. Return the spec, if valid."""
+        magic, version, length = struct.unpack(
+            HELLO_STRUCT, _recv_exact(sock, struct.calcsize(HELLO_STRUCT)))
+        spec = _recv_exact(sock, length).decode().lower()
+
+        error = ''
+        if magic != MAGIC or version != PROTOCOL_VERSION:
+            error = f'unsupported protocol (version {PROTOCOL_VERSION})'
+        else:
+            try:
+                _validate_spec(spec)
+            except ValueError as exception:
+                error = str(exception)
+
+        message = error.encode()[:255]
+        sock.sendall(struct.pack(STATUS_STRUCT,
+                                 STATUS_ERROR if error else STATUS_OK,
+                                 len(message)) + message)
+        if error:
+            logger.warning('Client %s:%d refused: %s',
+                           *self.client_address[:2], error)
+            return None
+        return spec
+
+    def _serve_request(self, sock: socket.socket, spec: str):
+        request_id, width, height, player_index = struct.unpack(
+            REQUEST_STRUCT, _recv_exact(sock, struct.calcsize(REQUEST_STRUCT)))
+        board = decode_board(_recv_exact(sock, (width * height + 1) // 2),
+                             width, height)
+        state = corso.Corso(board, player_index=player_index)
+
+        action, think_time = self.server.executor.submit(
+            _select_action, spec, state).result()
+        sock.sendall(struct.pack(RESPONSE_STRUCT, request_id, action.row,
+                                 action.column,
+                                 min(round(think_time * 1e6), 2 ** 32 - 1)))
+        logger.debug('Client %s:%d: %s in %.1fms', *self.client_address[:2],
+                     action, think_time * 1e3)
+
+
+class Server(socketserver.ThreadingTCPServer):
+    """AI server: one thread per connection, searches on a process pool."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple[str, int], jobs: int | None = None):
+        super().__init__(address, RequestHandler)
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            jobs, initializer=_init_worker)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(cancel_futures=True)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        'python -m corsoab serve',
+        description='Serve AI moves to remote players (see player type '
+                    '"remote:HOST:PORT[:PLAYER_TYPE]"), searching on a '
+                    'pool of worker processes.')
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help=f'Address to listen on. Defaults to '
+                             f'{DEFAULT_HOST} (local clients only). Use '
+                             f'0.0.0.0 to accept clients from any '
+                             f'network: the server is not '
+                             f'authenticated, only do so on trusted '
+                             f'networks.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help=f'Port to listen on. Defaults to '
+                             f'{DEFAULT_PORT}.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes. Defaults to the '
+                             'number of CPUs.')
+    args = parser.parse_args(argv)
+
+    logger.setLevel(logging.INFO)
+    with Server((args.host, args.port), args.jobs) as server:
+        logger.info('AI server listening on %s:%d', *server.server_address[:2])
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,502 @@
+"""MinMax search for Corso, backed by persistent transposition tables.
+
+The search mirrors corso's own MinMax player (:mod:`corso.minmax`):
+same heuristic, same depth semantics and same policy, but positions
+evaluated during a search are stored in a :class:`TranspositionTable`
+that survives across moves (and, optionally, across games).
+
+:class:`IterativeDeepeningPlayer` searches deeper and deeper within a
+time budget instead, for a bounded think time on any hardware.
+
+Players search on :class:`bitboard.Bitboard` positions by default,
+which are much faster to expand than :class:`corso.model.Corso`
+objects. :class:`Search` works on both.
+"""
+import enum
+import random
+import time
+import uuid
+from collections.abc import Callable
+
+import corso.model as corso
+from corso.minmax import heuristic, softmax, TERMINAL_SCORE
+
+from . import bitboard
+from . import workers
+from .log import logger
+
+DEFAULT_TABLE_CAPACITY = 2 ** 16
+DEFAULT_TEMPERATURE = 1e-5
+DEFAULT_TIME_BUDGET = 1.
+# Nodes visited between two deadline (and cancellation) checks
+DEADLINE_CHECK_INTERVAL = 64
+# Table depth of positions whose whole game tree was searched
+COMPLETE_DEPTH = 2 ** 31
+
+# Compact cell encoding (3 bits per cell)
+_CELL_CODES = {
+    corso.EMPTY_CELL: 0,
+    corso.CellState(1, False): 1,
+    corso.CellState(1, True): 2,
+    corso.CellState(2, False): 3,
+    corso.CellState(2, True): 4,
+}
+
+
+def board_hash(board: corso.Board, player_index: int) -> int:
+    """Get a compact integer key for a board and player index.
+
+    Each cell takes three bits, the player index takes the two least
+    significant bits. The key is unique for two-player games.
+    """
+    key = 0
+    for row in board:
+        for cell in row:
+            key = key << 3 | _CELL_CODES[cell]
+
+    return key << 2 | player_index
+
+
+def state_hash(state: corso.Corso) -> int:
+    """Get a compact integer key for a state, see :func:`board_hash`."""
+    return board_hash(state.board, state.player_index)
+
+
+class Bound(enum.IntEnum):
+    """Kind of score stored in a table entry (see alpha-beta pruning)."""
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+
+TableEntry = tuple[int, float, Bound, int]
+"""Table entry in the form ``(depth, score, bound, age)``."""
+
+
+class TranspositionTable:
+    """Bounded table of searched positions, with usage statistics.
+
+    Entries are keyed by integers (see :func:`state_hash` and
+    :func:`bitboard.key`) and remember the depth at which they were
+    searched. A probe is a hit only if the stored
+    entry was searched at least as deep as requested.
+
+    Each search shall call :meth:`new_search`, which ages the
+    table. When the capacity is exceeded, a quarter of the entries is
+    evicted, oldest first and shallowest first among the same age.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_TABLE_CAPACITY):
+        self.capacity = capacity
+        self.age = 0
+        self._entries: dict[int, TableEntry] = {}
+
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def new_search(self):
+        """Notify the start of a new search (entries get older)."""
+        self.age += 1
+
+    def probe(self, key: int, depth: int,
+              exact: bool = False) -> TableEntry | None:
+        """Retrieve an entry searched at least at the given depth.
+
+        If ``exact`` is true, only entries searched at the given depth
+        are retrieved.
+        """
+        self.probes += 1
+
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < depth or exact and entry[0] != depth:
+            return None
+
+        self.hits += 1
+        return entry
+
+    def store(self, key: int, depth: int, score: float, bound: Bound):
+        """Store a search result.
+
+        Deeper results from the current search are never replaced by
+        shallower ones.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[3] == self.age and entry[0] > depth:
+            return
+
+        self._entries[key] = depth, score, bound, self.age
+        self.stores += 1
+
+        if len(self._entries) > self.capacity:
+            self._evict()
+
+    def _evict(self):
+        """Drop a quarter of the entries, oldest and shallowest first."""
+        evicted = sorted(self._entries.items(),
+                         key=lambda item: (item[1][3], item[1][0]))
+        for key, _ in evicted[:max(self.capacity // 4, 1)]:
+            del self._entries[key]
+            self.evictions += 1
+
+    @property
+    def hit_rate(self) -> float:
+        """Ratio of probes that resulted in a hit."""
+        if not self.probes:
+            return 0.
+        return self.hits / self.probes
+
+    def clear(self):
+        """Drop all entries and reset statistics."""
+        self._entries.clear()
+        self.age = 0
+        self.probes = self.hits = self.stores = self.evictions = 0
+
+
+_shared_tables: dict[str, TranspositionTable] = {}
+
+
+def get_table(name: str,
+              capacity: int = DEFAULT_TABLE_CAPACITY) -> TranspositionTable:
+    """Retrieve a named table, create it if needed.
+
+    Tables live as long as the current process. Note that when a
+    player is executed on a process pool (see :mod:`workers`), each
+    worker process has its own tables.
+    """
+    if name not in _shared_tables:
+        _shared_tables[name] = TranspositionTable(capacity)
+
+    return _shared_tables[name]
+
+
+def drop_table(name: str):
+    """Release a named table, if it exists."""
+    _shared_tables.pop(name, None)
+
+
+class SearchTimeout(Exception):
+    """Raised by :class:`Search` when its deadline is exceeded."""
+
+
+class SearchCancelled(SearchTimeout):
+    """Raised by :class:`Search` when its task is asked to stop.
+
+    See :func:`workers.cancel`. Handlers of :class:`SearchTimeout`
+    stop as well.
+    """
+
+
+class Search:
+    """Alpha-beta MinMax search, using a transposition table.
+
+    Table entries searched deeper than requested are reused as well,
+    hence scores can be more accurate than a plain search of the same
+    depth. The number of visited nodes is counted in :attr:`nodes`.
+
+    If a ``deadline`` is given (see :func:`time.perf_counter`), the
+    search is aborted with :class:`SearchTimeout` once it is exceeded.
+    Table entries stored until then are complete, hence still valid.
+    Similarly, the search is aborted with :class:`SearchCancelled` if
+    the worker task running it is asked to stop (see
+    :func:`workers.cancel`).
+
+    States can be :class:`corso.model.Corso` or
+    :class:`bitboard.Bitboard` objects, given a matching ``heuristic``
+    and table ``key`` (see :func:`bitboard.heuristic` and
+    :func:`bitboard.key`).
+
+    If ``exact_depth`` is true, only table entries of the requested
+    depth are reused: scores are then exactly the ones of a plain
+    search of that depth, whatever the table holds.
+
+    Non terminal positions cut at the horizon (depth zero) are counted
+    in :attr:`horizon_cuts`, as well as table entries whose subtree may
+    contain some. If no cut happens below a position, its whole game
+    tree was searched and its score holds at any depth: it is stored
+    with :data:`COMPLETE_DEPTH` (unless ``exact_depth`` is true).
+    """
+
+    def __init__(self, table: TranspositionTable,
+                 heuristic: Callable[[corso.Corso], float] = heuristic,
+                 deadline: float | None = None,
+                 key: Callable[[corso.Corso], int] = state_hash,
+                 exact_depth: bool = False):
+        self.table = table
+        self.heuristic = heuristic
+        self.deadline = deadline
+        self.key = key
+        self.exact_depth = exact_depth
+        self.nodes = 0
+        self.horizon_cuts = 0
+
+    def score(self, state: corso.Corso, depth: int,
+              alpha: float = -TERMINAL_SCORE,
+              beta: float = TERMINAL_SCORE) -> float:
+        """Compute the MinMax score of a state, for a given depth.
+
+        Scores are absolute: positive values favour player 1.
+        """
+        self.nodes += 1
+        if self.nodes % DEADLINE_CHECK_INTERVAL == 0:
+            if (self.deadline is not None
+                    and time.perf_counter() > self.deadline):
+                raise SearchTimeout
+            if workers.cancellation_requested():
+                raise SearchCancelled
+
+        if state.terminal[0]:
+            return self.heuristic(state)
+        if depth <= 0:
+            self.horizon_cuts += 1
+            return self.heuristic(state)
+
+        key = self.key(state)
+        entry = self.table.probe(key, depth, self.exact_depth)
+        if entry is not None:
+            entry_depth, score, bound, _ = entry
+            if entry_depth != COMPLETE_DEPTH:
+                self.horizon_cuts += 1
+            if bound == Bound.EXACT:
+                return score
+            elif bound == Bound.LOWER:
+                alpha = max(alpha, score)
+            else:
+                beta = min(beta, score)
+
+            if alpha >= beta:
+                return score
+
+        original_alpha = alpha
+        original_beta = beta
+        horizon_cuts = self.horizon_cuts
+        maximize = state.player_index == 1
+
+        best_score = None
+        for action in state.actions:
+            action_score = self.score(state.step(action), depth - 1, alpha,
+                                      beta)
+
+            if maximize:
+                if best_score is None or action_score > best_score:
+                    best_score = action_score
+                alpha = max(alpha, action_score)
+            else:
+                if best_score is None or action_score < best_score:
+                    best_score = action_score
+                beta = min(beta, action_score)
+
+            if alpha >= beta:
+                break
+
+        bound = Bound.EXACT
+        if best_score <= original_alpha:
+            bound = Bound.UPPER
+        elif best_score >= original_beta:
+            bound = Bound.LOWER
+        if horizon_cuts == self.horizon_cuts and not self.exact_depth:
+            depth = COMPLETE_DEPTH
+        self.table.store(key, depth, best_score, bound)
+
+        return best_score
+
+
+def new_search(table: TranspositionTable, bitboards: bool = True,
+               deadline: float | None = None,
+               exact_depth: bool = False) -> Search:
+    """Create a search on bitboards or on corso's model."""
+    if bitboards:
+        return Search(table, bitboard.heuristic, deadline, bitboard.key,
+                      exact_depth)
+    return Search(table, deadline=deadline, exact_depth=exact_depth)
+
+
+class CachedMinMaxPlayer(corso.Player):
+    """MinMax player whose transposition table persists across moves.
+
+    Behaves as corso's :class:`corso.minmax.MinMaxPlayer`: root actions
+    are scored by a MinMax search of the given depth and the action is
+    sampled from the softmax policy of the scores (see
+    ``temperature``).
+
+    By default, each player owns a private table. Giving a
+    ``shared_table`` name makes players in the same process share it,
+    so that it survives across games too. Tables are looked up by name
+    (see :func:`get_table`), so that players can be executed on a
+    process pool without copying the table back and forth.
+
+    If ``bitboards`` is true, positions are searched as
+    :class:`bitboard.Bitboard` objects (two-player games only).
+    Results are the same, but table keys are not: players sharing a
+    table should use the same representation.
+    """
+
+    def __init__(self, depth: int = 3,
+                 table_capacity: int = DEFAULT_TABLE_CAPACITY,
+                 shared_table: str | None = None,
+                 temperature: float = DEFAULT_TEMPERATURE,
+                 rng: random.Random | None = None,
+                 bitboards: bool = True):
+        self.depth = depth
+        self.table_capacity = table_capacity
+        self.table_name = shared_table
+        if shared_table is None:
+            self.table_name = uuid.uuid4().hex
+        self.temperature = temperature
+        self.rng = rng if rng is not None else random.Random()
+        self.bitboards = bitboards
+
+        self.nodes = 0
+
+    @property
+    def table(self) -> TranspositionTable:
+        """Transposition table used by this player."""
+        return get_table(self.table_name, self.table_capacity)
+
+    def _new_search(self, deadline: float | None = None) -> Search:
+        """Create a search on the player's table and representation."""
+        return new_search(self.table, self.bitboards, deadline)
+
+    def _root(self, state: corso.Corso) -> corso.Corso:
+        """Convert a state to the searched representation."""
+        if self.bitboards:
+            return bitboard.Bitboard.from_corso(state)
+        return state
+
+    def score_actions(self, state: corso.Corso) -> list[float]:
+        """Compute the MinMax scores of all legal actions.
+
+        Scores are from the point of view of the current player
+        (higher is better).
+        """
+        table = self.table
+        table.new_search()
+        search = self._new_search()
+
+        # Both representations list actions in the same order
+        root = self._root(state)
+        sign = 1 if state.player_index == 1 else -1
+        scores = [sign * search.score(root.step(action), self.depth - 1)
+                  for action in root.actions]
+
+        self.nodes += search.nodes
+        logger.debug('Transposition table: %d entries, hit rate %.1f%%, '
+                     '%d nodes searched', len(table), table.hit_rate * 100,
+                     search.nodes)
+
+        return scores
+
+    def select_action(self, state: corso.Corso) -> corso.Action:
+        """Run a cached MinMax search, sample an action from scores."""
+        scores = [score / self.temperature
+                  for score in self.score_actions(state)]
+
+        return self.rng.choices(state.actions, softmax(scores))[0]
+
+
+class IterativeDeepeningPlayer(CachedMinMaxPlayer):
+    """MinMax player searching as deep as a time budget allows.
+
+    Searches of depth 1, 2, ... are run in turn, sharing the
+    transposition table. The best action of the deepest completed
+    search is played: the first one always completes, the one
+    exceeding ``time_budget`` (in seconds) is aborted. A new depth is
+    not started if it cannot possibly complete, i.e. if the previous
+    one took longer than the remaining time.
+
+    Root actions are searched in the order given by the previous
+    depth, best first, so that alpha-beta pruning is more effective.
+    Unlike :class:`CachedMinMaxPlayer`, the best action is played
+    (ties are broken randomly, see ``rng``). Searching stops early if
+    the outcome of the game is certain, or if the whole game tree was
+    searched. The depth reached is kept in :attr:`depth`.
+    """
+
+    def __init__(self, time_budget: float = DEFAULT_TIME_BUDGET,
+                 table_capacity: int = DEFAULT_TABLE_CAPACITY,
+                 shared_table: str | None = None,
+                 rng: random.Random | None = None,
+                 bitboards: bool = True):
+        super().__init__(1, table_capacity, shared_table, rng=rng,
+                         bitboards=bitboards)
+        self.time_budget = time_budget
+
+    def _search_root(self, search: Search, state: corso.Corso,
+                     actions: list[corso.Action],
+                     depth: int) -> list[tuple[float, corso.Action]]:
+        """Alpha-beta search of the root actions, in the given order.
+
+        Return ``(score, action)`` pairs, scores from the point of
+        view of the current player. Only the best score is exact, the
+        others are upper bounds.
+        """
+        maximize = state.player_index == 1
+        sign = 1 if maximize else -1
+        alpha = -TERMINAL_SCORE
+        beta = TERMINAL_SCORE
+
+        results = []
+        for action in actions:
+            score = search.score(state.step(action), depth - 1, alpha, beta)
+            results.append((sign * score, action))
+            if maximize:
+                alpha = max(alpha, score)
+            else:
+                beta = min(beta, score)
+
+        return results
+
+    def select_action(self, state: corso.Corso) -> corso.Action:
+        """Deepen the search until the time budget is spent."""
+        start = time.perf_counter()
+        deadline = start + self.time_budget
+
+        self.table.new_search()
+        root = self._root(state)
+        actions = list(root.actions)
+        self.rng.shuffle(actions)
+
+        nodes = 0
+        best_score = 0.
+        depth = 0
+        iteration_time = 0.
+        while True:
+            iteration_start = time.perf_counter()
+            if depth and deadline - iteration_start < iteration_time:
+                break
+
+            # The first search always completes
+            search = self._new_search(deadline if depth else None)
+            try:
+                results = self._search_root(search, root, actions,
+                                            depth + 1)
+            except SearchTimeout:
+                nodes += search.nodes
+                break
+            nodes += search.nodes
+
+            # Best first, ties keep the previous order (stable sort)
+            results.sort(key=lambda result: -result[0])
+            best_score = results[0][0]
+            actions = [action for _, action in results]
+            depth += 1
+            iteration_time = time.perf_counter() - iteration_start
+
+            if abs(best_score) >= TERMINAL_SCORE:
+                break
+            # Deeper searches would give the same scores
+            if not search.horizon_cuts:
+                break
+
+        self.depth = depth
+        self.nodes += nodes
+        logger.debug('Iterative deepening: depth %d reached in %.0fms, '
+                     'score %.1f, %d nodes searched', depth,
+                     (time.perf_counter() - start) * 1e3, best_score, nodes)
+        if self.bitboards:
+            return root.to_action(actions[0])
+        return actions[0]
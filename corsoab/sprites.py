@@ -0,0 +1,298 @@
+"""Native 1bpp sprites, composited straight in SSD1306 page layout.
+
+On the bonnet, composing the screen on an SDL surface only to pack it
+in page layout afterwards (see :mod:`ssd1306`) is wasteful. Here,
+sprites are converted once to :class:`Bitmap` objects: one bit per
+pixel, already packed in pages, with a variant for each vertical
+offset inside a page. :class:`PageFramebuffer` draws them with a
+couple of big integer operations per page (AND-NOT the sprite's mask,
+OR its bits), and can wrap the display driver's own buffer, so that no
+conversion at all happens per frame.
+
+Sprites keep their SDL surfaces (see :class:`graphics.Sprite`), so
+that the desktop renderer is unaffected: :class:`PageCompositor`
+converts them transparently (and caches the result).
+"""
+import ctypes
+
+import desper
+import sdl2
+
+from . import graphics
+from .ssd1306 import (PAGE_HEIGHT, DisplayWriter, RenderHandler,
+                      buffer_offset, surface_view)
+
+# _REPUNITS[n] has a 0x01 byte in each of its n bytes: multiplying it by
+# a byte value repeats the value n times
+_REPUNITS = {}
+
+
+def _repeat_byte(value: int, count: int) -> int:
+    """Get an integer made of ``count`` bytes of the given value."""
+    repunit = _REPUNITS.get(count)
+    if repunit is None:
+        repunit = _REPUNITS[count] = int.from_bytes(b'\x01' * count, 'big')
+    return value * repunit
+
+
+def _page_bits(first_row: int, last_row: int, page: int) -> int:
+    """Get a page byte with the bits of rows in range lit (included)."""
+    first = max(first_row - page * PAGE_HEIGHT, 0)
+    last = min(last_row - page * PAGE_HEIGHT, PAGE_HEIGHT - 1)
+    if first > last:
+        return 0
+    return ((1 << (last + 1)) - 1) & ~((1 << first) - 1)
+
+
+class Bitmap:
+    """One bit per pixel sprite, pre-packed in page layout.
+
+    For each vertical shift inside a page (``y % 8``), :attr:`variants`
+    holds a list of ``(data, mask)`` byte strings, one per page the
+    shifted sprite spans. ``mask`` has lit bits where the sprite is
+    opaque.
+    """
+
+    def __init__(self, width: int, height: int, pixels: bytes,
+                 opaque: bytes):
+        self.width = width
+        self.height = height
+        self.variants = tuple(self._pack(pixels, opaque, shift)
+                              for shift in range(PAGE_HEIGHT))
+
+    def _pack(self, pixels: bytes, opaque: bytes,
+              shift: int) -> list[tuple[bytes, bytes]]:
+        """Pack pixel rows (one byte per pixel) with a vertical shift."""
+        pages = (self.height + shift + PAGE_HEIGHT - 1) // PAGE_HEIGHT
+        data = [bytearray(self.width) for _ in range(pages)]
+        mask = [bytearray(self.width) for _ in range(pages)]
+
+        for y in range(self.height):
+            page, bit = divmod(y + shift, PAGE_HEIGHT)
+            for x in range(self.width):
+                index = y * self.width + x
+                if opaque[index]:
+                    mask[page][x] |= 1 << bit
+                    if pixels[index]:
+                        data[page][x] |= 1 << bit
+
+        return [(bytes(page_data), bytes(page_mask))
+                for page_data, page_mask in zip(data, mask)]
+
+    @classmethod
+    def from_surface(cls, surface: graphics.LP_SDL_Surface) -> 'Bitmap':
+        """Convert an SDL surface, as it would be blitted on the screen.
+
+        The surface is converted to the screen format (RGB332) and the
+        least significant bit of each pixel is kept (see
+        :func:`ssd1306.pack_surface`). Pixels matching the surface's
+        color key, if any, are transparent.
+        """
+        contents = surface.contents
+        width, height = contents.w, contents.h
+
+        opaque = bytearray(b'\x01' * (width * height))
+        color_key = ctypes.c_uint32()
+        if sdl2.SDL_GetColorKey(surface, ctypes.byref(color_key)) == 0:
+            # Only palettized (one byte per pixel) keys are supported,
+            # as all game sprites are
+            source = surface_view(surface)
+            for y in range(height):
+                for x in range(width):
+                    if source[y * contents.pitch + x] == color_key.value:
+                        opaque[y * width + x] = 0
+
+        converted = sdl2.SDL_ConvertSurfaceFormat(
+            surface, sdl2.SDL_PIXELFORMAT_RGB332, 0)
+        view = surface_view(converted)
+        pitch = converted.contents.pitch
+        pixels = bytes(view[y * pitch + x] & 1
+                       for y in range(height) for x in range(width))
+        sdl2.SDL_FreeSurface(converted)
+
+        return cls(width, height, pixels, bytes(opaque))
+
+
+class PageFramebuffer:
+    """Monochrome framebuffer in SSD1306 page layout.
+
+    By default a new buffer is allocated. Any writable buffer of the
+    right size can be given instead, e.g. a view of a display
+    driver's buffer.
+    """
+
+    def __init__(self, width: int = graphics.BONNET_WIDTH,
+                 height: int = graphics.BONNET_HEIGHT, buffer=None):
+        self.width = width
+        self.height = height
+        self.pages = height // PAGE_HEIGHT
+        if buffer is None:
+            buffer = bytearray(self.pages * width)
+        self.buffer = memoryview(buffer).cast('B')
+
+    def _clip(self, rect: graphics.Rect | None) -> graphics.Rect | None:
+        """Clip a rectangle to the framebuffer."""
+        screen_rect = (0, 0, self.width, self.height)
+        if rect is None:
+            return screen_rect
+        return graphics.rect_intersection(rect, screen_rect)
+
+    def clear(self, rect: graphics.Rect | None = None):
+        """Turn off all pixels in the given rectangle (default: all)."""
+        rect = self._clip(rect)
+        if rect is None:
+            return
+
+        x, y, width, height = rect
+        for page in range(y // PAGE_HEIGHT,
+                          (y + height - 1) // PAGE_HEIGHT + 1):
+            clip = _repeat_byte(_page_bits(y, y + height - 1, page), width)
+            start = page * self.width + x
+            old = int.from_bytes(self.buffer[start:start + width], 'big')
+            self.buffer[start:start + width] = (old & ~clip).to_bytes(
+                width, 'big')
+
+    def blit(self, bitmap: Bitmap, position: tuple[int, int],
+             clip_rect: graphics.Rect | None = None):
+        """Draw a bitmap at the given position, inside a clip rectangle.
+
+        Opaque pixels of the bitmap replace the framebuffer content,
+        transparent ones leave it untouched.
+        """
+        clip_rect = self._clip(clip_rect)
+        if clip_rect is not None:
+            self._blit(bitmap, position, clip_rect)
+
+    def _blit(self, bitmap: Bitmap, position: tuple[int, int],
+              clip_rect: graphics.Rect):
+        """Draw a bitmap, given a clip rectangle inside the framebuffer."""
+        bitmap_x, bitmap_y = position
+        rect = graphics.rect_intersection(
+            (bitmap_x, bitmap_y, bitmap.width, bitmap.height), clip_rect)
+        if rect is None:
+            return
+
+        x, y, width, height = rect
+        first_column = x - bitmap_x
+        first_page = bitmap_y // PAGE_HEIGHT
+
+        variant = bitmap.variants[bitmap_y % PAGE_HEIGHT]
+        for index, (data, mask) in enumerate(variant):
+            page = first_page + index
+            bits = _page_bits(y, y + height - 1, page)
+            if not bits:
+                continue
+
+            clip = _repeat_byte(bits, width)
+            data = int.from_bytes(
+                data[first_column:first_column + width], 'big') & clip
+            mask = int.from_bytes(
+                mask[first_column:first_column + width], 'big') & clip
+
+            start = page * self.width + x
+            old = int.from_bytes(self.buffer[start:start + width], 'big')
+            self.buffer[start:start + width] = (
+                (old & ~mask) | data).to_bytes(width, 'big')
+
+
+@desper.event_handler('update_framebuffer')
+class PageCompositor(graphics.ScreenController):
+    """Render world on a :class:`PageFramebuffer`.
+
+    Counterpart of :class:`graphics.ScreenSurfaceHandler`, on
+    ``update_framebuffer`` event: only the areas invalidated in the
+    screen's :class:`graphics.DirtyRegion` are cleared and redrawn, in
+    :class:`graphics.RenderList` order. Sprite surfaces are converted
+    to bitmaps when the compositor is added to the world, or on first
+    use.
+    """
+
+    def __init__(self, framebuffer: PageFramebuffer):
+        self.framebuffer = framebuffer
+        self._bitmaps: dict[int, Bitmap] = {}
+
+    def on_add(self, entity, world: desper.World):
+        super().on_add(entity, world)
+        for _, sprite in world.get(graphics.Sprite):
+            if sprite.surface is not None:
+                self.bitmap(sprite.surface)
+
+    def bitmap(self, surface: graphics.LP_SDL_Surface) -> Bitmap:
+        """Get the bitmap of a surface, convert it if needed.
+
+        Surfaces are supposed to be immutable.
+        """
+        address = ctypes.addressof(surface.contents)
+        bitmap = self._bitmaps.get(address)
+        if bitmap is None:
+            bitmap = self._bitmaps[address] = Bitmap.from_surface(surface)
+        return bitmap
+
+    def update_framebuffer(self):
+        dirty_region = self.screen.dirty_region
+
+        framebuffer = self.framebuffer
+        dirty_rects = dirty_region.dirty_rects
+        clip_rects = [rect for rect in map(framebuffer._clip, dirty_rects)
+                      if rect is not None]
+        for clip_rect in clip_rects:
+            framebuffer.clear(clip_rect)
+
+        for sprite in self.screen.render_list.sprites:
+            surface = sprite.surface
+            if surface is None:
+                continue
+
+            bitmap = self.bitmap(surface)
+            position = sprite.rect[:2]
+            for clip_rect in clip_rects:
+                framebuffer._blit(bitmap, position, clip_rect)
+
+        dirty_region.commit(dirty_rects)
+
+
+class DisplayCompositor(PageCompositor):
+    """Compose straight into a display driver's buffer.
+
+    Use along with :class:`FramebufferRenderHandler`.
+    """
+
+    def __init__(self, display):
+        super().__init__(PageFramebuffer(
+            display.width, display.height,
+            memoryview(display.buffer)[buffer_offset(display):]))
+
+
+class FramebufferRenderHandler(RenderHandler):
+    """Flush a display whose buffer is composed in place.
+
+    See :class:`DisplayCompositor`: there is nothing to pack.
+    """
+
+    def pack(self, surface, rect):
+        pass
+
+
+@desper.event_handler('render', 'on_quit')
+class WriterRenderHandler(graphics.ScreenController):
+    """Hand composed frames to a :class:`ssd1306.DisplayWriter`.
+
+    The framebuffer, composed by a :class:`PageCompositor`, must not be
+    the display's own buffer: it is copied on ``render``, if updated,
+    and sent by the writer thread. The writer is closed on quit.
+    """
+
+    def __init__(self, framebuffer: PageFramebuffer, writer: DisplayWriter):
+        self.framebuffer = framebuffer
+        self.writer = writer
+
+    def render(self):
+        if self.screen.dirty_region.updated_rect is None:
+            return
+
+        self.writer.submit(bytes(self.framebuffer.buffer))
+
+    def on_quit(self):
+        """Send the last frame, stop the writer thread, log its stats."""
+        self.writer.close()
+        self.writer.log_stats()
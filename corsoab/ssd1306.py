@@ -0,0 +1,460 @@
+"""SSD1306 framebuffer utilities, independent from the actual hardware.
+
+The SSD1306 controller stores its graphics RAM in *pages*: horizontal
+stripes of eight pixel rows each. Every byte of a page represents a
+column of eight vertical pixels, least significant bit on top. This
+module converts game screen surfaces (one byte per pixel, see
+:mod:`graphics`) to such layout, and sends to the display only the
+parts of the framebuffer that actually changed, optionally from a
+dedicated thread (see :class:`DisplayWriter`).
+
+NumPy is used when available (imported on first use, as it is slow to
+import). A pure Python fallback based on bytes translation and big
+integer arithmetics is provided otherwise.
+"""
+import ctypes
+import threading
+import time
+
+import desper
+
+numpy = None                # Imported by numpy_available
+_numpy_checked = False
+
+from . import graphics
+from .log import logger
+
+PAGE_HEIGHT = 8
+
+# Commands (see adafruit_ssd1306)
+SET_COL_ADDR = 0x21
+SET_PAGE_ADDR = 0x22
+
+# For each row inside a page, map a pixel byte to the bit it lights up
+# in the page byte. Only the least significant bit of the pixel is
+# meaningful (see fill_display's original behaviour).
+_ROW_BIT_TABLES = tuple(
+    bytes((1 << row) if value & 1 else 0 for value in range(256))
+    for row in range(PAGE_HEIGHT))
+
+
+def numpy_available() -> bool:
+    """Tell whether numpy is installed, import it on first call."""
+    global numpy, _numpy_checked
+    if not _numpy_checked:
+        _numpy_checked = True
+        try:
+            import numpy
+        except ImportError:
+            logger.debug('numpy not available, packing in pure Python')
+    return numpy is not None
+
+
+def surface_view(surface: graphics.LP_SDL_Surface) -> memoryview:
+    """Retrieve a zero-copy, read-write view of the surface's pixels.
+
+    The view spans ``pitch * h`` bytes, padding included. The surface
+    is supposed to be a one byte per pixel surface that does not
+    require locking (e.g. software surfaces, no RLE acceleration).
+    """
+    contents = surface.contents
+    pixel_array_type = ctypes.c_uint8 * (contents.pitch * contents.h)
+    return memoryview(
+        pixel_array_type.from_address(contents.pixels)).cast('B')
+
+
+def buffer_offset(display) -> int:
+    """Get the index of the first framebuffer byte in ``display.buffer``.
+
+    Adafruit's I2C driver reserves the first byte of its buffer to the
+    data/command control byte, while the SPI one does not.
+    """
+    return len(display.buffer) - display.width * display.height // PAGE_HEIGHT
+
+
+def _pack_numpy(pixels: memoryview, pitch: int, width: int, output,
+                first_page: int, last_page: int):
+    """Pack pages in range using numpy. See :func:`pack_surface`."""
+    rows = numpy.frombuffer(pixels, numpy.uint8).reshape(-1, pitch)
+    pages = rows[first_page * PAGE_HEIGHT:(last_page + 1) * PAGE_HEIGHT,
+                 :width] & 1
+    packed = numpy.packbits(pages.reshape(-1, PAGE_HEIGHT, width), axis=1,
+                            bitorder='little')
+
+    numpy.frombuffer(output, numpy.uint8)[:] = packed.reshape(-1)
+
+
+def _pack_bytes(pixels: memoryview, pitch: int, width: int, output,
+                first_page: int, last_page: int):
+    """Pack pages in range using pure Python. See :func:`pack_surface`.
+
+    Each row is translated to its page bit, then the eight rows of a
+    page are merged as big integers. Bits never overlap, so no carry
+    can corrupt neighbouring columns.
+    """
+    for page in range(first_page, last_page + 1):
+        page_value = 0
+        row_start = page * PAGE_HEIGHT * pitch
+        for table in _ROW_BIT_TABLES:
+            page_value |= int.from_bytes(
+                pixels[row_start:row_start + width].tobytes().translate(table),
+                'big')
+            row_start += pitch
+
+        output_start = (page - first_page) * width
+        output[output_start:output_start + width] = page_value.to_bytes(
+            width, 'big')
+
+
+def pack_surface(surface: graphics.LP_SDL_Surface, buffer, offset: int = 0,
+                 first_page: int = 0, last_page: int | None = None,
+                 use_numpy: bool | None = None):
+    """Pack a one byte per pixel surface in SSD1306 page layout.
+
+    The packed pages are written into ``buffer`` (any writable object
+    supporting the buffer protocol, e.g. a driver's ``buffer``) starting
+    from ``offset``. Page ``first_page`` is always written at
+    ``offset``, so that partial updates (``first_page``, ``last_page``)
+    can target either a full framebuffer (adjusting ``offset``) or
+    a smaller scratch buffer.
+
+    ``use_numpy`` forces a specific implementation. By default numpy
+    is used if installed.
+    """
+    contents = surface.contents
+    width = contents.w
+    if last_page is None:
+        last_page = contents.h // PAGE_HEIGHT - 1
+
+    if use_numpy is None:
+        use_numpy = numpy_available()
+    elif use_numpy:
+        numpy_available()           # Make sure it is imported
+
+    output = memoryview(buffer).cast('B')[
+        offset:offset + (last_page - first_page + 1) * width]
+    pack = _pack_numpy if use_numpy else _pack_bytes
+    pack(surface_view(surface), contents.pitch, width, output, first_page,
+         last_page)
+
+
+def fill_display(display, surface: graphics.LP_SDL_Surface,
+                 first_page: int = 0, last_page: int | None = None,
+                 use_numpy: bool | None = None):
+    """Pack the given surface straight into the display's buffer.
+
+    Only the pages in the given range are updated, see
+    :func:`pack_surface`.
+    """
+    pack_surface(surface, display.buffer,
+                 buffer_offset(display) + first_page * display.width,
+                 first_page, last_page, use_numpy)
+
+
+class PartialFlusher:
+    """Send to an SSD1306 only the framebuffer windows that changed.
+
+    The last frame sent is kept in memory. On :meth:`flush`, the
+    display's buffer is compared with it page by page, and for each
+    changed page only the range of changed columns is sent, using
+    column/page address commands (horizontal addressing mode). Windows
+    on adjacent pages are merged when it is cheaper to do so.
+
+    Adafruit's I2C and SPI drivers are supported, as well as
+    :class:`transport.SSD1306` (on any transport, with batched
+    commands). Drivers in page addressing mode always fall back to a
+    full ``show()``.
+
+    Sent bytes are tracked in :attr:`last_bytes_sent` (for the last
+    flush) and :attr:`total_bytes_sent`, over :attr:`frames` flushes.
+    """
+
+    def __init__(self, display):
+        self.display = display
+        self.offset = buffer_offset(display)
+        self.pages = display.height // PAGE_HEIGHT
+        self.column_offset = (128 - display.width) // 2
+
+        self._last_frame: bytes | None = None
+
+        self.last_bytes_sent = 0
+        self.total_bytes_sent = 0
+        self.frames = 0
+
+        # Bytes on the wire for the six address commands of a window,
+        # and for the control overhead of a data transaction
+        self._commands_cost = 6
+        self._data_overhead = 0
+        if hasattr(display, 'transport'):
+            # Commands are batched in a single transaction
+            self._commands_cost = 6 + display.transport.command_overhead
+            self._data_overhead = display.transport.data_overhead
+        elif hasattr(display, 'i2c_device'):
+            self._commands_cost = 12
+            self._data_overhead = 1
+
+    def log_stats(self):
+        """Log flushed frames and sent bytes."""
+        logger.info('%s: %d frames flushed, %d bytes sent (%.1f per frame)',
+                    type(self).__name__, self.frames, self.total_bytes_sent,
+                    self.total_bytes_sent / max(self.frames, 1))
+
+    @property
+    def full_frame_cost(self) -> int:
+        """Bytes sent by a full ``show()``."""
+        return (self._commands_cost + self._data_overhead
+                + self.pages * self.display.width)
+
+    @property
+    def window_cost(self) -> int:
+        """Fixed bytes needed to send a window (commands, overhead)."""
+        return self._commands_cost + self._data_overhead
+
+    def invalidate(self):
+        """Forget the last frame, forcing a full flush next time."""
+        self._last_frame = None
+
+    def dirty_windows(self, frame) -> list[tuple[int, int, int, int]]:
+        """Compute the windows that differ from the last sent frame.
+
+        Windows are returned in the form ``(first_page, last_page,
+        first_column, last_column)``, bounds included.
+        """
+        width = self.display.width
+        windows = []
+
+        for page in range(self.pages):
+            start = page * width
+            new_page = frame[start:start + width]
+            old_page = self._last_frame[start:start + width]
+            if new_page == old_page:
+                continue
+
+            # Differing bits, first column in the most significant byte
+            diff = (int.from_bytes(new_page, 'big')
+                    ^ int.from_bytes(old_page, 'big'))
+            first_column = width - 1 - (diff.bit_length() - 1) // 8
+            last_column = width - 1 - ((diff & -diff).bit_length() - 1) // 8
+
+            if windows and windows[-1][1] == page - 1:
+                first_page, _, window_first, window_last = windows[-1]
+                merged_first = min(first_column, window_first)
+                merged_last = max(last_column, window_last)
+
+                merged_size = ((page - first_page + 1)
+                               * (merged_last - merged_first + 1))
+                separate_size = ((page - first_page)
+                                 * (window_last - window_first + 1)
+                                 + last_column - first_column + 1
+                                 + self.window_cost)
+                if merged_size <= separate_size:
+                    windows[-1] = (first_page, page, merged_first,
+                                   merged_last)
+                    continue
+
+            windows.append((page, page, first_column, last_column))
+
+        return windows
+
+    def _write_data(self, data):
+        """Send raw framebuffer data, using the driver's bus."""
+        display = self.display
+
+        if hasattr(display, 'transport'):
+            display.write_data(data)
+        elif hasattr(display, 'i2c_device'):
+            with display.i2c_device:
+                display.i2c_device.write(b'\x40' + data)
+        else:
+            display.dc_pin.value = 1
+            with display.spi_device as spi:
+                spi.write(data)
+
+    def _write_window(self, frame, first_page: int, last_page: int,
+                      first_column: int, last_column: int):
+        """Send a rectangular window of the given frame."""
+        display = self.display
+        width = display.width
+
+        commands = (SET_COL_ADDR, first_column + self.column_offset,
+                    last_column + self.column_offset, SET_PAGE_ADDR,
+                    first_page, last_page)
+        if hasattr(display, 'write_cmds'):
+            display.write_cmds(bytes(commands))
+        else:
+            for command in commands:
+                display.write_cmd(command)
+
+        self._write_data(b''.join(
+            frame[page * width + first_column:page * width + last_column + 1]
+            for page in range(first_page, last_page + 1)))
+
+    def flush(self) -> int:
+        """Send changes to the display, return the number of bytes sent."""
+        frame = bytes(self.display.buffer[self.offset:])
+
+        if self._last_frame is None or self.display.page_addressing:
+            self.display.show()
+            bytes_sent = self.full_frame_cost
+        else:
+            windows = self.dirty_windows(frame)
+            bytes_sent = sum(
+                (last_page - first_page + 1) * (last_column - first_column + 1)
+                + self.window_cost
+                for first_page, last_page, first_column, last_column
+                in windows)
+
+            if bytes_sent >= self.full_frame_cost:
+                self.display.show()
+                bytes_sent = self.full_frame_cost
+            else:
+                for window in windows:
+                    self._write_window(frame, *window)
+
+        self._last_frame = frame
+
+        self.last_bytes_sent = bytes_sent
+        self.total_bytes_sent += bytes_sent
+        self.frames += 1
+
+        return bytes_sent
+
+
+class DisplayWriter:
+    """Send frames to an SSD1306 from a dedicated thread.
+
+    Frames are handed over through a single slot (see :meth:`submit`):
+    a frame still waiting when a new one is submitted is dropped, the
+    latest frame wins. Hence, the caller never waits on the bus, and
+    the display shows the latest frame as soon as the bus allows.
+    Only the writer thread touches the display, through a
+    :class:`PartialFlusher`, until :meth:`close`.
+
+    Dropped frames, transfer times and the achieved refresh rate are
+    measured, see :meth:`log_stats`.
+    """
+
+    def __init__(self, display):
+        self.display = display
+        self.offset = buffer_offset(display)
+        self.flusher = PartialFlusher(display)
+
+        self._frame: bytes | None = None
+        self._closed = False
+        self._condition = threading.Condition()
+
+        self.submitted = 0
+        self.drops = 0
+        self.transfers = 0
+        self.transfer_time = 0.
+        self.max_transfer_time = 0.
+        self._start_time = time.perf_counter()
+
+        self._thread = threading.Thread(target=self._run,
+                                        name='DisplayWriter', daemon=True)
+        self._thread.start()
+
+    def submit(self, frame: bytes):
+        """Hand a full frame (in page layout) to the writer thread.
+
+        Never blocks on the bus. Frames submitted after :meth:`close`
+        are ignored.
+        """
+        with self._condition:
+            if self._closed:
+                return
+            if self._frame is not None:
+                self.drops += 1
+            self._frame = frame
+            self.submitted += 1
+            self._condition.notify()
+
+    def _run(self):
+        """Writer thread: send frames until closed."""
+        while True:
+            with self._condition:
+                while self._frame is None and not self._closed:
+                    self._condition.wait()
+                if self._frame is None:
+                    return
+                frame, self._frame = self._frame, None
+
+            start = time.perf_counter()
+            try:
+                self.display.buffer[self.offset:] = frame
+                self.flusher.flush()
+            except Exception:
+                logger.exception('Display transfer failed')
+                self.flusher.invalidate()
+                continue
+
+            transfer_time = time.perf_counter() - start
+            self.transfers += 1
+            self.transfer_time += transfer_time
+            self.max_transfer_time = max(self.max_transfer_time,
+                                         transfer_time)
+
+    @property
+    def refresh_rate(self) -> float:
+        """Average transfers per second, since creation."""
+        return self.transfers / max(time.perf_counter() - self._start_time,
+                                    1e-9)
+
+    def close(self, timeout: float | None = None):
+        """Send the pending frame, if any, and stop the writer thread.
+
+        The display can be safely used by the caller afterwards.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def log_stats(self):
+        """Log dropped frames, transfer times and refresh rate."""
+        logger.info('%s: %d frames submitted, %d dropped, %d sent '
+                    '(%.2fms mean, %.2fms max transfer), %.1f frames/s',
+                    type(self).__name__, self.submitted, self.drops,
+                    self.transfers,
+                    self.transfer_time / max(self.transfers, 1) * 1e3,
+                    self.max_transfer_time * 1e3, self.refresh_rate)
+        self.flusher.log_stats()
+
+
+@desper.event_handler('render', 'on_quit')
+class RenderHandler(graphics.ScreenController):
+    """Actually render screen to an SSD1306 display, on ``render`` event.
+
+    Only the pages covered by the region updated during the last screen
+    composition are packed (see :meth:`pack`), and only the changed
+    portions of the display are sent (see :meth:`flush`). Any object
+    mimicking adafruit's drivers can be used as display. Sent bytes
+    are logged on quit.
+    """
+
+    def __init__(self, display):
+        self.display = display
+        self.flusher = PartialFlusher(display)
+
+    def pack(self, surface: graphics.LP_SDL_Surface, rect: graphics.Rect):
+        """Pack the pages covered by the given rectangle."""
+        _, y, _, height = rect
+        fill_display(self.display, surface, first_page=y // PAGE_HEIGHT,
+                     last_page=(y + height - 1) // PAGE_HEIGHT)
+
+    def flush(self) -> int:
+        """Send changes to the display, return the number of bytes sent."""
+        return self.flusher.flush()
+
+    def render(self):
+        screen_surface = self.screen.surface
+        updated_rect = self.screen.dirty_region.updated_rect
+        if updated_rect is None:
+            return
+
+        self.pack(screen_surface, updated_rect)
+        self.flush()
+
+    def on_quit(self):
+        """Log flushed frames and sent bytes."""
+        self.flusher.log_stats()
@@ -0,0 +1,66 @@
+"""Startup timing, stage by stage.
+
+Imported first by the package, so that :data:`START` is the moment
+``corsoab`` starts being imported. Stages are then closed through
+:func:`mark`, from imports to the first rendered frame, and reported
+on request (see ``--startup-profile``). Marking is a clock read, so it
+is always done.
+
+Time spent by the interpreter before importing the package is not
+accounted for, use ``python -X importtime`` for a per module
+breakdown of imports.
+"""
+import time
+
+import desper
+
+from .log import logger
+
+START = time.perf_counter()
+
+_stages: list[tuple[str, float]] = []
+_last_mark = START
+
+
+def mark(stage: str):
+    """Close a stage: record the time elapsed since the previous one."""
+    global _last_mark
+    now = time.perf_counter()
+    _stages.append((stage, now - _last_mark))
+    _last_mark = now
+
+
+def stages() -> list[tuple[str, float]]:
+    """Get the recorded stages, as ``(name, seconds)`` pairs."""
+    return list(_stages)
+
+
+def log_report():
+    """Log the duration of each recorded stage, and the total."""
+    lines = [f'{stage:<24} {duration * 1e3:>9.1f}'
+             for stage, duration in _stages]
+    logger.info('Startup profile:\n%-24s %9s\n%s\n%-24s %9.1f',
+                'stage', 'ms', '\n'.join(lines), 'total',
+                (_last_mark - START) * 1e3)
+
+
+class StartupReportProcessor(desper.Processor):
+    """Close the last stage at the end of the first frame, and report.
+
+    Meant to be the last processor of the world.
+    """
+    _reported = False
+
+    def process(self, dt):
+        if self._reported:
+            return
+
+        mark('first frame')
+        log_report()
+        self._reported = True
+
+
+def world_transformer(handle: desper.WorldHandle, world: desper.World):
+    """Close the world loading stage, report after the first frame."""
+    mark('world load')
+    world.add_processor(StartupReportProcessor())
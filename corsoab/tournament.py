@@ -0,0 +1,267 @@
+"""Headless AI versus AI tournaments, with no rendering at all.
+
+Games are played straight on the model (no world, no SDL) across a
+process pool. Per game results (moves, winner, think time per move,
+searched nodes) are streamed to a JSONL or CSV file, and can be saved
+as replayable records too (see :mod:`record`). Win rates, think times
+and nodes per second are aggregated for each player spec.
+
+Players alternate sides: in odd games, the second spec moves first.
+Each game is seeded, so that tournaments can be reproduced.
+
+Run with ``python -m corsoab tournament``.
+"""
+import argparse
+import concurrent.futures
+import csv
+import json
+import logging
+import pathlib
+import random
+import statistics
+import time
+from collections.abc import Iterable, Iterator
+
+import corso.model as corso
+
+from . import record
+from . import search
+from .log import logger
+from .players import parse_legacy_player
+
+DEFAULT_GAMES = 100
+CSV_FIELDS = ('game', 'seed', 'player1', 'player2', 'terminal', 'winner',
+              'moves', 'think_times', 'nodes1', 'nodes2', 'elapsed')
+
+
+def parse_spec(spec: str) -> str:
+    """Validate a player spec, for argparse."""
+    try:
+        parse_legacy_player(spec)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+
+    if spec.lower() == 'user':
+        raise argparse.ArgumentTypeError('only AI players are allowed')
+
+    return spec.lower()
+
+
+def _seed_player(player: corso.Player, seed: str):
+    """Give a private, seeded random generator to a player, if it uses one.
+
+    corso's players share a default generator, which would make games
+    depend on each other.
+    """
+    if hasattr(player, 'rng'):
+        player.rng = random.Random(seed)
+
+
+def play_game(game: int, specs: tuple[str, str], seed: int) -> dict:
+    """Play a full game between two player specs, return its record.
+
+    ``specs`` are given in turn order. Think times are in seconds,
+    searched nodes are ``None`` for players that do not count them.
+    """
+    players = [parse_legacy_player(spec) for spec in specs]
+    for index, player in enumerate(players):
+        _seed_player(player, f'{seed}:{index}')
+
+    state = corso.Corso()
+    moves = []
+    think_times = []
+    start = time.perf_counter()
+    while not state.terminal[0]:
+        player = players[state.player_index - 1]
+
+        move_start = time.perf_counter()
+        action = player.select_action(state)
+        think_times.append(time.perf_counter() - move_start)
+
+        moves.append((action.row, action.column))
+        state = state.step(action)
+    elapsed = time.perf_counter() - start
+
+    # Private tables (and pools) would live as long as the worker process
+    for player in players:
+        if isinstance(player, search.CachedMinMaxPlayer):
+            search.drop_table(player.table_name)
+        close = getattr(player, 'close', None)
+        if close is not None:
+            close()
+
+    terminal, winner = state.terminal
+    return {
+        'game': game,
+        'seed': seed,
+        'player1': specs[0],
+        'player2': specs[1],
+        'terminal': terminal.name.lower(),
+        'winner': winner if terminal == corso.Terminal.WON else 0,
+        'moves': moves,
+        'think_times': think_times,
+        'nodes1': getattr(players[0], 'nodes', None),
+        'nodes2': getattr(players[1], 'nodes', None),
+        'elapsed': elapsed,
+    }
+
+
+def _play_game(arguments: tuple[int, tuple[str, str], int]) -> dict:
+    """Unpack arguments for :func:`play_game` (executor map)."""
+    return play_game(*arguments)
+
+
+def _init_worker():
+    """Silence per move logging in worker processes."""
+    logger.setLevel(logging.WARNING)
+
+
+def run(specs: tuple[str, str], games: int, seed: int = 0,
+        jobs: int | None = None) -> Iterator[dict]:
+    """Play a tournament on a process pool, yield game records in order."""
+    schedule = ((game, specs if game % 2 == 0 else specs[::-1],
+                 seed + game) for game in range(games))
+
+    with concurrent.futures.ProcessPoolExecutor(
+            jobs, initializer=_init_worker) as executor:
+        yield from executor.map(_play_game, schedule, chunksize=4)
+
+
+class ResultWriter:
+    """Stream game records to a JSONL or CSV file (by extension)."""
+
+    def __init__(self, path: str | pathlib.Path):
+        self.path = pathlib.Path(path)
+        self.file = open(self.path, 'w', newline='')
+        self._csv = None
+        if self.path.suffix.lower() == '.csv':
+            self._csv = csv.DictWriter(self.file, CSV_FIELDS)
+            self._csv.writeheader()
+
+    def write(self, record: dict):
+        """Write a game record, flush it to disk."""
+        if self._csv is None:
+            self.file.write(json.dumps(record) + '\n')
+        else:
+            self._csv.writerow(record | {
+                'moves': ' '.join(f'{row}:{column}'
+                                  for row, column in record['moves']),
+                'think_times': ' '.join(f'{think_time:.6f}'
+                                        for think_time in
+                                        record['think_times'])})
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class Standings:
+    """Aggregate game records by player spec."""
+
+    def __init__(self, specs: Iterable[str]):
+        self.stats = {spec: {'wins': 0, 'losses': 0, 'draws': 0,
+                             'think_times': [], 'nodes': None}
+                      for spec in specs}
+        self.games = 0
+        self.moves = 0
+
+    def add(self, record: dict):
+        """Account for a game record."""
+        self.games += 1
+        self.moves += len(record['moves'])
+
+        for index in (1, 2):
+            stats = self.stats[record[f'player{index}']]
+            if record['winner'] == index:
+                stats['wins'] += 1
+            elif record['winner']:
+                stats['losses'] += 1
+            else:
+                stats['draws'] += 1
+
+            # Players alternate, starting from player 1
+            stats['think_times'] += record['think_times'][index - 1::2]
+            nodes = record[f'nodes{index}']
+            if nodes is not None:
+                stats['nodes'] = (stats['nodes'] or 0) + nodes
+
+    def log_summary(self):
+        """Log win rates, think times and nodes per second."""
+        lines = []
+        for spec, stats in self.stats.items():
+            think_times = stats['think_times'] or [0.]
+            total_time = sum(think_times)
+            nodes_per_second = 'n/a'
+            if stats['nodes'] is not None and total_time:
+                nodes_per_second = f'{stats["nodes"] / total_time:.0f}'
+
+            lines.append(
+                f'{spec:<10} {stats["wins"] / self.games * 100:>6.1f}% '
+                f'{stats["draws"] / self.games * 100:>6.1f}% '
+                f'{stats["losses"] / self.games * 100:>6.1f}% '
+                f'{statistics.mean(think_times) * 1e3:>9.2f} '
+                f'{max(think_times) * 1e3:>9.2f} {nodes_per_second:>9}')
+
+        logger.info('%d games, %d moves:\n%-10s %7s %7s %7s %9s %9s %9s\n%s',
+                    self.games, self.moves, 'player', 'wins', 'draws',
+                    'losses', 'mean ms', 'max ms', 'nodes/s',
+                    '\n'.join(lines))
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        'python -m corsoab tournament',
+        description='Play AI versus AI games headlessly, on a process pool, '
+                    'and report win rates and search speed.')
+    parser.add_argument('players', nargs=2, type=parse_spec,
+                        metavar='PLAYER_TYPE',
+                        help='Two AI player types, e.g. "mm2", "tt4", '
+                             '"random". They alternate sides.')
+    parser.add_argument('-g', '--games', type=int, default=DEFAULT_GAMES,
+                        help=f'Number of games. Defaults to {DEFAULT_GAMES}.')
+    parser.add_argument('-s', '--seed', type=int, default=0,
+                        help='Seed of the first game.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes. Defaults to the '
+                             'number of CPUs.')
+    parser.add_argument('-o', '--output', type=pathlib.Path, default=None,
+                        help='Stream game records to this file: CSV if its '
+                             'extension is ".csv", JSON lines otherwise.')
+    parser.add_argument('-r', '--record-dir', type=pathlib.Path,
+                        default=None,
+                        help='Also save each game in this directory, as a '
+                             'binary record that can be replayed (see '
+                             '"python -m corsoab --replay").')
+    args = parser.parse_args(argv)
+
+    if args.players[0] == args.players[1]:
+        parser.error('player types must differ, to tell results apart')
+
+    logger.setLevel(logging.INFO)
+    writer = ResultWriter(args.output) if args.output is not None else None
+    standings = Standings(args.players)
+    if args.record_dir is not None:
+        args.record_dir.mkdir(parents=True, exist_ok=True)
+    starting_state = corso.Corso()
+
+    start = time.perf_counter()
+    try:
+        for result in run(tuple(args.players), args.games, args.seed,
+                          args.jobs):
+            standings.add(result)
+            if writer is not None:
+                writer.write(result)
+            if args.record_dir is not None:
+                record.write_record(
+                    args.record_dir / f'game{result["game"]:05d}'
+                    f'{record.DEFAULT_RECORD_SUFFIX}',
+                    record.GameRecord(
+                        starting_state.width, starting_state.height,
+                        (result['player1'], result['player2']),
+                        result['moves']))
+    finally:
+        if writer is not None:
+            writer.close()
+
+    logger.info('Tournament played in %.1fs', time.perf_counter() - start)
+    standings.log_summary()
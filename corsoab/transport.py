@@ -0,0 +1,311 @@
+"""Display transports: how bytes reach an SSD1306.
+
+:class:`SSD1306` is a minimal driver, with the same interface as
+adafruit's ones (``buffer``, ``show``, ``write_cmd``, ``poweroff``),
+that sends commands and data through a :class:`Transport`:
+
+* :class:`I2CTransport`, on an I2C bus with a configurable clock.
+* :class:`SPITransport`, for the SPI variant of the panel.
+* :class:`MemoryTransport`, recording the command stream in memory
+  and optionally to a file, to test and benchmark off-device.
+
+Commands are batched in a single transaction, data is written in
+chunks of at most :attr:`Transport.chunk_size` bytes. Displays are
+usually created from a spec through :func:`open_display`, e.g.
+``"i2c:1000000"``. Hardware modules are only imported when needed.
+"""
+import abc
+import pathlib
+import struct
+import time
+
+from . import graphics
+from .log import logger
+from .ssd1306 import PAGE_HEIGHT, SET_COL_ADDR, SET_PAGE_ADDR
+
+I2C_ADDRESS = 0x3C
+DEFAULT_I2C_FREQUENCY = 400_000
+DEFAULT_SPI_BAUDRATE = 8_000_000
+DEFAULT_CHUNK_SIZE = 1024
+# Pins of the SPI panel, as wired in adafruit's examples
+SPI_DC_PIN = 'D6'
+SPI_CS_PIN = 'D5'
+SPI_RESET_PIN = 'D4'
+
+RECORD_STRUCT = '<cH'
+"""Kind of transaction (``b'C'`` or ``b'D'``) and payload length."""
+
+# Commands (see adafruit_ssd1306)
+SET_CONTRAST = 0x81
+SET_ENTIRE_ON = 0xA4
+SET_NORM_INV = 0xA6
+SET_DISP = 0xAE
+SET_MEM_ADDR = 0x20
+SET_DISP_START_LINE = 0x40
+SET_SEG_REMAP = 0xA0
+SET_MUX_RATIO = 0xA8
+SET_COM_OUT_DIR = 0xC0
+SET_DISP_OFFSET = 0xD3
+SET_COM_PIN_CFG = 0xDA
+SET_DISP_CLK_DIV = 0xD5
+SET_PRECHARGE = 0xD9
+SET_VCOM_DESEL = 0xDB
+SET_CHARGE_PUMP = 0x8D
+
+
+class Transport(abc.ABC):
+    """Bus carrying commands and data to the display.
+
+    :attr:`command_overhead` and :attr:`data_overhead` are the bytes
+    added on the bus to each command and data transaction (e.g. I2C
+    control bytes), for cost estimations (see
+    :class:`ssd1306.PartialFlusher`).
+    """
+    command_overhead = 0
+    data_overhead = 0
+
+    def __init__(self, chunk_size: int | None = DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    @abc.abstractmethod
+    def _write(self, data: bytes, is_data: bool):
+        """Send a single transaction."""
+
+    def write_commands(self, commands: bytes):
+        """Send a batch of commands, in a single transaction."""
+        self._write(commands, False)
+
+    def write_data(self, data: bytes):
+        """Send display data, chunked."""
+        if self.chunk_size is None:
+            self._write(data, True)
+            return
+
+        for start in range(0, len(data), self.chunk_size):
+            self._write(data[start:start + self.chunk_size], True)
+
+    def reset(self):
+        """Hardware reset the display, if supported."""
+
+    def close(self):
+        """Release the bus."""
+
+
+class I2CTransport(Transport):
+    """I2C transport, commands and data prefixed by a control byte."""
+    command_overhead = 1
+    data_overhead = 1
+
+    def __init__(self, i2c, address: int = I2C_ADDRESS,
+                 chunk_size: int | None = DEFAULT_CHUNK_SIZE):
+        from adafruit_bus_device.i2c_device import I2CDevice
+
+        super().__init__(chunk_size)
+        self.i2c = i2c
+        self.device = I2CDevice(i2c, address)
+
+    def _write(self, data: bytes, is_data: bool):
+        with self.device:
+            self.device.write((b'\x40' if is_data else b'\x00') + data)
+
+    def close(self):
+        self.i2c.deinit()
+
+
+class SPITransport(Transport):
+    """SPI transport, commands and data told apart by the D/C pin."""
+
+    def __init__(self, spi, dc_pin, cs_pin, reset_pin=None,
+                 baudrate: int = DEFAULT_SPI_BAUDRATE,
+                 chunk_size: int | None = DEFAULT_CHUNK_SIZE):
+        from adafruit_bus_device.spi_device import SPIDevice
+
+        super().__init__(chunk_size)
+        self.spi = spi
+        self.dc_pin = dc_pin
+        self.reset_pin = reset_pin
+        self.dc_pin.switch_to_output(value=0)
+        if reset_pin is not None:
+            reset_pin.switch_to_output(value=1)
+        self.device = SPIDevice(spi, cs_pin, baudrate=baudrate,
+                                polarity=0, phase=0)
+
+    def _write(self, data: bytes, is_data: bool):
+        self.dc_pin.value = is_data
+        with self.device as spi:
+            spi.write(data)
+
+    def reset(self):
+        if self.reset_pin is None:
+            return
+
+        self.reset_pin.value = 1
+        time.sleep(0.001)
+        self.reset_pin.value = 0
+        time.sleep(0.01)
+        self.reset_pin.value = 1
+
+    def close(self):
+        self.spi.deinit()
+
+
+class MemoryTransport(Transport):
+    """Record transactions, in memory and optionally to a file.
+
+    Transactions are kept in :attr:`stream`, as ``(is_data, bytes)``
+    pairs. If ``path`` is given, they are also appended to it, each as
+    a :data:`RECORD_STRUCT` header followed by the payload. Bus
+    traffic is accounted as on I2C, see :attr:`bytes_sent`.
+    """
+    command_overhead = 1
+    data_overhead = 1
+
+    def __init__(self, path: str | pathlib.Path | None = None,
+                 chunk_size: int | None = DEFAULT_CHUNK_SIZE):
+        super().__init__(chunk_size)
+        self.stream: list[tuple[bool, bytes]] = []
+        self.bytes_sent = 0
+        self.file = None
+        if path is not None:
+            self.file = open(path, 'wb', buffering=0)
+
+    def _write(self, data: bytes, is_data: bool):
+        data = bytes(data)
+        self.stream.append((is_data, data))
+        self.bytes_sent += len(data) + (self.data_overhead if is_data
+                                        else self.command_overhead)
+        if self.file is not None:
+            self.file.write(struct.pack(RECORD_STRUCT,
+                                        b'D' if is_data else b'C',
+                                        len(data)) + data)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class SSD1306:
+    """SSD1306 driver on any :class:`Transport`.
+
+    Mimics adafruit's drivers, in horizontal addressing mode. Unlike
+    them, :attr:`buffer` holds the framebuffer only (no control byte)
+    and commands can be sent in batches (see :meth:`write_cmds`).
+    """
+    page_addressing = False
+
+    def __init__(self, transport: Transport,
+                 width: int = graphics.BONNET_WIDTH,
+                 height: int = graphics.BONNET_HEIGHT,
+                 external_vcc: bool = False):
+        self.transport = transport
+        self.width = width
+        self.height = height
+        self.pages = height // PAGE_HEIGHT
+        self.column_offset = (128 - width) // 2
+        self.external_vcc = external_vcc
+        self.buffer = bytearray(self.pages * width)
+
+        self.transport.reset()
+        self.init_display()
+
+    def init_display(self):
+        """Send the initialization sequence (see adafruit_ssd1306)."""
+        self.write_cmds(bytes((
+            SET_DISP,
+            SET_MEM_ADDR, 0x00,
+            SET_DISP_START_LINE,
+            SET_SEG_REMAP | 0x01,
+            SET_MUX_RATIO, self.height - 1,
+            SET_COM_OUT_DIR | 0x08,
+            SET_DISP_OFFSET, 0x00,
+            SET_COM_PIN_CFG, 0x02 if self.width > 2 * self.height else 0x12,
+            SET_DISP_CLK_DIV, 0x80,
+            SET_PRECHARGE, 0x22 if self.external_vcc else 0xF1,
+            SET_VCOM_DESEL, 0x30,
+            SET_CONTRAST, 0xFF,
+            SET_ENTIRE_ON,
+            SET_NORM_INV,
+            SET_CHARGE_PUMP, 0x10 if self.external_vcc else 0x14,
+            SET_DISP | 0x01)))
+        self.buffer[:] = bytes(len(self.buffer))
+        self.show()
+
+    def write_cmd(self, command: int):
+        self.transport.write_commands(bytes((command,)))
+
+    def write_cmds(self, commands: bytes):
+        """Send a batch of commands, in a single transaction."""
+        self.transport.write_commands(commands)
+
+    def write_data(self, data: bytes):
+        self.transport.write_data(data)
+
+    def show(self):
+        """Send the whole framebuffer."""
+        self.write_cmds(bytes((
+            SET_COL_ADDR, self.column_offset,
+            self.column_offset + self.width - 1,
+            SET_PAGE_ADDR, 0, self.pages - 1)))
+        self.write_data(self.buffer)
+
+    def poweroff(self):
+        self.write_cmd(SET_DISP)
+
+    def poweron(self):
+        self.write_cmd(SET_DISP | 0x01)
+
+    def close(self):
+        """Release the transport."""
+        self.transport.close()
+
+
+def parse_display_spec(spec: str) -> tuple[str, str]:
+    """Split a ``BUS[:PARAMETER]`` display spec, see :func:`open_display`.
+
+    Raise ``ValueError`` on invalid specs.
+    """
+    bus, _, parameter = spec.partition(':')
+    bus = bus.lower()
+
+    if bus not in ('i2c', 'spi', 'memory'):
+        raise ValueError(f'unknown display bus "{bus}", expected "i2c", '
+                         '"spi" or "memory"')
+    if bus != 'memory' and parameter and not parameter.isdigit():
+        raise ValueError(f'invalid {bus} clock "{parameter}"')
+
+    return bus, parameter
+
+
+def open_display(spec: str) -> SSD1306:
+    """Create a display from a ``BUS[:PARAMETER]`` spec.
+
+    Supported buses are ``i2c[:FREQUENCY]`` (Hz, defaults to
+    :data:`DEFAULT_I2C_FREQUENCY`), ``spi[:BAUDRATE]`` (Hz, defaults to
+    :data:`DEFAULT_SPI_BAUDRATE`, pins as in adafruit's examples) and
+    ``memory[:PATH]`` (see :class:`MemoryTransport`). Raise
+    ``ValueError`` on invalid specs.
+    """
+    bus, parameter = parse_display_spec(spec)
+    if bus == 'memory':
+        return SSD1306(MemoryTransport(parameter or None))
+
+    import board
+    import busio
+
+    if bus == 'i2c':
+        clock = int(parameter or DEFAULT_I2C_FREQUENCY)
+        transport = I2CTransport(busio.I2C(board.SCL, board.SDA,
+                                           frequency=clock))
+    else:
+        import digitalio
+
+        clock = int(parameter or DEFAULT_SPI_BAUDRATE)
+        transport = SPITransport(
+            busio.SPI(board.SCK, MOSI=board.MOSI),
+            digitalio.DigitalInOut(getattr(board, SPI_DC_PIN)),
+            digitalio.DigitalInOut(getattr(board, SPI_CS_PIN)),
+            digitalio.DigitalInOut(getattr(board, SPI_RESET_PIN)),
+            baudrate=clock)
+
+    logger.info('Display on %s at %d Hz', bus.upper(), clock)
+    return SSD1306(transport)
@@ -0,0 +1,215 @@
+"""Execution backends for blocking (CPU bound) AI logic.
+
+Executors are shared and reused across moves (and games) in the same
+process. Two backends are available: a thread pool, cheap but bound to
+the GIL, and a process pool, which keeps the render loop responsive
+and can take advantage of multiple cores. Anything submitted to the
+process backend must be picklable.
+
+Completion can be handled on the main thread: callbacks given to
+:func:`submit` are queued when their task is done, from whatever
+thread completes it, and run by :func:`run_callbacks` (e.g. once per
+frame), with no polling of the tasks.
+
+Running tasks cannot be interrupted, but they can be asked to stop
+(see :func:`cancel`): long tasks shall check
+:func:`cancellation_requested` periodically (e.g. searches, see
+:class:`search.Search`). Flags are kept in shared memory, so that
+this works on both backends.
+"""
+import concurrent.futures
+import enum
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+from collections.abc import Callable
+
+from .log import logger
+
+
+class Backend(enum.Enum):
+    """Available executor backends."""
+    THREAD = 'thread'
+    PROCESS = 'process'
+
+
+MAX_WORKERS = os.cpu_count() or 1
+"""Number of workers of each executor."""
+CANCEL_SLOTS = 256
+"""Tasks that can be asked to stop at the same time (see :func:`cancel`).
+
+Slots are reused in turn: a task is expected to be done long before
+its slot is reused.
+"""
+
+_executors: dict[Backend, concurrent.futures.Executor] = {}
+_cancel_flags = None
+_next_slot = itertools.count()
+_current_task = threading.local()
+_pending: set[concurrent.futures.Future] = set()
+_completed: queue.SimpleQueue = queue.SimpleQueue()
+
+
+def _ready() -> bool:
+    """Dummy task, used to warm up workers."""
+    return True
+
+
+def _get_cancel_flags():
+    """Retrieve the shared cancellation flags, create them if needed."""
+    global _cancel_flags
+    if _cancel_flags is None:
+        _cancel_flags = multiprocessing.RawArray('b', CANCEL_SLOTS)
+    return _cancel_flags
+
+
+def _init_process(cancel_flags):
+    """Keep a reference to the cancellation flags, in worker processes."""
+    global _cancel_flags
+    _cancel_flags = cancel_flags
+
+
+def _run_task(slot: int, function, *args):
+    """Run a task, making its cancellation flag available to it."""
+    _current_task.slot = slot
+    try:
+        return function(*args)
+    finally:
+        _current_task.slot = None
+
+
+def cancellation_requested() -> bool:
+    """Get whether the running task was asked to stop.
+
+    Always false outside of tasks submitted through :func:`submit`.
+    """
+    slot = getattr(_current_task, 'slot', None)
+    return slot is not None and bool(_cancel_flags[slot])
+
+
+def get_executor(backend: Backend) -> concurrent.futures.Executor:
+    """Retrieve the shared executor for a backend, create it if needed."""
+    backend = Backend(backend)
+
+    if backend not in _executors:
+        if backend is Backend.PROCESS:
+            _executors[backend] = concurrent.futures.ProcessPoolExecutor(
+                MAX_WORKERS, initializer=_init_process,
+                initargs=(_get_cancel_flags(),))
+        else:
+            _executors[backend] = concurrent.futures.ThreadPoolExecutor(
+                MAX_WORKERS)
+
+    return _executors[backend]
+
+
+def submit(backend: Backend, function, *args,
+           callback: Callable[[concurrent.futures.Future], None]
+           | None = None) -> concurrent.futures.Future:
+    """Submit a task to the shared executor of a backend.
+
+    Tasks submitted this way are tracked until completion, see
+    :func:`busy`. If given, ``callback`` is called with the future by
+    :func:`run_callbacks`, once the task is done (or cancelled). The
+    task counts as pending until then. Broken executors (see
+    :class:`concurrent.futures.BrokenExecutor`) are replaced.
+    """
+    slot = next(_next_slot) % CANCEL_SLOTS
+    _get_cancel_flags()[slot] = 0
+    try:
+        future = get_executor(backend).submit(_run_task, slot, function,
+                                              *args)
+    except concurrent.futures.BrokenExecutor:
+        # e.g. a worker process died: start a new pool
+        logger.warning('Restarting broken %s executor',
+                       Backend(backend).value)
+        _executors.pop(Backend(backend)).shutdown(wait=False)
+        future = get_executor(backend).submit(_run_task, slot, function,
+                                              *args)
+    future.cancel_slot = slot
+    _pending.add(future)
+    if callback is None:
+        future.add_done_callback(_pending.discard)
+    else:
+        future.add_done_callback(
+            lambda future: _completed.put((callback, future)))
+    return future
+
+
+def cancel(future: concurrent.futures.Future) -> bool:
+    """Cancel a task submitted through :func:`submit`.
+
+    If it is already running, ask it to stop instead (see
+    :func:`cancellation_requested`). Return whether it was cancelled
+    before running.
+    """
+    if future.cancel():
+        return True
+
+    if not future.done():
+        _cancel_flags[future.cancel_slot] = 1
+    return False
+
+
+def run_callbacks() -> int:
+    """Run the callbacks of all completed tasks, in completion order.
+
+    Meant to be called from the main thread. Return the number of
+    callbacks run.
+    """
+    count = 0
+    while True:
+        try:
+            callback, future = _completed.get_nowait()
+        except queue.Empty:
+            return count
+
+        _pending.discard(future)
+        callback(future)
+        count += 1
+
+
+def busy() -> bool:
+    """Get whether any task submitted through :func:`submit` is pending.
+
+    Tasks whose callback did not run yet are pending.
+    """
+    return bool(_pending)
+
+
+def warm_up(backend: Backend):
+    """Start all workers of a backend, so that no spawning happens later.
+
+    Blocks until all workers are up and running.
+    """
+    executor = get_executor(backend)
+    concurrent.futures.wait([executor.submit(_ready)
+                             for _ in range(MAX_WORKERS)])
+    logger.debug('Warmed up %d %s workers', MAX_WORKERS,
+                 Backend(backend).value)
+
+
+def shutdown():
+    """Shut down all executors, cancelling pending and running tasks.
+
+    Pending tasks are cancelled. Worker processes are terminated,
+    while threads cannot be interrupted: running thread tasks will
+    complete in background.
+    """
+    for backend, executor in _executors.items():
+        # Not exposed by the public API (before Python 3.14), and reset
+        # by shutdown
+        processes = tuple((getattr(executor, '_processes', None)
+                           or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        if backend is Backend.PROCESS:
+            for process in processes:
+                process.terminate()
+
+    _executors.clear()
+    _pending.clear()
+    while not _completed.empty():
+        _completed.get_nowait()